@@ -0,0 +1,94 @@
+"""
+Bulk actions of the admin dashboards.
+
+Deleting or (un)publishing N books one save()/delete() at a time runs every
+Book receiver N times. These run the row changes with those receivers
+switched off (LeafyReads.bulk.bulk_operation) and then do each side effect
+once for the batch.
+"""
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from LeafyReads.bulk import bulk_operation
+from LeafyReads.tasks import enqueue
+from LeafyReads.cache import bump_generation, local_cache, COMMUNITY, HOME, LIBRARY, SEARCH
+from books import autocomplete
+from books.models import Book, ReadBy
+from books.rows import POPULAR_SIDEBAR_KEY, recent_reads_key
+from books.tasks import notify_books_published
+from home.models import Notification
+from home.notifications import forget_notifications_many
+from .models import BookLog
+
+
+def _invalidate_book_lists(*extra):
+    bump_generation(LIBRARY, SEARCH, HOME, *extra)
+    local_cache.delete(POPULAR_SIDEBAR_KEY)
+
+
+def bulk_delete_books(book_ids, user=None):
+    """Deletes the books and their dependents. Returns the number of books deleted."""
+    books = list(Book.objects.filter(id__in=book_ids).only("id", "title"))
+    if not books:
+        return 0
+    ids = [book.id for book in books]
+    book_type = ContentType.objects.get_for_model(Book)
+    notifications = Notification.objects.filter(content_type=book_type, object_id__in=ids)
+
+    with transaction.atomic():
+        BookLog.objects.bulk_create([
+            BookLog(user=user, book=book, action="delete", message=f"Book '{book.title}' was deleted.")
+            for book in books
+        ])
+        recipients = set(notifications.values_list("recipient_id", flat=True))
+        readers = set(ReadBy.objects.filter(book_id__in=ids).values_list("user_id", flat=True))
+        with bulk_operation():
+            notifications.delete()
+            # Cascades to content, pages, likes, read-laters and reads in one query per table
+            Book.objects.filter(id__in=ids).delete()
+
+        def side_effects():
+            # Posts about these books lose their book link, so the feed changes too
+            _invalidate_book_lists(COMMUNITY)
+            for book_id in ids:
+                autocomplete.index.remove(book_id)
+            cache.delete_many([recent_reads_key(user_id) for user_id in readers])
+            forget_notifications_many(recipients)
+
+        transaction.on_commit(side_effects)
+    return len(ids)
+
+
+def bulk_set_published(book_ids, published, user=None):
+    """Publishes or unpublishes the books. Returns the number that changed."""
+    books = list(
+        Book.objects.filter(id__in=book_ids)
+        .exclude(is_published=published)
+        .select_related("uploaded_by")
+    )
+    if not books:
+        return 0
+    ids = [book.id for book in books]
+
+    with transaction.atomic():
+        Book.objects.filter(id__in=ids).update(is_published=published, updated_at=timezone.now())
+        BookLog.objects.bulk_create([
+            BookLog(user=user, book=book, action="update", message=f"Book '{book.title}' was updated (is_published).")
+            for book in books
+        ])
+        for book in books:
+            book.is_published = published
+
+        if published:
+            # One task for the whole batch of notifications and e-mails
+            enqueue(notify_books_published, ids)
+
+        def side_effects():
+            _invalidate_book_lists()
+            for book in books:
+                autocomplete.index.patch(book)
+
+        transaction.on_commit(side_effects)
+    return len(ids)
@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from LRAdmin.retention import prune_book_logs
+
+
+class Command(BaseCommand):
+    help = (
+        "Deletes BookLog entries older than BOOK_LOG_RETENTION_DAYS in small batches. "
+        "Celery beat runs it daily (LRAdmin.tasks.prune_book_logs); saves only ever append to the log."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--days", type=int, default=settings.BOOK_LOG_RETENTION_DAYS)
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--pause", type=float, default=0.0, help="Seconds to sleep between batches.")
+
+    def handle(self, *args, **options):
+        deleted = prune_book_logs(options["days"], options["batch_size"], options["pause"])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} book log(s) older than {options['days']} days."))
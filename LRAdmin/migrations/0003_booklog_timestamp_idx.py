@@ -0,0 +1,20 @@
+# Generated by Django 5.2.2 on 2026-10-18 14:00
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LRAdmin', '0002_alter_booklog_book'),
+        ('books', '0023_bookpage_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booklog',
+            index=models.Index(fields=['timestamp'], name='booklog_timestamp_idx'),
+        ),
+    ]
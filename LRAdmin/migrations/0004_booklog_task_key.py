@@ -0,0 +1,18 @@
+# Generated by Django 5.2.2 on 2026-10-18 15:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('LRAdmin', '0003_booklog_timestamp_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booklog',
+            name='task_key',
+            field=models.CharField(blank=True, editable=False, max_length=100, null=True, unique=True),
+        ),
+    ]
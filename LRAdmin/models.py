@@ -16,9 +16,15 @@ class BookLog(models.Model):
     action = models.CharField(max_length=50, choices=ACTION_CHOICES)
     message = models.TextField(blank=True, null=True)
     timestamp = models.DateTimeField(auto_now_add=True)
+    # Set by write_book_log, so a redelivered task adds no copy (LeafyReads.tasks)
+    task_key = models.CharField(max_length=100, null=True, blank=True, unique=True, editable=False)
 
     class Meta:
         ordering = ["-timestamp"]
+        indexes = [
+            # Newest-first listing and the retention range delete
+            models.Index(fields=["timestamp"], name="booklog_timestamp_idx"),
+        ]
 
     def __str__(self):
         book_title = self.book.title if self.book else "Deleted Book"
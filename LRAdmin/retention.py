@@ -0,0 +1,34 @@
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import BookLog
+
+
+def prune_book_logs(days=None, batch_size=5000, pause=0.0):
+    """
+    Deletes BookLog rows older than `days` (settings.BOOK_LOG_RETENTION_DAYS),
+    oldest first, `batch_size` rows per DELETE so no single statement holds
+    locks or builds WAL for the whole range. Returns the number deleted.
+    """
+    if days is None:
+        days = settings.BOOK_LOG_RETENTION_DAYS
+    cutoff = timezone.now() - timedelta(days=days)
+
+    deleted = 0
+    while True:
+        # Walks booklog_timestamp_idx from the old end
+        ids = list(
+            BookLog.objects.filter(timestamp__lt=cutoff)
+            .order_by("timestamp")
+            .values_list("id", flat=True)[:batch_size]
+        )
+        if not ids:
+            return deleted
+        deleted += BookLog.objects.filter(id__in=ids).delete()[0]
+        if len(ids) < batch_size:
+            return deleted
+        if pause:
+            time.sleep(pause)
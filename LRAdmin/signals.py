@@ -1,46 +1,47 @@
 from django.db.models.signals import post_save, pre_delete
 from django.dispatch import receiver
-from django.utils import timezone  # <--- Import this
-from datetime import timedelta     # <--- Import this
 from books.models import Book, BookContent
-from .models import BookLog
+from LeafyReads.bulk import skip_in_bulk
+from LeafyReads.tracking import when_changed
+from LeafyReads.tasks import enqueue
+from .tasks import write_book_log
 
-# Helper function to delete old logs
-def cleanup_old_logs():
-    thirty_days_ago = timezone.now() - timedelta(days=30)
-    # This deletes all logs older than 30 days in one fast query
-    BookLog.objects.filter(timestamp__lt=thirty_days_ago).delete()
+# Entries are written by the write_book_log task after the change commits.
+# Only appends here; old rows are removed by the prune_book_logs command
+
+# What an editor changes; counters, scores and timestamps are not worth a log entry,
+# and neither are summary edits (copy changes, saved often while writing)
+LOGGED_BOOK_FIELDS = (
+    "title", "slug", "author", "genre", "price", "isbn", "book_language",
+    "cover_front", "pdf_file", "audio_file", "is_draft", "is_published",
+)
+
+def _user_id(instance):
+    user = getattr(instance, "_updated_by", None)
+    return user.pk if user else None
 
 @receiver(post_save, sender=Book)
+@skip_in_bulk
+@when_changed(*LOGGED_BOOK_FIELDS)
 def log_book_save(sender, instance, created, **kwargs):
     action = "create" if created else "update"
-    BookLog.objects.create(
-        user=getattr(instance, "_updated_by", None),
-        book=instance,
-        action=action,
-        message=f"Book '{instance.title}' was {'created' if created else 'updated'}."
-    )
-    cleanup_old_logs()
+    if created:
+        message = f"Book '{instance.title}' was created."
+    else:
+        changed = ", ".join(sorted(instance.changed_fields & set(LOGGED_BOOK_FIELDS)))
+        message = f"Book '{instance.title}' was updated ({changed})."
+    enqueue(write_book_log, instance.pk, _user_id(instance), action, message)
 
 @receiver(pre_delete, sender=Book)
+@skip_in_bulk
 def log_book_delete(sender, instance, **kwargs):
-    BookLog.objects.create(
-        user=getattr(instance, "_updated_by", None),
-        book=instance,
-        action="delete",
-        message=f"Book '{instance.title}' was deleted."
-    )
-    cleanup_old_logs()
+    enqueue(write_book_log, instance.pk, _user_id(instance), "delete", f"Book '{instance.title}' was deleted.")
 
 @receiver(post_save, sender=BookContent)
+@when_changed("content")
 def log_content_update(sender, instance, created, **kwargs):
-    user = getattr(instance, "_updated_by", None) 
-    if not user:
-        user = getattr(instance.book, "_updated_by", None)
-
-    BookLog.objects.create(
-        user=user,
-        book=instance.book,
-        action="content_update",
-        message=f"Book content for '{instance.book.title}' was {'created' if created else 'updated'}."
+    user_id = _user_id(instance) or _user_id(instance.book)
+    enqueue(
+        write_book_log, instance.book_id, user_id, "content_update",
+        f"Book content for '{instance.book.title}' was {'created' if created else 'updated'}."
     )
@@ -0,0 +1,19 @@
+from celery import shared_task
+from LeafyReads.tasks import create_once, task_key
+from books.models import Book
+from .models import BookLog
+from . import retention
+
+
+@shared_task(bind=True)
+def write_book_log(self, book_id, user_id, action, message):
+    # A deleted book keeps its log entries, unlinked (as on_delete=SET_NULL leaves them)
+    if book_id is not None and not Book.objects.filter(pk=book_id).exists():
+        book_id = None
+    create_once(BookLog, task_key(self), book_id=book_id, user_id=user_id, action=action, message=message)
+
+
+@shared_task
+def prune_book_logs():
+    # Periodic (CELERY_BEAT_SCHEDULE), with the BOOK_LOG_RETENTION_DAYS default
+    return retention.prune_book_logs()
@@ -1,2 +1,115 @@
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
 
-# Create your tests here.
+from LeafyReads.bulk import bulk_operation, in_bulk_operation, skip_in_bulk
+from LeafyReads.cache import get_generation, LIBRARY
+from books.models import Book, Like, ReadBy
+from books.rows import recent_reads_key
+from home.models import Notification
+from .bulk import bulk_delete_books, bulk_set_published
+from .models import BookLog
+from .tasks import write_book_log
+
+
+class WriteBookLogTests(TestCase):
+    def test_redelivered_task_writes_one_entry(self):
+        book = Book.objects.create(title="Dune", slug="dune", author="Herbert", cover_front="books/dune")
+        for _ in range(2):
+            write_book_log.apply((book.pk, None, "update", "Book 'Dune' was updated (title)."), task_id="same")
+        self.assertEqual(BookLog.objects.count(), 1)
+
+    def test_deleted_book_leaves_an_unlinked_entry(self):
+        write_book_log.apply((12345, None, "delete", "Book 'Gone' was deleted."))
+        self.assertIsNone(BookLog.objects.get().book_id)
+
+
+class SkipInBulkTests(SimpleTestCase):
+    def test_receivers_are_skipped_only_inside_the_block(self):
+        calls = []
+        receiver = skip_in_bulk(lambda sender, **kwargs: calls.append(sender))
+
+        receiver("outside")
+        with self.assertRaises(ValueError):
+            with bulk_operation():
+                self.assertTrue(in_bulk_operation())
+                receiver("inside")
+                raise ValueError
+        receiver("after")
+
+        self.assertFalse(in_bulk_operation())
+        self.assertEqual(calls, ["outside", "after"])
+
+
+class BulkActionTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_user("admin", password="x", is_staff=True)
+        cls.reader = User.objects.create_user("reader", password="x")
+
+    def books(self, count, **fields):
+        start = Book.objects.count()
+        return [
+            Book.objects.create(
+                title=f"Book {start + i}", slug=f"book-{start + i}", author="Author",
+                cover_front="books/x", uploaded_by=self.admin, **fields
+            )
+            for i in range(count)
+        ]
+
+    def delete_queries(self, count):
+        books = self.books(count, is_published=True)
+        book_type = ContentType.objects.get_for_model(Book)
+        for book in books:
+            Like.objects.create(user=self.reader, book=book)
+            ReadBy.objects.create(user=self.reader, book=book)
+            Notification.objects.create(
+                recipient=self.reader, message="Hi", notification_type="like",
+                content_type=book_type, object_id=book.pk,
+            )
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(bulk_delete_books([book.pk for book in books], user=self.admin), count)
+        return len(queries)
+
+    def test_delete_costs_the_same_queries_for_any_batch_size(self):
+        self.assertEqual(self.delete_queries(2), self.delete_queries(5))
+
+    def test_delete_removes_dependents_and_logs_once_per_book(self):
+        books = self.books(3, is_published=True)
+        ReadBy.objects.create(user=self.reader, book=books[0])
+        Notification.objects.create(
+            recipient=self.reader, message="Hi", notification_type="like",
+            content_type=ContentType.objects.get_for_model(Book), object_id=books[0].pk,
+        )
+        cache.set(recent_reads_key(self.reader.pk), [], 60)
+        generation = get_generation(LIBRARY)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk_delete_books([book.pk for book in books], user=self.admin)
+
+        self.assertFalse(Book.objects.exists())
+        self.assertFalse(ReadBy.objects.exists())
+        self.assertFalse(Notification.objects.exists())
+        self.assertEqual(BookLog.objects.filter(action="delete", user=self.admin).count(), 3)
+        self.assertEqual(get_generation(LIBRARY), generation + 1)
+        self.assertIsNone(cache.get(recent_reads_key(self.reader.pk)))
+
+    def test_publish_changes_only_unpublished_books(self):
+        drafts = self.books(2, is_published=False)
+        live = self.books(1, is_published=True)
+        generation = get_generation(LIBRARY)
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            changed = bulk_set_published([book.pk for book in drafts + live], True, user=self.admin)
+
+        self.assertEqual(changed, 2)
+        self.assertEqual(Book.objects.filter(is_published=True).count(), 3)
+        self.assertEqual(BookLog.objects.count(), 2)
+        # One notification task for the batch, one invalidation
+        self.assertEqual(len(callbacks), 2)
+        self.assertEqual(get_generation(LIBRARY), generation + 1)
+        self.assertEqual(Notification.objects.filter(notification_type="book_published").count(), 2)
+        self.assertEqual(bulk_set_published([book.pk for book in drafts], True), 0)
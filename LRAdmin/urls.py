@@ -10,5 +10,8 @@ urlpatterns = [
     path('user-uploads-books/', views.userUploads, name='userUploads'),
     path('updated-book/<slug:slug>/', views.updateBook, name='updateBook'),
     path('viewBook-Admin/<slug:slug>/', views.viewBookAdmin, name='viewBookAdmin'),
+    path('profiles/', views.profiles, name='profiles'),
+    path('profiles/<str:profile_id>/', views.profileDetail, name='profileDetail'),
+    path('profiles/<str:profile_id>.<str:extension>', views.profileFile, name='profileFile'),
 
 ]
\ No newline at end of file
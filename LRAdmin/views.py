@@ -4,10 +4,14 @@ from django.contrib.auth import login
 from django.contrib.auth.models import User
 from django.contrib import messages
 from .forms import BookContentForm,BookForm
+from books.rows import cached_genres
 from django.db.models import Q
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
 from django.contrib.auth.decorators import user_passes_test
+from django.http import FileResponse, Http404
+from LeafyReads import profiling
+from .bulk import bulk_delete_books, bulk_set_published
 
 # Create your views here.
 LANGUAGE_CHOICES = [
@@ -35,6 +39,17 @@ LANGUAGE_CHOICES = [
 ]
 
 
+def run_bulk_action(request, action, book_ids):
+    """Runs a dashboard bulk action; False if `action` is not one."""
+    if action == "delete":
+        bulk_delete_books(book_ids, user=request.user)
+    elif action in ("publish", "unpublish"):
+        bulk_set_published(book_ids, action == "publish", user=request.user)
+    else:
+        return False
+    return True
+
+
 def loginAdmin(request):
     if request.method == "POST":
         username = request.POST.get("username")
@@ -71,17 +86,13 @@ def dashboard(request):
         action = request.POST.get("action")
         selected_books = request.POST.getlist("selected_books")
         
-        if action == "delete" and selected_books:
-            # Perform delete operation
-            for book in Book.objects.filter(id__in=selected_books):
-                book._updated_by = request.user
-                book.delete()
+        if selected_books and run_bulk_action(request, action, selected_books):
             return redirect("dashboard")
 
     
     # --- 2. Base Query & Dropdown Data ---
     books_list = Book.objects.select_related("genre").filter(uploaded_by=request.user).order_by("-uploaded_at")
-    genres = Genre.objects.all()
+    genres = cached_genres()
     languages = [lang[0] for lang in LANGUAGE_CHOICES]
 
     # --- 3. Extract GET Parameters ---
@@ -192,7 +203,7 @@ def updateBook(request, slug):
 
 @user_passes_test(lambda u: u.is_staff, login_url="login_admin")
 def addBook(request):
-    genres = Genre.objects.all()
+    genres = cached_genres()
 
     if request.method == "POST":
         # Initialize both forms
@@ -250,12 +261,8 @@ def userUploads(request):
         action = request.POST.get("action")
         selected_books = request.POST.getlist("selected_books")
         
-        if action == "delete" and selected_books:
-            # Perform delete operation
-            for book in Book.objects.filter(id__in=selected_books):
-                book._updated_by = request.user
-                book.delete()
-            return redirect("dashboard")
+        if selected_books and run_bulk_action(request, action, selected_books):
+            return redirect("userUploads")
 
 
     
@@ -292,6 +299,46 @@ def userUploads(request):
     }
     return render(request, "userUploadsDashboard.html", context)
 
+@user_passes_test(lambda u: u.is_staff, login_url="login_admin")
+def profiles(request):
+    paginator = Paginator(profiling.list_profiles(), 50)
+    page_obj = paginator.get_page(request.GET.get("page"))
+    return render(request, "profiles.html", {"profiles": page_obj})
+
+
+@user_passes_test(lambda u: u.is_staff, login_url="login_admin")
+def profileDetail(request, profile_id):
+    profile = profiling.load_profile(profile_id)
+    if profile is None:
+        raise Http404("No such profile")
+
+    sort = request.GET.get("sort", "cumulative")
+    if sort not in ("cumulative", "tottime", "ncalls"):
+        sort = "cumulative"
+    dot_path = profiling.profile_file(profile_id, "dot")
+    context = {
+        "profile": profile,
+        "sort": sort,
+        "summary": profiling.summary(profile_id, sort=sort),
+        "dot": dot_path.read_text() if dot_path and not profile.get("svg") else "",
+    }
+    return render(request, "profileDetail.html", context)
+
+
+@user_passes_test(lambda u: u.is_staff, login_url="login_admin")
+def profileFile(request, profile_id, extension):
+    path = profiling.profile_file(profile_id, extension)
+    if path is None:
+        raise Http404("No such file")
+    # SVGs open in the browser, the rest download
+    return FileResponse(
+        open(path, "rb"),
+        as_attachment=extension != "svg",
+        filename=path.name,
+        content_type="image/svg+xml" if extension == "svg" else None,
+    )
+
+
 def storyFormatter(request):
     return render(request, 'storyFormatter.html')
     
\ No newline at end of file
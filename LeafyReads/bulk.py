@@ -0,0 +1,35 @@
+"""
+Bulk operations versus per-row signal receivers.
+
+Receivers decorated with @skip_in_bulk do nothing inside bulk_operation():
+the code running the bulk operation is responsible for doing their work
+once for the whole batch (one cache invalidation, one bulk_create of log
+rows, ...) instead of once per row.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+_in_bulk = ContextVar("in_bulk_operation", default=False)
+
+
+@contextmanager
+def bulk_operation():
+    token = _in_bulk.set(True)
+    try:
+        yield
+    finally:
+        _in_bulk.reset(token)
+
+
+def in_bulk_operation():
+    return _in_bulk.get()
+
+
+def skip_in_bulk(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if _in_bulk.get():
+            return None
+        return func(*args, **kwargs)
+    return wrapper
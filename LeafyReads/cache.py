@@ -0,0 +1,266 @@
+"""
+Shared cache helpers.
+
+Key families (library pages, search results, home lists, community feed) are
+versioned with a generation counter. Readers build keys that include the
+current generation, and invalidation just bumps the counter, so stale keys are
+never scanned or deleted, they simply expire on their own TTL.
+
+Cache aliases (see settings.CACHES):
+    default   volatile page/data cache, `django.core.cache.cache`
+    sessions  durable store for sessions and write-behind buffers
+    hot       tiny, frequently read keys, `hot_cache`
+
+Expensive computations go through `get_or_compute`, which protects them from
+stampedes (see its docstring).
+
+`local_cache` puts a per-process memory tier in front of the hot alias for a
+few tiny keys that are read on almost every request (see TieredCache).
+"""
+import json
+import logging
+import math
+import os
+import random
+import threading
+import time
+
+from django.core.cache import caches
+from django.utils.connection import ConnectionProxy
+from django_redis import get_redis_connection
+
+logger = logging.getLogger(__name__)
+
+DATA_ALIAS = "default"
+SESSIONS_ALIAS = "sessions"
+HOT_ALIAS = "hot"
+
+hot_cache = ConnectionProxy(caches, HOT_ALIAS)
+
+LIBRARY = "library"
+SEARCH = "search"
+HOME = "home"
+COMMUNITY = "community"
+
+
+def _generation_key(family):
+    return f"gen:{family}"
+
+
+def get_generation(family):
+    generation = hot_cache.get(_generation_key(family))
+    if generation is None:
+        hot_cache.add(_generation_key(family), 1, timeout=None)
+        generation = hot_cache.get(_generation_key(family), 1)
+    return generation
+
+
+def versioned_key(family, key):
+    """Builds the cache key for `key` inside the current generation of `family`."""
+    return f"{family}:g{get_generation(family)}:{key}"
+
+
+def bump_generation(*families):
+    """Invalidates every key of the given families in O(1) per family."""
+    for family in families:
+        generation_key = _generation_key(family)
+        # INCR is atomic on Redis; add() makes sure the counter exists first
+        hot_cache.add(generation_key, 1, timeout=None)
+        try:
+            hot_cache.incr(generation_key)
+        except ValueError:
+            # Key vanished between add() and incr() (eviction), start a fresh generation
+            hot_cache.set(generation_key, 2, timeout=None)
+
+
+# --- Stampede protection ---
+
+LOCK_TIMEOUT = 30       # a crashed recompute frees the key after this long
+LOCK_WAIT = 3.0         # how long a cold miss waits for another worker's result
+LOCK_POLL = 0.05
+EARLY_REFRESH_BETA = 1.0
+
+
+def _lock_key(key):
+    return f"lock:{key}"
+
+
+def _stale_key(family, key):
+    return f"{family}:stale:{key}"
+
+
+def _should_refresh(soft_expiry, delta):
+    """XFetch: refresh early with a probability that grows as expiry approaches,
+    scaled by how long the value took to compute."""
+    return time.time() - delta * EARLY_REFRESH_BETA * math.log(random.random() or 1e-12) >= soft_expiry
+
+
+def get_or_compute(key, compute, timeout, family=None, cache=None, stale=True):
+    """
+    Returns the cached value of `key`, calling `compute()` at most once per
+    expiry across all workers.
+
+    * Single flight: only the worker holding `lock:<key>` recomputes; the
+      others serve the stale value, or wait briefly for the fresh one.
+    * Early refresh: values are refreshed a little before `timeout` runs out,
+      so hot keys are normally recomputed before anyone sees a miss.
+    * Stale while revalidate: entries stay readable for another `timeout`
+      after they expire. With `family`, the key is generation-versioned and
+      the last value of any generation is kept, so an invalidation is served
+      from the previous result while one worker rebuilds it. `stale=False`
+      skips that previous result, for a caller that must see its own write.
+    """
+    cache = cache if cache is not None else caches[DATA_ALIAS]
+    # Locks always live in the shared cache, never in a local tier
+    lock_cache = getattr(cache, "backend", cache)
+    cache_key = versioned_key(family, key) if family else key
+
+    entry = cache.get(cache_key)
+    if entry is not None and not _should_refresh(entry[1], entry[2]):
+        return entry[0]
+    if entry is None and family and stale:
+        entry = cache.get(_stale_key(family, key))
+
+    locked = lock_cache.add(_lock_key(cache_key), 1, LOCK_TIMEOUT)
+    if not locked:
+        # Another worker is recomputing: serve what we have, or wait for its result
+        if entry is not None:
+            return entry[0]
+        deadline = time.monotonic() + LOCK_WAIT
+        while time.monotonic() < deadline:
+            time.sleep(LOCK_POLL)
+            fresh = cache.get(cache_key)
+            if fresh is not None:
+                return fresh[0]
+        # The holder is too slow or died, compute without the lock
+
+    try:
+        started = time.monotonic()
+        value = compute()
+        entry = (value, time.time() + timeout, time.monotonic() - started)
+        cache.set(cache_key, entry, timeout * 2)
+        if family:
+            cache.set(_stale_key(family, key), entry, timeout * 2)
+    finally:
+        if locked:
+            lock_cache.delete(_lock_key(cache_key))
+    return value
+
+
+# --- Two-tier cache ---
+
+L1_TIMEOUT = 30
+INVALIDATION_CHANNEL = "cache:l1:invalidate"
+# How long the listener waits for a message per poll; below the Redis SOCKET_TIMEOUT,
+# so a quiet channel is not mistaken for a dead connection
+LISTEN_POLL = 1.0
+
+
+class TieredCache:
+    """
+    In-process L1 in front of the hot Redis alias.
+
+    Reads are served from process memory for up to L1_TIMEOUT seconds. Deletes
+    go to Redis and are published on INVALIDATION_CHANNEL, which every worker
+    listens to, so an admin edit is visible everywhere right away; the short
+    TTL only covers a worker that missed the message. Values are shared by
+    all threads of the process and must be treated as read-only.
+    """
+
+    def __init__(self, backend, timeout=L1_TIMEOUT):
+        self.backend = backend
+        self.timeout = timeout
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._listener_pid = None
+
+    # --- L1 ---
+
+    def _local_get(self, key):
+        entry = self._entries.get(key)
+        if entry is not None and entry[0] > time.monotonic():
+            return entry[1]
+        return None
+
+    def _local_set(self, key, value, timeout):
+        ttl = self.timeout if timeout is None else min(self.timeout, timeout)
+        self._entries[key] = (time.monotonic() + ttl, value)
+
+    def _forget(self, keys):
+        with self._lock:
+            if keys is None:
+                self._entries.clear()
+            else:
+                for key in keys:
+                    self._entries.pop(key, None)
+
+    # --- Cross-worker invalidation ---
+
+    def _ensure_listener(self):
+        # Threads don't survive fork(), so every worker process starts its own
+        if self._listener_pid == os.getpid():
+            return
+        with self._lock:
+            if self._listener_pid == os.getpid():
+                return
+            self._listener_pid = os.getpid()
+            self._entries.clear()
+            threading.Thread(target=self._listen, name="l1-invalidation", daemon=True).start()
+
+    def _listen(self):
+        delay = 1
+        while True:
+            try:
+                pubsub = get_redis_connection(HOT_ALIAS).pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                # Messages may have been missed while disconnected
+                self._forget(None)
+                delay = 1
+                while True:
+                    message = pubsub.get_message(timeout=LISTEN_POLL)
+                    if message is not None:
+                        self._forget(json.loads(message["data"]))
+            except NotImplementedError:
+                # Not a Redis backend (local dev): rely on the L1 TTL alone
+                return
+            except Exception as e:
+                logger.error(f"L1 invalidation listener lost its connection: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+
+    def _publish(self, keys):
+        try:
+            get_redis_connection(HOT_ALIAS).publish(INVALIDATION_CHANNEL, json.dumps(keys))
+        except NotImplementedError:
+            pass
+        except Exception as e:
+            logger.error(f"Publishing L1 invalidation for {keys} failed: {e}")
+
+    # --- Cache API (the subset get_or_compute and the signals use) ---
+
+    def get(self, key, default=None):
+        self._ensure_listener()
+        value = self._local_get(key)
+        if value is not None:
+            return value
+        value = self.backend.get(key)
+        if value is None:
+            return default
+        self._local_set(key, value, None)
+        return value
+
+    def set(self, key, value, timeout=None):
+        self.backend.set(key, value, timeout)
+        self._local_set(key, value, timeout)
+
+    def delete(self, key):
+        self.delete_many([key])
+
+    def delete_many(self, keys):
+        keys = list(keys)
+        self.backend.delete_many(keys)
+        self._forget(keys)
+        self._publish(keys)
+
+
+local_cache = TieredCache(hot_cache)
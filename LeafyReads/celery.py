@@ -0,0 +1,31 @@
+"""
+The Celery app for background tasks.
+
+Tasks live in each app's tasks.py and are found by autodiscover_tasks().
+Settings come from Django's, under the CELERY_ prefix:
+
+    CELERY_TASK_ALWAYS_EAGER=True      run tasks inline (tests, no worker)
+    CELERY_BROKER_URL=filesystem://    a broker stand-in on local disk
+
+Start a worker, and the one beat process for periodic tasks, with:
+
+    celery -A LeafyReads worker -l info
+    celery -A LeafyReads beat -l info
+
+Both run as their own services in render.yaml.
+"""
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'LeafyReads.settings')
+
+app = Celery('LeafyReads')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
+
+# The filesystem transport expects its folders to exist
+for key in ('data_folder_in', 'data_folder_out', 'processed_folder', 'control_folder'):
+    folder = app.conf.broker_transport_options.get(key)
+    if folder:
+        os.makedirs(folder, exist_ok=True)
@@ -0,0 +1,435 @@
+"""
+Per-request instrumentation.
+
+For a sampled request (settings.REQUEST_METRICS_SAMPLE_RATE) RequestMetricsMiddleware
+records:
+    db        query count and time, through a connection execute_wrapper
+    cache     hits/misses/writes per key family, through InstrumentedRedisCache
+    template  time spent rendering (outermost render only, includes are not double counted)
+    signals   number of signals sent and time spent in their receivers
+    receivers time, calls and queries of every receiver in settings.SIGNAL_TRACE_MODULES,
+              grouped by signal and sender
+
+and reports them as one JSON log line on the `leafyreads.requests` logger and,
+for staff users only, as a `Server-Timing` header (visible in the browser
+devtools); query counts and cache families are not for anonymous clients. Unsampled
+requests only pay for one ContextVar lookup per cache call, template render
+and signal.
+
+Receiver tracing is off unless settings.SIGNAL_TRACING is set: it wraps the
+private Signal._live_receivers, which a Django upgrade may change (see
+home/tests.py SignalTracingTests). When on, receivers in the traced modules
+are timed on sampled requests and inside trace_signals() (e.g. the
+signal_costs command); other calls go straight to the receiver. One that runs
+longer than its budget (settings.SIGNAL_RECEIVER_BUDGET_MS, or an entry in
+settings.SIGNAL_RECEIVER_BUDGETS) is logged on the `leafyreads.signals`
+logger with its query count.
+"""
+import json
+import logging
+import random
+import re
+import time
+import weakref
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connections
+from django.dispatch import Signal
+from django.template.base import Template
+from django_redis.cache import RedisCache
+
+logger = logging.getLogger("leafyreads.requests")
+signal_logger = logging.getLogger("leafyreads.signals")
+
+_metrics = ContextVar("request_metrics", default=None)
+_signal_trace = ContextVar("signal_trace", default=None)
+_receiver_frame = ContextVar("receiver_frame", default=None)
+
+# "library:g3:books_p1..." -> "library", "library_recent_user_12" -> "library_recent_user"
+FAMILY_RE = re.compile(r"^([^:]*?)(?:_\d+)?(?::|$)")
+
+
+def key_family(key):
+    match = FAMILY_RE.match(str(key))
+    return (match.group(1) if match else "") or "other"
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.cache_time = 0.0
+        self.cache = defaultdict(lambda: {"hit": 0, "miss": 0, "set": 0})
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.signals = 0
+        self.signal_time = 0.0
+        self.signal_depth = 0
+        self.receivers = SignalTrace()
+
+    def cache_totals(self):
+        return {
+            name: sum(family[name] for family in self.cache.values())
+            for name in ("hit", "miss", "set")
+        }
+
+    def server_timing(self, total):
+        cache = self.cache_totals()
+        return ", ".join([
+            f'db;dur={self.db_time * 1000:.1f};desc="{self.queries} queries"',
+            f'cache;dur={self.cache_time * 1000:.1f};desc="{cache["hit"]} hit {cache["miss"]} miss {cache["set"]} set"',
+            f"tpl;dur={self.template_time * 1000:.1f}",
+            f'sig;dur={self.signal_time * 1000:.1f};desc="{self.signals} signals"',
+            f"total;dur={total * 1000:.1f}",
+        ])
+
+    def as_dict(self, request, response, total):
+        match = getattr(request, "resolver_match", None)
+        return {
+            "method": request.method,
+            "path": request.path,
+            "view": match.view_name if match else None,
+            "status": response.status_code,
+            "total_ms": round(total * 1000, 1),
+            "db": {"queries": self.queries, "ms": round(self.db_time * 1000, 1)},
+            "cache": {"ms": round(self.cache_time * 1000, 1), "families": dict(self.cache)},
+            "template_ms": round(self.template_time * 1000, 1),
+            "signals": {"count": self.signals, "ms": round(self.signal_time * 1000, 1)},
+            "receivers": self.receivers.as_dict(),
+        }
+
+
+class SignalTrace:
+    """Calls, time and queries per (signal, sender, receiver)."""
+
+    def __init__(self):
+        self.stats = defaultdict(lambda: {"calls": 0, "ms": 0.0, "max_ms": 0.0, "queries": 0, "over_budget": 0})
+
+    def record(self, signal_name, sender_name, receiver_name, elapsed, queries, over_budget):
+        entry = self.stats[(signal_name, sender_name, receiver_name)]
+        entry["calls"] += 1
+        entry["ms"] += elapsed * 1000
+        entry["max_ms"] = max(entry["max_ms"], elapsed * 1000)
+        entry["queries"] += queries
+        entry["over_budget"] += over_budget
+
+    def as_dict(self):
+        """{signal: {sender: {receiver: stats}}}"""
+        grouped = {}
+        for (signal_name, sender_name, receiver_name), entry in sorted(self.stats.items()):
+            grouped.setdefault(signal_name, {}).setdefault(sender_name, {})[receiver_name] = {
+                key: round(value, 2) if isinstance(value, float) else value
+                for key, value in entry.items()
+            }
+        return grouped
+
+
+def current_metrics():
+    return _metrics.get()
+
+
+# --- Collectors ---
+
+def _query_timer(execute, sql, params, many, context):
+    metrics = _metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db_time += time.perf_counter() - started
+
+
+class InstrumentedRedisCache(RedisCache):
+    """django-redis backend that counts hits/misses/writes per key family."""
+
+    def _record(self, kind, key, started, count=1):
+        metrics = _metrics.get()
+        if metrics is not None:
+            metrics.cache_time += time.perf_counter() - started
+            metrics.cache[key_family(key)][kind] += count
+
+    def get(self, key, default=None, version=None, client=None):
+        started = time.perf_counter()
+        value = super().get(key, default=default, version=version, client=client)
+        self._record("miss" if value is default else "hit", key, started)
+        return value
+
+    def get_many(self, keys, version=None, client=None):
+        started = time.perf_counter()
+        values = super().get_many(keys, version=version, client=client)
+        for key in keys:
+            self._record("hit" if key in values else "miss", key, started)
+            started = time.perf_counter()
+        return values
+
+    def set(self, key, value, *args, **kwargs):
+        started = time.perf_counter()
+        result = super().set(key, value, *args, **kwargs)
+        self._record("set", key, started)
+        return result
+
+    def add(self, key, value, *args, **kwargs):
+        started = time.perf_counter()
+        result = super().add(key, value, *args, **kwargs)
+        self._record("set", key, started)
+        return result
+
+    def incr(self, key, *args, **kwargs):
+        started = time.perf_counter()
+        result = super().incr(key, *args, **kwargs)
+        self._record("set", key, started)
+        return result
+
+    def decr(self, key, *args, **kwargs):
+        started = time.perf_counter()
+        result = super().decr(key, *args, **kwargs)
+        self._record("set", key, started)
+        return result
+
+    def delete(self, key, *args, **kwargs):
+        started = time.perf_counter()
+        result = super().delete(key, *args, **kwargs)
+        self._record("set", key, started)
+        return result
+
+    def delete_many(self, keys, *args, **kwargs):
+        started = time.perf_counter()
+        result = super().delete_many(keys, *args, **kwargs)
+        for key in keys:
+            self._record("set", key, started)
+            started = time.perf_counter()
+        return result
+
+
+# --- Signal receivers ---
+
+class ReceiverFrame:
+    __slots__ = ("queries",)
+
+    def __init__(self):
+        self.queries = 0
+
+
+def _receiver_query_counter(execute, sql, params, many, context):
+    # Counted on the innermost receiver only, so nested receivers are not counted twice
+    frame = _receiver_frame.get()
+    if frame is not None:
+        frame.queries += 1
+    return execute(sql, params, many, context)
+
+
+_signal_names = {}
+
+
+def signal_name(signal):
+    if not _signal_names:
+        from allauth.account import signals as account_signals
+        from django.contrib.auth import signals as auth_signals
+        from django.core import signals as core_signals
+        from django.db.models import signals as model_signals
+
+        for module in (model_signals, core_signals, auth_signals, account_signals):
+            for name, value in vars(module).items():
+                if isinstance(value, Signal):
+                    _signal_names[id(value)] = name
+    return _signal_names.get(id(signal), repr(signal))
+
+
+def sender_name(sender):
+    meta = getattr(sender, "_meta", None)
+    if meta is not None:
+        return meta.label
+    return getattr(sender, "__qualname__", None) or type(sender).__qualname__
+
+
+def receiver_budget(name):
+    budgets = getattr(settings, "SIGNAL_RECEIVER_BUDGETS", {})
+    return budgets.get(name, getattr(settings, "SIGNAL_RECEIVER_BUDGET_MS", 50))
+
+
+def _traced_receiver(receiver):
+    name = f"{receiver.__module__}.{receiver.__qualname__}"
+
+    def traced(signal, sender, **named):
+        if _metrics.get() is None and _signal_trace.get() is None:
+            return receiver(signal=signal, sender=sender, **named)
+        outer = _receiver_frame.get()
+        frame = ReceiverFrame()
+        token = _receiver_frame.set(frame)
+        wrappers = []
+        if outer is None:
+            wrappers = [connection.execute_wrapper(_receiver_query_counter) for connection in connections.all()]
+            for wrapper in wrappers:
+                wrapper.__enter__()
+        started = time.perf_counter()
+        try:
+            return receiver(signal=signal, sender=sender, **named)
+        finally:
+            elapsed = time.perf_counter() - started
+            for wrapper in reversed(wrappers):
+                wrapper.__exit__(None, None, None)
+            _receiver_frame.reset(token)
+            _record_receiver(signal, sender, name, elapsed, frame.queries)
+
+    traced.__name__ = receiver.__name__
+    traced.__qualname__ = receiver.__qualname__
+    traced.__module__ = receiver.__module__
+    traced.__wrapped__ = receiver
+    return traced
+
+
+def _record_receiver(signal, sender, name, elapsed, queries):
+    budget = receiver_budget(name)
+    over_budget = elapsed * 1000 > budget
+    traces = [trace for trace in (_signal_trace.get(),) if trace is not None]
+    metrics = _metrics.get()
+    if metrics is not None:
+        traces.append(metrics.receivers)
+    if not over_budget and not traces:
+        return
+
+    signal_label, sender_label = signal_name(signal), sender_name(sender)
+    for trace in traces:
+        trace.record(signal_label, sender_label, name, elapsed, queries, over_budget)
+    if over_budget:
+        signal_logger.warning(json.dumps({
+            "receiver": name,
+            "signal": signal_label,
+            "sender": sender_label,
+            "ms": round(elapsed * 1000, 1),
+            "budget_ms": budget,
+            "queries": queries,
+        }))
+
+
+_traced_modules = frozenset()
+_traced_receivers = weakref.WeakKeyDictionary()
+
+
+def _trace(receiver):
+    if getattr(receiver, "__module__", None) not in _traced_modules:
+        return receiver
+    traced = _traced_receivers.get(receiver)
+    if traced is None:
+        traced = _traced_receivers[receiver] = _traced_receiver(receiver)
+    return traced
+
+
+@contextmanager
+def trace_signals():
+    """Collects receiver timings for the block, outside of a request."""
+    install_signal_tracing(force=True)
+    trace = SignalTrace()
+    token = _signal_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _signal_trace.reset(token)
+
+
+_original_render = Template.render
+_original_send = Signal.send
+_original_send_robust = Signal.send_robust
+_original_live_receivers = getattr(Signal, "_live_receivers", None)
+
+
+def _live_traced_receivers(self, sender):
+    sync_receivers, async_receivers = _original_live_receivers(self, sender)
+    return [_trace(receiver) for receiver in sync_receivers], async_receivers
+
+
+def install_signal_tracing(force=False):
+    """Wraps Signal._live_receivers (private) when settings.SIGNAL_TRACING is on, or forced."""
+    global _traced_modules
+    if not (force or getattr(settings, "SIGNAL_TRACING", False)):
+        return
+    if _original_live_receivers is None:
+        raise ImproperlyConfigured(
+            "SIGNAL_TRACING needs django.dispatch.Signal._live_receivers, which this Django "
+            "version does not have; turn SIGNAL_TRACING off."
+        )
+    _traced_modules = frozenset(getattr(settings, "SIGNAL_TRACE_MODULES", ()))
+    if _traced_modules and Signal._live_receivers is not _live_traced_receivers:
+        Signal._live_receivers = _live_traced_receivers
+
+
+def _timed_render(self, context):
+    metrics = _metrics.get()
+    if metrics is None:
+        return _original_render(self, context)
+    metrics.template_depth += 1
+    started = time.perf_counter()
+    try:
+        return _original_render(self, context)
+    finally:
+        metrics.template_depth -= 1
+        if not metrics.template_depth:
+            metrics.template_time += time.perf_counter() - started
+
+
+def _timed(send):
+    def timed_send(self, sender, **named):
+        metrics = _metrics.get()
+        if metrics is None or not self.receivers:
+            return send(self, sender, **named)
+        metrics.signals += 1
+        metrics.signal_depth += 1
+        started = time.perf_counter()
+        try:
+            return send(self, sender, **named)
+        finally:
+            metrics.signal_depth -= 1
+            # Signals sent from inside a receiver are already in the outer timing
+            if not metrics.signal_depth:
+                metrics.signal_time += time.perf_counter() - started
+    return timed_send
+
+
+def _install_hooks():
+    if Template.render is not _timed_render:
+        Template.render = _timed_render
+        Signal.send = _timed(_original_send)
+        Signal.send_robust = _timed(_original_send_robust)
+    install_signal_tracing()
+
+
+# --- Middleware ---
+
+class RequestMetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, "REQUEST_METRICS_SAMPLE_RATE", 0.0)
+        _install_hooks()
+
+    def __call__(self, request):
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            return self.get_response(request)
+
+        metrics = RequestMetrics()
+        token = _metrics.set(metrics)
+        try:
+            wrappers = [connection.execute_wrapper(_query_timer) for connection in connections.all()]
+            for wrapper in wrappers:
+                wrapper.__enter__()
+            try:
+                response = self.get_response(request)
+            finally:
+                for wrapper in reversed(wrappers):
+                    wrapper.__exit__(None, None, None)
+        finally:
+            _metrics.reset(token)
+
+        total = time.perf_counter() - metrics.started
+        user = getattr(request, "user", None)
+        if user is not None and user.is_staff:
+            response["Server-Timing"] = metrics.server_timing(total)
+        logger.info(json.dumps(metrics.as_dict(request, response, total)))
+        return response
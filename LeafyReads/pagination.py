@@ -0,0 +1,134 @@
+"""
+Keyset (cursor) pagination.
+
+Instead of OFFSET + COUNT(*), each page continues from the sort values of the
+last row of the previous page, so page 500 costs the same as page 1. Cursors
+are opaque url-safe tokens that also carry the ordering they were made for; a
+cursor used with a different sort, or holding values its columns can't take,
+is ignored and the first page is returned.
+"""
+import base64
+import json
+from collections.abc import Sequence
+from datetime import date, datetime
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+def _encode(payload):
+    raw = json.dumps(payload, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def _decode(token):
+    padded = token + "=" * (-len(token) % 4)
+    return json.loads(base64.urlsafe_b64decode(padded.encode("ascii")))
+
+
+def _serialize(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return value
+
+
+class CursorPage(Sequence):
+    is_cursor_page = True
+
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    def __repr__(self):
+        return f"<CursorPage of {len(self.object_list)} items>"
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+class CursorPaginator:
+    def __init__(self, queryset, per_page):
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+        pk_name = queryset.model._meta.pk.name
+        if not any(field.lstrip("-") in ("pk", pk_name) for field in ordering):
+            # A unique tiebreaker keeps rows with equal sort values from being skipped
+            descending = bool(ordering) and ordering[-1].startswith("-")
+            ordering.append(f"-{pk_name}" if descending else pk_name)
+
+        self.queryset = queryset.order_by(*ordering)
+        self.ordering = ordering
+        self.per_page = per_page
+
+    def cursor_for(self, obj):
+        """Token that continues right after `obj`."""
+        values = [_serialize(getattr(obj, field.lstrip("-"))) for field in self.ordering]
+        return _encode({"o": self.ordering, "v": values})
+
+    def _values(self, cursor):
+        if not cursor:
+            return None
+        try:
+            payload = _decode(cursor)
+        except (ValueError, TypeError):
+            return None
+        if not isinstance(payload, dict) or payload.get("o") != self.ordering:
+            return None
+        values = payload.get("v")
+        if not isinstance(values, list) or len(values) != len(self.ordering):
+            return None
+        # Cursors come from the client: a value the column can't hold would only
+        # fail once the query runs
+        try:
+            values = [
+                self._field(field.lstrip("-")).to_python(value)
+                for field, value in zip(self.ordering, values)
+            ]
+        except (ValidationError, TypeError, ValueError):
+            return None
+        if any(value is None for value in values):
+            return None
+        return values
+
+    def _field(self, name):
+        """The model field or annotation output field a sort key reads."""
+        query = self.queryset.query
+        if name in query.annotations:
+            return query.annotations[name].output_field
+        model = self.queryset.model
+        *path, last = name.split("__")
+        for part in path:
+            model = model._meta.get_field(part).related_model
+        return model._meta.pk if last == "pk" else model._meta.get_field(last)
+
+    def _after(self, values):
+        # (a, b, c) after (x, y, z)  ==  a > x OR (a = x AND b > y) OR ...
+        # The leading a >= x bound lets Postgres turn this into an index range scan.
+        first = self.ordering[0]
+        lookup = "lte" if first.startswith("-") else "gte"
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip("-")
+            op = "lt" if field.startswith("-") else "gt"
+            condition |= equal & Q(**{f"{name}__{op}": value})
+            equal &= Q(**{name: value})
+        return Q(**{f"{first.lstrip('-')}__{lookup}": values[0]}) & condition
+
+    def get_page(self, cursor=None):
+        queryset = self.queryset
+        values = self._values(cursor)
+        if values is not None:
+            queryset = queryset.filter(self._after(values))
+
+        # One extra row tells us whether there is a next page, no COUNT needed
+        rows = list(queryset[: self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+        next_cursor = self.cursor_for(rows[-1]) if has_next else None
+        return CursorPage(rows, next_cursor)
@@ -0,0 +1,172 @@
+"""
+Opt-in profiling of single requests.
+
+A staff user adds `?_profile=1` to a URL (or sends `X-Profile: 1`) and the
+request is run under cProfile. ProfilerMiddleware then writes, under
+settings.PROFILER_ROOT:
+
+    <id>.pstats   raw stats, for `python -m pstats` or snakeviz
+    <id>.dot      call graph rendered by gprof2dot
+    <id>.svg      the same graph as SVG, when Graphviz's `dot` is installed
+    <id>.json     request metadata used by the LRAdmin profile browser
+
+The id is returned in the `X-Profile-Id` response header. Only the newest
+settings.PROFILER_KEEP profiles are kept.
+"""
+import cProfile
+import io
+import json
+import logging
+import pstats
+import re
+import shutil
+import subprocess
+import time
+import uuid
+from pathlib import Path
+
+import gprof2dot
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger("leafyreads.requests")
+
+PROFILE_ID_RE = re.compile(r"^[\w-]+$")
+
+# gprof2dot defaults: hide nodes under 0.5% and edges under 0.1% of total time
+NODE_THRESHOLD = 0.005
+EDGE_THRESHOLD = 0.001
+
+
+def profile_root():
+    return Path(getattr(settings, "PROFILER_ROOT", Path(settings.BASE_DIR) / "profiles"))
+
+
+def wants_profile(request):
+    if request.GET.get("_profile") != "1" and request.headers.get("X-Profile") != "1":
+        return False
+    user = getattr(request, "user", None)
+    return bool(user and user.is_staff)
+
+
+def render_call_graph(pstats_path):
+    """DOT source of the call graph, pruned the way the gprof2dot command line does by default."""
+    profile = gprof2dot.PstatsParser(str(pstats_path)).parse()
+    profile.prune(NODE_THRESHOLD, EDGE_THRESHOLD, None, False)
+    output = io.StringIO()
+    writer = gprof2dot.DotWriter(output)
+    writer.show_function_events = [gprof2dot.labels[name] for name in gprof2dot.defaultLabelNames]
+    writer.graph(profile, gprof2dot.themes["color"])
+    return output.getvalue()
+
+
+def summary(profile_id, sort="cumulative", limit=40):
+    """The top of the pstats report as text."""
+    output = io.StringIO()
+    stats = pstats.Stats(str(profile_root() / f"{profile_id}.pstats"), stream=output)
+    stats.strip_dirs().sort_stats(sort).print_stats(limit)
+    return output.getvalue()
+
+
+def list_profiles():
+    """Metadata of the stored profiles, newest first."""
+    profiles = []
+    for path in sorted(profile_root().glob("*.json"), reverse=True):
+        try:
+            profiles.append(json.loads(path.read_text()))
+        except (OSError, ValueError):
+            continue
+    return profiles
+
+
+def load_profile(profile_id):
+    if not PROFILE_ID_RE.match(profile_id):
+        return None
+    path = profile_root() / f"{profile_id}.json"
+    if not path.exists():
+        return None
+    return json.loads(path.read_text())
+
+
+def profile_file(profile_id, extension):
+    """Path of one stored artifact, or None if the id is invalid or the file is missing."""
+    if not PROFILE_ID_RE.match(profile_id) or extension not in ("pstats", "dot", "svg"):
+        return None
+    path = profile_root() / f"{profile_id}.{extension}"
+    return path if path.exists() else None
+
+
+def _prune(root, keep):
+    for path in sorted(root.glob("*.json"), reverse=True)[keep:]:
+        for artifact in root.glob(f"{path.stem}.*"):
+            artifact.unlink(missing_ok=True)
+
+
+def save_profile(profiler, request, response, total):
+    root = profile_root()
+    root.mkdir(parents=True, exist_ok=True)
+
+    match = getattr(request, "resolver_match", None)
+    view = match.view_name if match else "unresolved"
+    now = timezone.now()
+    # Sortable by name: newest last, which list_profiles() and _prune() rely on
+    slug = re.sub(r"\W+", "_", view)
+    profile_id = f"{now:%Y%m%d-%H%M%S}-{slug}-{uuid.uuid4().hex[:6]}"
+
+    pstats_path = root / f"{profile_id}.pstats"
+    profiler.dump_stats(pstats_path)
+
+    dot = render_call_graph(pstats_path)
+    (root / f"{profile_id}.dot").write_text(dot)
+    has_svg = False
+    if shutil.which("dot"):
+        result = subprocess.run(["dot", "-Tsvg"], input=dot, capture_output=True, text=True, timeout=60)
+        if result.returncode == 0:
+            (root / f"{profile_id}.svg").write_text(result.stdout)
+            has_svg = True
+
+    meta = {
+        "id": profile_id,
+        "created": now.isoformat(),
+        "method": request.method,
+        "path": request.get_full_path(),
+        "view": view,
+        "user": request.user.get_username(),
+        "status": response.status_code,
+        "total_ms": round(total * 1000, 1),
+        "svg": has_svg,
+    }
+    (root / f"{profile_id}.json").write_text(json.dumps(meta, indent=2))
+    _prune(root, getattr(settings, "PROFILER_KEEP", 200))
+    return profile_id
+
+
+class ProfilerMiddleware:
+    """Profiles requests from staff users that ask for it. Must come after AuthenticationMiddleware."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not wants_profile(request):
+            return self.get_response(request)
+
+        profiler = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Another profiler is already active in this thread
+            return self.get_response(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.disable()
+        total = time.perf_counter() - started
+
+        try:
+            response["X-Profile-Id"] = save_profile(profiler, request, response, total)
+        except Exception:
+            # A failed write must not break the page that was profiled
+            logger.exception("Could not save the profile of %s", request.path)
+        return response
@@ -0,0 +1,231 @@
+"""
+Compact cached rows.
+
+Pickled model instances carry their whole `_state`, every loaded column and
+any related objects, and unpickling them rebuilds all of that on every cache
+hit. For lists that only feed templates, a `RowSpec` stores plain tuples of
+the fields the template needs (from a `.values_list()` projection, or read off
+instances that are already loaded) and rebuilds them as `Row` objects.
+
+A `Row` reads like the model instance it stands for: attributes, related
+objects as nested rows (`read.book.title`), `{% if post.book %}`, equality
+with real instances (`post.author == request.user`) and model methods that
+only use projected fields (`get_full_name`, `__str__`). It has no save(),
+delete() or lazy relation lookups, so a missing field fails loudly instead of
+running a query.
+"""
+import inspect
+
+from django.core.paginator import Page, Paginator
+from django.db import models
+
+from LeafyReads.pagination import CursorPage
+
+
+# Part of the name of every cache key that holds packed rows (see rows_key).
+# The baseline cached pickled model lists under some of the same names; bump
+# this whenever the packed layout changes so no reader gets the other layout.
+ROWS_VERSION = 2
+
+
+def rows_key(key):
+    """`key` for a payload packed by this module's current layout."""
+    return f"{key}:v{ROWS_VERSION}"
+
+
+class Row:
+    def __init__(self, model, values):
+        self.__dict__["_model"] = model
+        self.__dict__.update(values)
+
+    @property
+    def pk(self):
+        return self.__dict__.get(self._model._meta.pk.attname)
+
+    def __getattr__(self, name):
+        # Only reached for names that are not projected fields
+        if name.startswith("_"):
+            # Also what unpickling asks for (__setstate__) before __dict__ is restored
+            raise AttributeError(name)
+        attr = inspect.getattr_static(self._model, name, None)
+        if inspect.isfunction(attr):
+            return attr.__get__(self)
+        raise AttributeError(f"{self._model.__name__} row has no field {name!r}")
+
+    def __eq__(self, other):
+        if isinstance(other, (Row, models.Model)):
+            other_model = other._model if isinstance(other, Row) else type(other)
+            return (
+                other_model._meta.concrete_model is self._model._meta.concrete_model
+                and other.pk == self.pk
+            )
+        return NotImplemented
+
+    def __hash__(self):
+        return hash((self._model._meta.label, self.pk))
+
+    def __str__(self):
+        try:
+            return self._model.__str__(self)
+        except AttributeError:
+            return f"{self._model.__name__} {self.pk}"
+
+    def __repr__(self):
+        return f"<{self._model.__name__} row: {self.pk}>"
+
+
+class RowList(list):
+    """Stand-in for a prefetched reverse relation (`post.images.all`)."""
+
+    def all(self):
+        return self
+
+    def exists(self):
+        return bool(self)
+
+    def count(self):
+        return len(self)
+
+
+class RowSpec:
+    """
+    fields:   projected fields, `__` follows forward relations ("book__title").
+    children: {reverse accessor: RowSpec} packed as nested lists.
+    """
+
+    def __init__(self, model, fields, children=None):
+        self.model = model
+        self.fields = tuple(fields)
+        self.children = children or {}
+        self._columns = [self._resolve(name) for name in self.fields]
+        self._plan_unpack()
+
+    def _resolve(self, name):
+        parts = name.split("__")
+        model = self.model
+        for part in parts[:-1]:
+            model = model._meta.get_field(part).related_model
+        field = model._meta.get_field(parts[-1])
+        # Custom string-backed fields (CloudinaryField) are stored as their DB string
+        convert = hasattr(field, "from_db_value") and field.get_internal_type() in ("CharField", "TextField")
+        return parts, field, convert
+
+    # --- Packing ---
+
+    def _dump(self, column, value):
+        _, field, convert = column
+        if convert and value is not None:
+            return field.get_prep_value(value)
+        return value
+
+    def _value(self, obj, parts):
+        for part in parts:
+            if obj is None:
+                return None
+            obj = getattr(obj, part)
+        return obj
+
+    def pack(self, source):
+        """Packs a queryset (projected with values_list) or loaded instances into tuples."""
+        if isinstance(source, models.QuerySet):
+            rows = [
+                tuple(self._dump(column, value) for column, value in zip(self._columns, values))
+                for values in source.values_list(*self.fields)
+            ]
+        else:
+            rows = [
+                tuple(self._dump(column, self._value(obj, column[0])) for column in self._columns)
+                for obj in source
+            ]
+
+        if self.children and rows:
+            pk_index = self.fields.index(self.model._meta.pk.attname)
+            ids = [row[pk_index] for row in rows]
+            packed_children = [self._pack_children(name, spec, ids) for name, spec in self.children.items()]
+            rows = [
+                row + tuple(children.get(row[pk_index], []) for children in packed_children)
+                for row in rows
+            ]
+        return rows
+
+    def _pack_children(self, name, spec, ids):
+        relation = self.model._meta.get_field(name)
+        fk = relation.field.attname
+        fk_index = spec.fields.index(fk)
+        grouped = {}
+        queryset = spec.model._default_manager.filter(**{f"{fk}__in": ids})
+        for row in spec.pack(queryset):
+            grouped.setdefault(row[fk_index], []).append(row)
+        return grouped
+
+    # --- Unpacking ---
+
+    def _plan_unpack(self):
+        # Worked out once per spec: for each column the relation path and key
+        # its value goes to and its converter, so unpack() only moves values
+        self._keys = []
+        self._converters = []
+        relations = {}
+        for index, (parts, field, convert) in enumerate(self._columns):
+            path = tuple(parts[:-1])
+            self._keys.append((path, field.attname if not path else parts[-1]))
+            if convert:
+                self._converters.append((index, field.to_python))
+            model = self.model
+            for depth, part in enumerate(path, 1):
+                model = model._meta.get_field(part).related_model
+                relations.setdefault(path[:depth], model)
+        # Deepest first, so nested rows exist before the row that holds them
+        self._relations = sorted(relations.items(), key=lambda item: -len(item[0]))
+        self._flat_keys = [key for _, key in self._keys] if not relations else None
+
+    def _values(self, row):
+        if self._converters:
+            row = list(row)
+            for index, convert in self._converters:
+                if row[index] is not None:
+                    row[index] = convert(row[index])
+        if self._flat_keys is not None:
+            return dict(zip(self._flat_keys, row))
+
+        levels = {path: {} for path, _ in self._relations}
+        levels[()] = {}
+        for (path, key), value in zip(self._keys, row):
+            levels[path][key] = value
+        for path, model in self._relations:
+            values = levels[path]
+            # A null foreign key comes back as all-None columns
+            related = None if all(v is None for v in values.values()) else Row(model, values)
+            levels[path[:-1]][path[-1]] = related
+        return levels[()]
+
+    def unpack(self, rows):
+        result = []
+        width = len(self._columns)
+        for row in rows:
+            item = Row(self.model, self._values(row[:width] if self.children else row))
+            for (name, spec), children in zip(self.children.items(), row[width:]):
+                item.__dict__[name] = RowList(spec.unpack(children))
+            result.append(item)
+        return result
+
+
+def pack_page(spec, page):
+    """Packs a Page/CursorPage of books for the cache, without its paginator or queryset."""
+    rows = spec.pack(page.object_list)
+    if getattr(page, "is_cursor_page", False):
+        return ("cursor", rows, page.next_cursor)
+    paginator = page.paginator
+    return ("page", rows, page.number, paginator.count, paginator.per_page, getattr(page, "next_cursor", None))
+
+
+def unpack_page(spec, packed):
+    if packed[0] == "cursor":
+        _, rows, next_cursor = packed
+        return CursorPage(spec.unpack(rows), next_cursor)
+
+    _, rows, number, count, per_page, next_cursor = packed
+    # range() gives the paginator its count and num_pages without a query
+    page = Page(spec.unpack(rows), number, Paginator(range(count), per_page))
+    page.next_cursor = next_cursor
+    return page
@@ -5,6 +5,7 @@ from LeafyReads.ckEditor import *
 import cloudinary
 from environ import Env
 import dj_database_url
+from celery.schedules import crontab
 env = Env()
 Env.read_env()
 
@@ -118,6 +119,8 @@ INTERNAL_IPS = [
 ]
 
 MIDDLEWARE = [
+    # First, so the timings cover every other middleware
+    'LeafyReads.instrumentation.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
@@ -125,6 +128,8 @@ MIDDLEWARE = [
     'debug_toolbar.middleware.DebugToolbarMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    # Needs request.user, so after authentication
+    'LeafyReads.profiling.ProfilerMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'allauth.account.middleware.AccountMiddleware',
@@ -181,22 +186,37 @@ DATABASES = {
 SESSION_COOKIE_AGE = 60 * 60 * 24 * 7
 
 
-CACHES = {
-    "default": {
-        "BACKEND": "django_redis.cache.RedisCache",
-        "LOCATION": f"redis://default:{env('REDIS_PASSWORD')}@{env('REDIS_HOST')}:{env('REDIS_PORT')}",
+REDIS_URL = f"redis://default:{env('REDIS_PASSWORD')}@{env('REDIS_HOST')}:{env('REDIS_PORT')}"
+
+
+def redis_cache(location, max_connections=100):
+    return {
+        # django-redis, plus hit/miss counters for sampled requests
+        "BACKEND": "LeafyReads.instrumentation.InstrumentedRedisCache",
+        "LOCATION": location,
         "OPTIONS": {
             "CLIENT_CLASS": "django_redis.client.DefaultClient",
-            "CONNECTION_POOL_KWARGS": {"max_connections": 100},
+            "CONNECTION_POOL_KWARGS": {"max_connections": max_connections},
             "SSL": False,
             "SOCKET_CONNECT_TIMEOUT": 2,
             "SOCKET_TIMEOUT": 2,
         }
     }
+
+
+# Each alias can point at its own Redis instance so it gets its own maxmemory-policy.
+# By default they share one server and are only separated by DB number.
+CACHES = {
+    # Volatile page/data cache (feeds, search results, book lists). Run with allkeys-lru.
+    "default": redis_cache(env('REDIS_DATA_URL', default=f"{REDIS_URL}/0")),
+    # Durable: sessions and write-behind buffers. Run with noeviction or volatile-lru.
+    "sessions": redis_cache(env('REDIS_SESSIONS_URL', default=f"{REDIS_URL}/1")),
+    # Tiny hot keys: generation counters, category lists, unread counters.
+    "hot": redis_cache(env('REDIS_HOT_URL', default=f"{REDIS_URL}/2"), max_connections=50),
 }
 
 SESSION_ENGINE = "django.contrib.sessions.backends.cache"
-SESSION_CACHE_ALIAS = "default"
+SESSION_CACHE_ALIAS = "sessions"
 
 
 
@@ -335,15 +355,92 @@ LOGGING = {
         'handlers': ['console'],
         'level': 'ERROR', # This will print the stack trace for 500 errors
     },
+    'loggers': {
+        # One JSON line per sampled request (LeafyReads.instrumentation)
+        'leafyreads.requests': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+        # Signal receivers over their latency budget
+        'leafyreads.signals': {
+            'handlers': ['console'],
+            'level': 'WARNING',
+            'propagate': False,
+        },
+    },
 }
 
+# Share of requests that get query/cache/template/signal metrics, 0.0 - 1.0
+REQUEST_METRICS_SAMPLE_RATE = env.float('REQUEST_METRICS_SAMPLE_RATE', default=0.0)
+
+# Staff requests with ?_profile=1 or X-Profile: 1 are profiled and stored here
+PROFILER_ROOT = env('PROFILER_ROOT', default=str(BASE_DIR / 'profiles'))
+PROFILER_KEEP = env.int('PROFILER_KEEP', default=200)
+
+# search_books() candidate gate (pg_trgm word similarity of search_document, served by its
+# GIN index). Lower keeps more weak matches but scans more; 0 turns it off (books/search.py)
+SEARCH_WORD_SIMILARITY_THRESHOLD = env.float('SEARCH_WORD_SIMILARITY_THRESHOLD', default=0.3)
+
+# BookLog rows older than this are removed by the prune_book_logs command
+BOOK_LOG_RETENTION_DAYS = env.int('BOOK_LOG_RETENTION_DAYS', default=30)
+
+# Receivers in these modules are timed on sampled requests and by the signal_costs command;
+# any slower than their budget is logged. Request tracing wraps a private Django API
+# (Signal._live_receivers), so it is off unless SIGNAL_TRACING is set.
+SIGNAL_TRACING = env.bool('SIGNAL_TRACING', default=False)
+SIGNAL_TRACE_MODULES = ['books.signals', 'home.signals', 'community.signals', 'LRAdmin.signals']
+SIGNAL_RECEIVER_BUDGET_MS = env.float('SIGNAL_RECEIVER_BUDGET_MS', default=50.0)
+# Per receiver overrides, e.g. {'books.signals.invalidate_book_caches': 20}
+SIGNAL_RECEIVER_BUDGETS = {}
+
+# Background tasks (LeafyReads/celery.py). Receivers enqueue their side effects after commit.
+# CELERY_TASK_ALWAYS_EAGER=True runs them inline, for tests or without a worker;
+# CELERY_BROKER_URL=filesystem:// keeps the queue on local disk instead of Redis.
+CELERY_BROKER_URL = env('CELERY_BROKER_URL', default=f"{REDIS_URL}/3")
+CELERY_TASK_ALWAYS_EAGER = env.bool('CELERY_TASK_ALWAYS_EAGER', default=False)
+CELERY_TASK_EAGER_PROPAGATES = True
+# Nothing waits on task results
+CELERY_TASK_IGNORE_RESULT = True
+# A task lost with its worker is redelivered. Tasks that insert rows key them with
+# LeafyReads.tasks.task_key so a second run adds nothing; the others recount, delete,
+# flush or claim rows and can simply run again. The one gap: a mail sent just before
+# its worker died, and not yet marked sent, goes out a second time (home/outbox.py)
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
+# Periodic jobs, sent by the one `celery beat` process. Each is also a management command.
+# A run still queued after its interval is dropped (expires); the next one does the work.
+CELERY_BEAT_SCHEDULE = {
+    'send-outbox': {'task': 'home.tasks.send_outbox', 'schedule': 60, 'options': {'expires': 60}},
+    'flush-view-counts': {'task': 'books.tasks.flush_view_counts', 'schedule': 60, 'options': {'expires': 60}},
+    'flush-failed-searches': {'task': 'books.tasks.flush_failed_searches', 'schedule': 5 * 60, 'options': {'expires': 5 * 60}},
+    'update-trending': {'task': 'books.tasks.update_trending_scores', 'schedule': 10 * 60, 'options': {'expires': 10 * 60}},
+    'prune-book-logs': {'task': 'LRAdmin.tasks.prune_book_logs', 'schedule': crontab(hour=3, minute=30)},
+}
+if CELERY_BROKER_URL.startswith('filesystem://'):
+    # Messages and the transport's exchange bindings all stay under celery_broker/
+    CELERY_BROKER_TRANSPORT_OPTIONS = {
+        'data_folder_in': str(BASE_DIR / 'celery_broker' / 'queue'),
+        'data_folder_out': str(BASE_DIR / 'celery_broker' / 'queue'),
+        'control_folder': str(BASE_DIR / 'celery_broker' / 'control'),
+    }
+else:
+    # Don't hold a request for long when Redis is down; enqueue() then runs the task inline
+    CELERY_BROKER_TRANSPORT_OPTIONS = {'max_retries': 1}
+
 
 # Email Configuration
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# locmem or console for tests; point EMAIL_HOST/EMAIL_PORT at a local SMTP stand-in to try the worker
+EMAIL_BACKEND = env('EMAIL_BACKEND', default='django.core.mail.backends.smtp.EmailBackend')
 EMAIL_HOST =  env('EMAIL_HOST')
-EMAIL_PORT = 587
-EMAIL_USE_TLS = True
+EMAIL_PORT = env.int('EMAIL_PORT', default=587)
+EMAIL_USE_TLS = env.bool('EMAIL_USE_TLS', default=True)
 EMAIL_HOST_USER = env('EMAIL_HOST_USER')
 EMAIL_HOST_PASSWORD = env('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = env('DEFAULT_FROM_EMAIL')
 
+# send_outbox worker: messages per second, and attempts before a mail is marked failed
+EMAIL_OUTBOX_RATE = env.float('EMAIL_OUTBOX_RATE', default=5.0)
+EMAIL_OUTBOX_MAX_ATTEMPTS = env.int('EMAIL_OUTBOX_MAX_ATTEMPTS', default=8)
+
@@ -0,0 +1,56 @@
+"""
+Running signal side effects as background tasks.
+
+Receivers should not do fan-out work (notifications, recounts, log rows)
+inside the request. They call enqueue() instead, which sends the task to the
+Celery broker once the surrounding transaction commits, so the worker never
+sees rows that are not there yet and nothing is sent for a rolled-back
+change. Tasks take ids rather than instances and must cope with the row
+having been deleted since.
+
+With CELERY_TASK_ALWAYS_EAGER the task runs inline at commit, which is what
+tests want. If the broker can't be reached the task also runs inline, so a
+broker outage slows requests down instead of losing side effects.
+
+Tasks are acknowledged after they finish (CELERY_TASK_ACKS_LATE), so one that
+dies with its worker runs again. Tasks that insert rows key them with
+task_key(), which is the same on every delivery of a message, and write them
+with create_once() (or a unique column), so a second run adds nothing.
+"""
+import logging
+
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+
+def _send(task, args, kwargs):
+    try:
+        task.apply_async(args, kwargs)
+    except Exception as e:
+        logger.warning("Could not enqueue %s, running it inline: %s", task.name, e)
+        task.apply(args, kwargs)
+
+
+def enqueue(task, *args, **kwargs):
+    """Runs `task` with these arguments in a worker after the current transaction commits."""
+    transaction.on_commit(lambda: _send(task, args, kwargs))
+
+
+def task_key(task, *parts):
+    """
+    Dedupe key for a row written by the running `task` (bind=True): its message
+    id plus `parts` to tell several rows of one run apart. None outside a
+    worker or eager run, where there is nothing to redeliver.
+    """
+    task_id = task.request.id
+    if task_id is None:
+        return None
+    return ":".join([task_id, *map(str, parts)])
+
+
+def create_once(model, key, **fields):
+    """model.objects.create(**fields), unless a row with this task_key exists already."""
+    if key is None:
+        return model.objects.create(**fields)
+    return model.objects.get_or_create(task_key=key, defaults=fields)[0]
@@ -0,0 +1,102 @@
+"""
+Dirty-field tracking for models.
+
+ChangeTrackingMixin remembers the values an instance was loaded with
+(from_db), so save() receivers can see what actually changed without
+fetching the old row again:
+
+    book.changed_fields          -> {"summary"}
+    book.has_changed("title")    -> False
+    book.loaded_value("is_published")
+
+and receivers declare the fields they care about with @when_changed:
+
+    @receiver(post_save, sender=Book)
+    @when_changed("title", "author")
+    def reindex(sender, instance, **kwargs): ...
+
+Instances that were not loaded from the database (new objects, or built by
+hand with a pk) count every field as changed, so receivers behave as before.
+The snapshot is taken again after every save().
+"""
+import copy
+from functools import wraps
+
+from django.db.models.signals import post_save, pre_save
+
+
+class ChangeTrackingMixin:
+    # Field names to track; None tracks every concrete field
+    tracked_fields = None
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._take_snapshot()
+        return instance
+
+    def _tracked(self):
+        fields = self._meta.concrete_fields
+        if self.tracked_fields is not None:
+            fields = [field for field in fields if field.name in self.tracked_fields]
+        return fields
+
+    @staticmethod
+    def _comparable(field, value):
+        value = field.get_prep_value(value)
+        return copy.deepcopy(value) if isinstance(value, (dict, list)) else value
+
+    def _take_snapshot(self, names=None):
+        snapshot = self.__dict__.setdefault("_loaded_values", {})
+        for field in self._tracked():
+            # Deferred fields are not in __dict__ and stay unknown
+            if (names is None or field.name in names) and field.attname in self.__dict__:
+                snapshot[field.name] = self._comparable(field, self.__dict__[field.attname])
+
+    @property
+    def changed_fields(self):
+        snapshot = self.__dict__.get("_loaded_values")
+        changed = set()
+        for field in self._tracked():
+            if field.attname not in self.__dict__:
+                continue
+            if snapshot is None or field.name not in snapshot:
+                changed.add(field.name)
+            elif self._comparable(field, self.__dict__[field.attname]) != snapshot[field.name]:
+                changed.add(field.name)
+        return changed
+
+    def has_changed(self, *names):
+        changed = self.changed_fields
+        return any(name in changed for name in names) if names else bool(changed)
+
+    def loaded_value(self, name, default=None):
+        """The value `name` had when loaded (as stored in the database), or `default` if unknown."""
+        return self.__dict__.get("_loaded_values", {}).get(name, default)
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using=using, fields=fields, from_queryset=from_queryset)
+        self._take_snapshot(fields)
+
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        self._take_snapshot(set(update_fields) if update_fields is not None else None)
+
+
+def when_changed(*names):
+    """
+    Receiver decorator: on pre_save/post_save, only run for new instances or
+    when one of `names` changed. Other signals (deletes) always run.
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(sender, instance, **kwargs):
+            signal = kwargs.get("signal")
+            if signal is pre_save or signal is post_save:
+                created = kwargs.get("created", instance._state.adding)
+                if not created and not instance.has_changed(*names):
+                    return None
+            return func(sender, instance=instance, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,204 @@
+"""
+In-process autocomplete index for `ajax_search`.
+
+Every worker keeps a sorted list of (word, field, book_id) for the titles and
+authors of published books and answers prefix queries with bisect, so a
+keystroke never reaches Postgres unless the index has no match at all.
+
+Freshness:
+    * Book saves/deletes in this process patch the index once they commit (books.signals).
+    * Other processes notice the SEARCH cache generation change (checked at most
+      every REFRESH_INTERVAL seconds) and pull books updated since their last sync.
+    * A full rebuild every REBUILD_INTERVAL seconds catches deletes made elsewhere.
+
+Queries take no lock: every change builds a new (books, words) pair and swaps
+it in whole, so a query always works on one consistent snapshot.
+"""
+import bisect
+import heapq
+import re
+import threading
+import time
+import unicodedata
+from datetime import timedelta
+
+from django.utils import timezone
+
+from LeafyReads.cache import get_generation, SEARCH
+from books.models import Book
+
+REFRESH_INTERVAL = 30
+REBUILD_INTERVAL = 60 * 10
+
+TITLE = 0
+AUTHOR = 1
+
+WORD_RE = re.compile(r"\w+")
+
+
+def normalize(text):
+    text = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in text if not unicodedata.combining(c)).lower()
+
+
+def tokenize(text):
+    return WORD_RE.findall(normalize(text))
+
+
+class AutocompleteIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        # books: id -> (title, author, slug, likes_count); words: sorted (word, field, id).
+        # Never changed in place, only replaced (under _lock)
+        self._snapshot = ({}, [])
+        self._generation = None
+        self._synced_at = None
+        self._built = 0.0
+        self._checked = 0.0
+
+    # --- Maintenance ---
+
+    @staticmethod
+    def _entries(book_id, title, author):
+        words = {(word, TITLE, book_id) for word in tokenize(title)}
+        words |= {(word, AUTHOR, book_id) for word in tokenize(author)}
+        return words
+
+    def rebuild(self):
+        generation = get_generation(SEARCH)
+        synced_at = timezone.now()
+        books = {}
+        words = []
+        rows = (
+            Book.objects.filter(is_published=True)
+            .values_list("id", "title", "author", "slug", "likes_count")
+            .iterator(chunk_size=5000)
+        )
+        for book_id, title, author, slug, likes_count in rows:
+            books[book_id] = (title, author, slug, likes_count)
+            words.extend(self._entries(book_id, title, author))
+        words.sort()
+
+        # Swap in one go so readers never see a half-built index
+        self._snapshot = (books, words)
+        self._generation = generation
+        self._synced_at = synced_at
+        self._built = self._checked = time.monotonic()
+
+    def sync(self):
+        """Applies books changed since the last sync without a full rebuild."""
+        generation = get_generation(SEARCH)
+        # Small overlap so rows committed while we were syncing are not missed
+        since = self._synced_at - timedelta(seconds=5)
+        synced_at = timezone.now()
+        changed = Book.objects.filter(updated_at__gte=since).values_list(
+            "id", "title", "author", "slug", "likes_count", "is_published"
+        )
+        self._apply({
+            book_id: (title, author, slug, likes_count) if is_published else None
+            for book_id, title, author, slug, likes_count, is_published in changed
+        })
+        self._generation = generation
+        self._synced_at = synced_at
+
+    def _apply(self, changes):
+        """Swaps in a copy of the index with `changes` ({id: (title, author, slug, likes_count) or None to remove})."""
+        books, words = self._snapshot
+        books = dict(books)
+        stale = set()
+        fresh = set()
+        for book_id, book in changes.items():
+            old = books.pop(book_id, None)
+            if old is not None:
+                stale |= self._entries(book_id, old[0], old[1])
+            if book is not None:
+                books[book_id] = book
+                fresh |= self._entries(book_id, book[0], book[1])
+        if stale:
+            words = [entry for entry in words if entry not in stale]
+        if fresh:
+            words = list(heapq.merge(words, sorted(fresh)))
+        self._snapshot = (books, words)
+
+    def patch(self, book):
+        """Called from Book signals in this process, after the save commits."""
+        if self._generation is None:
+            return
+        with self._lock:
+            if book.is_published:
+                self._apply({book.id: (book.title, book.author, book.slug, book.likes_count)})
+            else:
+                self._apply({book.id: None})
+
+    def remove(self, book_id):
+        if self._generation is None:
+            return
+        with self._lock:
+            self._apply({book_id: None})
+
+    def ensure_fresh(self):
+        now = time.monotonic()
+        if self._generation is not None and now - self._checked < REFRESH_INTERVAL:
+            return
+        # Only one thread refreshes; the others keep serving the current index
+        if not self._lock.acquire(blocking=self._generation is None):
+            return
+        try:
+            if self._generation is None or now - self._built > REBUILD_INTERVAL:
+                self.rebuild()
+            elif now - self._checked >= REFRESH_INTERVAL:
+                self._checked = now
+                if get_generation(SEARCH) != self._generation:
+                    self.sync()
+        finally:
+            self._lock.release()
+
+    # --- Queries ---
+
+    @staticmethod
+    def _prefix_matches(words, prefix):
+        """{book_id: best field} for every book with a word starting with `prefix`."""
+        i = bisect.bisect_left(words, (prefix,))
+        matches = {}
+        while i < len(words) and words[i][0].startswith(prefix):
+            _, field, book_id = words[i]
+            if field < matches.get(book_id, AUTHOR + 1):
+                matches[book_id] = field
+            i += 1
+        return matches
+
+    def suggest(self, query, limit=8):
+        self.ensure_fresh()
+        terms = tokenize(query)
+        if not terms:
+            return []
+        books, words = self._snapshot
+
+        # Every term has to prefix-match a word of the title or the author
+        candidates = None
+        for term in terms:
+            matches = self._prefix_matches(words, term)
+            if candidates is None:
+                candidates = matches
+            else:
+                candidates = {
+                    book_id: max(field, matches[book_id])
+                    for book_id, field in candidates.items()
+                    if book_id in matches
+                }
+            if not candidates:
+                return []
+
+        # Title matches first, then the most liked
+        top = heapq.nsmallest(
+            limit,
+            (book_id for book_id in candidates if book_id in books),
+            key=lambda book_id: (candidates[book_id], -books[book_id][3], book_id),
+        )
+        return [
+            {"id": book_id, "title": books[book_id][0], "author": books[book_id][1], "slug": books[book_id][2]}
+            for book_id in top
+        ]
+
+
+index = AutocompleteIndex()
@@ -0,0 +1,272 @@
+"""
+Write-behind counters.
+
+Book views are buffered in a Redis hash (book_id -> pending views) and written
+to Book.views_count in bulk by `python manage.py flush_view_counts`, so the
+reader views never take a row lock on a hot book.
+
+Failed searches work the same way: a hash of query -> misses (plus one of
+query -> last seen) flushed into SearchQueryLog with one upsert per batch by
+`python manage.py flush_failed_searches`.
+
+A flush renames the pending hash to a snapshot and gives it an id in one
+Lua script, and writes it in the same transaction as a CounterFlush row for
+that id. The snapshot is only deleted after that commits (and only if it is
+still the same snapshot), so a flush that crashed in between is finished by
+the next run without applying the same deltas twice. Flushes that overlap
+(beat plus a manual command) finish the one snapshot together instead of
+renaming over it.
+"""
+import logging
+import time
+import uuid
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db import connection, transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+from django_redis import get_redis_connection
+
+from LeafyReads.cache import SESSIONS_ALIAS
+from books.models import Book, CounterFlush, SearchQueryLog
+
+logger = logging.getLogger(__name__)
+
+PENDING_VIEWS_KEY = "book_views:pending"
+FLUSHING_VIEWS_KEY = "book_views:flushing"
+FLUSHING_VIEWS_ID_KEY = "book_views:flushing_id"
+FLUSH_BATCH_SIZE = 500
+# CounterFlush rows only matter until their snapshot is deleted from Redis
+FLUSH_MARKER_MAX_AGE = timedelta(days=1)
+
+PENDING_SEARCHES_KEY = "failed_searches:pending"
+PENDING_SEARCHES_SEEN_KEY = "failed_searches:pending_seen"
+FLUSHING_SEARCHES_KEY = "failed_searches:flushing"
+FLUSHING_SEARCHES_SEEN_KEY = "failed_searches:flushing_seen"
+FLUSHING_SEARCHES_ID_KEY = "failed_searches:flushing_id"
+
+
+def _redis():
+    try:
+        # Durable alias: pending views must not be evicted before they are flushed
+        return get_redis_connection(SESSIONS_ALIAS)
+    except NotImplementedError:
+        # Cache backend is not django-redis (e.g. local dev), write through instead
+        return None
+
+
+# KEYS: id key, then (pending, flushing) pairs; ARGV: a new id.
+# Returns the id of the snapshot to flush: the one already there (left by a
+# crash, or being flushed right now by another run), else a new one made from
+# the pending keys; nil if there is nothing to flush.
+TAKE_SNAPSHOT = """
+local id = redis.call('GET', KEYS[1])
+if id then
+    return id
+end
+if redis.call('EXISTS', KEYS[3]) == 0 then
+    if redis.call('EXISTS', KEYS[2]) == 0 then
+        return nil
+    end
+    for i = 2, #KEYS, 2 do
+        if redis.call('EXISTS', KEYS[i]) == 1 then
+            redis.call('RENAME', KEYS[i], KEYS[i + 1])
+        end
+    end
+end
+redis.call('SET', KEYS[1], ARGV[1])
+return ARGV[1]
+"""
+
+# KEYS: id key, then the snapshot keys; ARGV: the id that was applied.
+# A late delete must not drop a newer snapshot taken since
+RELEASE_SNAPSHOT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', unpack(KEYS))
+end
+return 0
+"""
+
+
+def _take_snapshot(client, id_key, *pairs):
+    """The id of the snapshot to flush, or None if nothing is pending (see TAKE_SNAPSHOT)."""
+    keys = [id_key]
+    for pending, flushing in pairs:
+        keys += [pending, flushing]
+    snapshot_id = client.eval(TAKE_SNAPSHOT, len(keys), *keys, uuid.uuid4().hex)
+    return snapshot_id.decode() if isinstance(snapshot_id, bytes) else snapshot_id
+
+
+def _apply_once(client, snapshot_id, prefix, apply, id_key, *keys):
+    """
+    Runs apply() unless this snapshot was already applied, recording it in the same
+    transaction, and deletes the snapshot keys once that has committed.
+    Returns whether apply() ran.
+    """
+    with transaction.atomic():
+        # A concurrent flush of the same snapshot waits here and then finds the row
+        _, created = CounterFlush.objects.get_or_create(snapshot=f"{prefix}:{snapshot_id}")
+        if created:
+            apply()
+            CounterFlush.objects.filter(applied_at__lt=timezone.now() - FLUSH_MARKER_MAX_AGE).delete()
+        transaction.on_commit(
+            lambda: client.eval(RELEASE_SNAPSHOT, 1 + len(keys), id_key, *keys, snapshot_id)
+        )
+    return created
+
+
+def record_view(book_id):
+    """Counts one view of a book without touching the books table."""
+    client = _redis()
+    if client is not None:
+        try:
+            client.hincrby(PENDING_VIEWS_KEY, book_id, 1)
+            return
+        except Exception as e:
+            logger.error(f"Buffering view for book {book_id} failed: {e}")
+
+    Book.objects.filter(id=book_id).update(views_count=F("views_count") + 1)
+
+
+def pending_views(book_ids):
+    """Returns {book_id: views not yet flushed} for the given books."""
+    book_ids = list(book_ids)
+    client = _redis()
+    if client is None or not book_ids:
+        return {}
+
+    try:
+        values = client.hmget(PENDING_VIEWS_KEY, book_ids)
+        # A flush may be in progress; its deltas are not in the DB yet either
+        flushing = client.hmget(FLUSHING_VIEWS_KEY, book_ids)
+    except Exception:
+        return {}
+
+    pending = {}
+    for book_id, value, in_flight in zip(book_ids, values, flushing):
+        total = int(value or 0) + int(in_flight or 0)
+        if total:
+            pending[book_id] = total
+    return pending
+
+
+def overlay_pending_views(books):
+    """Adds unflushed views to views_count on already-loaded Book objects."""
+    books = list(books)
+    pending = pending_views(book.id for book in books)
+    for book in books:
+        book.views_count += pending.get(book.id, 0)
+    return books
+
+
+def flush_view_counts():
+    """
+    Moves the pending hash aside and applies it with one UPDATE per batch.
+    Returns the number of books updated.
+    """
+    client = _redis()
+    if client is None:
+        return 0
+
+    # Leftovers from a crashed or concurrent flush are applied before a new snapshot is taken
+    snapshot_id = _take_snapshot(client, FLUSHING_VIEWS_ID_KEY, (PENDING_VIEWS_KEY, FLUSHING_VIEWS_KEY))
+    if snapshot_id is None:
+        return 0
+
+    deltas = {
+        int(book_id): int(count)
+        for book_id, count in client.hgetall(FLUSHING_VIEWS_KEY).items()
+        if int(count) > 0
+    }
+
+    items = list(deltas.items())
+
+    def apply():
+        for start in range(0, len(items), FLUSH_BATCH_SIZE):
+            batch = items[start:start + FLUSH_BATCH_SIZE]
+            Book.objects.filter(id__in=[book_id for book_id, _ in batch]).update(
+                views_count=F("views_count") + Case(
+                    *[When(id=book_id, then=Value(count)) for book_id, count in batch],
+                    default=Value(0),
+                    output_field=IntegerField(),
+                )
+            )
+
+    # pending_views() still counts the snapshot until it is deleted, right after the commit
+    if not _apply_once(client, snapshot_id, "views", apply, FLUSHING_VIEWS_ID_KEY, FLUSHING_VIEWS_KEY):
+        return 0
+    return len(items)
+
+
+# --- Failed searches ---
+
+def record_failed_search(query):
+    """Counts one zero-result search for `query` without writing to the DB."""
+    client = _redis()
+    if client is not None:
+        try:
+            pipe = client.pipeline(transaction=False)
+            pipe.hincrby(PENDING_SEARCHES_KEY, query, 1)
+            pipe.hset(PENDING_SEARCHES_SEEN_KEY, query, int(time.time()))
+            pipe.execute()
+            return
+        except Exception as e:
+            logger.error(f"Buffering failed search {query!r} failed: {e}")
+
+    SearchQueryLog.objects.update_or_create(query=query, defaults={"count": F("count") + 1})
+
+
+def _upsert_failed_searches(rows):
+    """rows: [(query, misses, last_seen)]; adds the misses to existing rows in one statement."""
+    table = connection.ops.quote_name(SearchQueryLog._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} AS log (query, count, first_searched, last_searched)
+            SELECT q, c, seen, seen
+            FROM unnest(%s::varchar[], %s::integer[], %s::timestamptz[]) AS pending (q, c, seen)
+            ON CONFLICT (query) DO UPDATE
+            SET count = log.count + EXCLUDED.count,
+                last_searched = GREATEST(log.last_searched, EXCLUDED.last_searched)
+            """,
+            [[row[0] for row in rows], [row[1] for row in rows], [row[2] for row in rows]],
+        )
+
+
+def flush_failed_searches():
+    """
+    Moves the pending failed-search hashes aside and upserts them into
+    SearchQueryLog. Returns the number of distinct queries written.
+    """
+    client = _redis()
+    if client is None:
+        return 0
+
+    # Renamed together so counts and timestamps stay paired
+    snapshot_id = _take_snapshot(
+        client, FLUSHING_SEARCHES_ID_KEY,
+        (PENDING_SEARCHES_KEY, FLUSHING_SEARCHES_KEY),
+        (PENDING_SEARCHES_SEEN_KEY, FLUSHING_SEARCHES_SEEN_KEY),
+    )
+    if snapshot_id is None:
+        return 0
+
+    seen = client.hgetall(FLUSHING_SEARCHES_SEEN_KEY)
+    now = time.time()
+    rows = []
+    for query, count in client.hgetall(FLUSHING_SEARCHES_KEY).items():
+        last_seen = float(seen.get(query, now))
+        rows.append((
+            query.decode() if isinstance(query, bytes) else query,
+            int(count),
+            datetime.fromtimestamp(last_seen, tz=dt_timezone.utc),
+        ))
+
+    def apply():
+        for start in range(0, len(rows), FLUSH_BATCH_SIZE):
+            _upsert_failed_searches(rows[start:start + FLUSH_BATCH_SIZE])
+
+    keys = (FLUSHING_SEARCHES_KEY, FLUSHING_SEARCHES_SEEN_KEY)
+    if not _apply_once(client, snapshot_id, "searches", apply, FLUSHING_SEARCHES_ID_KEY, *keys):
+        return 0
+    return len(rows)
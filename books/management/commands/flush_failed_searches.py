@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from books.counters import flush_failed_searches
+
+
+class Command(BaseCommand):
+    help = "Writes buffered zero-result searches from Redis into SearchQueryLog. Celery beat runs it every 5 minutes (books.tasks.flush_failed_searches)."
+
+    def handle(self, *args, **options):
+        written = flush_failed_searches()
+        self.stdout.write(self.style.SUCCESS(f"Flushed {written} failed search term(s)."))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from books.counters import flush_view_counts
+
+
+class Command(BaseCommand):
+    help = "Writes buffered book views from Redis into Book.views_count. Celery beat runs it every minute (books.tasks.flush_view_counts)."
+
+    def handle(self, *args, **options):
+        updated = flush_view_counts()
+        self.stdout.write(self.style.SUCCESS(f"Flushed views for {updated} book(s)."))
@@ -0,0 +1,339 @@
+import random
+import uuid
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.contrib.postgres.search import SearchVector
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.utils.text import slugify
+
+from LeafyReads.cache import bump_generation, local_cache, COMMUNITY, HOME, LIBRARY, SEARCH
+from books.models import (
+    Book, BookContent, BookPage, Category, Genre, Like, ReadBy, ReadLater,
+    CONTENT_SEARCH_CONFIG, build_pages, build_search_document, page_text, sanitize_content, split_chunks,
+)
+from books.rows import HOME_CATEGORIES_KEY, LIBRARY_CATEGORIES_KEY, POPULAR_SIDEBAR_KEY
+from books.trending import update_trending_scores
+from community.models import Comment, Post
+from home.models import Notification
+
+WORDS = (
+    "river forest shadow light garden winter letter journey silent golden city night house "
+    "memory ocean mountain story secret voice window fire storm dream road morning promise "
+    "kingdom stranger island echo paper glass iron summer field empire thread lantern harbor "
+    "mirror orchard compass wander quiet broken hidden distant ancient bright falling last"
+).split()
+
+GENRES = {
+    "Fiction": ["Literary Fiction", "Historical Fiction", "Short Stories", "Classics"],
+    "Genre Fiction": ["Fantasy", "Science Fiction", "Mystery", "Thriller", "Romance", "Horror"],
+    "Non-Fiction": ["Biography", "History", "Science", "Philosophy", "Self Help", "Travel"],
+    "Young Readers": ["Children", "Young Adult", "Poetry", "Comics"],
+}
+
+LANGUAGES = ["English"] * 12 + ["Hindi"] * 4 + ["Spanish", "French", "German", "Bengali", "Tamil", "Urdu"]
+
+COVER = "image/upload/v1/samples/book-cover.jpg"
+CONTENT_TEMPLATES = 40
+
+
+def sentence(rng, words=12):
+    text = " ".join(rng.choice(WORDS) for _ in range(words))
+    return text[0].upper() + text[1:] + "."
+
+
+def skewed(rng, n):
+    """Index in [0, n) where low indexes are picked far more often (a few hits, a long tail)."""
+    return min(int(n * rng.random() ** 3), n - 1)
+
+
+class Command(BaseCommand):
+    help = (
+        "Loads a scale dataset (users, genres, books with content and pages, likes, read-laters, reads, "
+        "posts, comments, notifications) with bulk inserts. Per-row save() and signals are bypassed; "
+        "denormalized counters, trending scores and caches are brought up to date at the end."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--books", type=int, default=1000)
+        parser.add_argument("--users", type=int, help="Defaults to the number of books.")
+        parser.add_argument("--content-kb", type=int, default=30, help="Approximate size of each book's HTML.")
+        parser.add_argument("--likes-per-user", type=float, default=5)
+        parser.add_argument("--read-laters-per-user", type=float, default=3)
+        parser.add_argument("--reads-per-user", type=float, default=6)
+        parser.add_argument("--posts-per-user", type=float, default=0.5)
+        parser.add_argument("--comments-per-post", type=float, default=2)
+        parser.add_argument("--notifications-per-user", type=float, default=4)
+        parser.add_argument("--batch-size", type=int, default=2000)
+        parser.add_argument("--seed", type=int, default=1, help="Random seed, so runs are repeatable.")
+        parser.add_argument("--password", default="seed-password", help="Password of every seeded user.")
+
+    def log(self, message):
+        self.stdout.write(message)
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options["seed"])
+        self.batch = options["batch_size"]
+        # Unique per run, so seeding twice adds data instead of failing on unique slugs/usernames
+        self.tag = uuid.uuid4().hex[:6]
+
+        n_books = options["books"]
+        n_users = options["users"] or n_books
+
+        genres = self.seed_genres()
+        user_ids = self.seed_users(n_users, options["password"])
+        book_ids = self.seed_books(n_books, genres, user_ids, options["content_kb"])
+
+        self.seed_pairs(Like, user_ids, book_ids, options["likes_per_user"], "created_at")
+        self.seed_pairs(ReadLater, user_ids, book_ids, options["read_laters_per_user"], "saved_at")
+        self.seed_pairs(ReadBy, user_ids, book_ids, options["reads_per_user"], "readed_at")
+        post_ids = self.seed_posts(user_ids, book_ids, options["posts_per_user"])
+        self.seed_comments(user_ids, post_ids, options["comments_per_post"])
+        self.seed_post_likes(user_ids, post_ids, options["likes_per_user"])
+        self.seed_notifications(user_ids, post_ids, options["notifications_per_user"])
+
+        self.recount()
+        self.log(f"Trending scores updated for {update_trending_scores()} book(s).")
+
+        # Nothing above went through the signals that normally invalidate these
+        bump_generation(LIBRARY, SEARCH, HOME, COMMUNITY)
+        local_cache.delete_many([HOME_CATEGORIES_KEY, LIBRARY_CATEGORIES_KEY, POPULAR_SIDEBAR_KEY])
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(user_ids)} users and {len(book_ids)} books (run tag {self.tag})."
+        ))
+
+    # --- Helpers ---
+
+    def _batches(self, items):
+        for start in range(0, len(items), self.batch):
+            yield items[start:start + self.batch]
+
+    def _spread_dates(self, model, field, ids, days=365):
+        """auto_now_add stamps every bulk row with now(); spread them over the past year instead."""
+        if not ids:
+            return
+        table = connection.ops.quote_name(model._meta.db_table)
+        column = connection.ops.quote_name(model._meta.get_field(field).column)
+        pk = connection.ops.quote_name(model._meta.pk.column)
+        with connection.cursor() as cursor:
+            # Only the rows created here; ids of existing rows can fall in between
+            for batch in self._batches(ids):
+                cursor.execute(
+                    f"UPDATE {table} SET {column} = now() - random() * %s * interval '1 day' "
+                    f"WHERE {pk} = ANY(%s)",
+                    [days, list(batch)],
+                )
+
+    # --- Phases ---
+
+    def seed_genres(self):
+        for category_name, genre_names in GENRES.items():
+            category, _ = Category.objects.get_or_create(
+                slug=slugify(category_name), defaults={"name": category_name}
+            )
+            Genre.objects.bulk_create(
+                [Genre(category=category, name=name, slug=slugify(name)) for name in genre_names],
+                ignore_conflicts=True,
+            )
+        genres = list(Genre.objects.only("id", "name"))
+        self.log(f"{len(genres)} genres available.")
+        return genres
+
+    def seed_users(self, n, password):
+        hashed = make_password(password)  # hashing once, not n times, is most of the speedup
+        ids = []
+        for batch in self._batches(range(n)):
+            users = User.objects.bulk_create([
+                User(
+                    username=f"reader{i}_{self.tag}",
+                    email=f"reader{i}_{self.tag}@example.com",
+                    first_name=self.rng.choice(WORDS).title(),
+                    last_name=self.rng.choice(WORDS).title(),
+                    password=hashed,
+                )
+                for i in batch
+            ])
+            ids.extend(user.id for user in users)
+        self._spread_dates(User, "date_joined", ids)
+        self.log(f"{len(ids)} users.")
+        return ids
+
+    def _content_templates(self, size_kb):
+        """A few sanitized, chunked bodies shared by all books; sanitizing every book would dominate the run."""
+        templates = []
+        for _ in range(CONTENT_TEMPLATES):
+            parts = []
+            size = 0
+            while size < size_kb * 1024:
+                if self.rng.random() < 0.08:
+                    part = f"<h2>{sentence(self.rng, 4)}</h2>"
+                else:
+                    part = "<p>" + " ".join(sentence(self.rng, self.rng.randint(8, 20)) for _ in range(4)) + "</p>"
+                parts.append(part)
+                size += len(part)
+            html = sanitize_content("".join(parts))
+            chunks = split_chunks(html)
+            templates.append((html, chunks, [(page, page_text(page)) for page in build_pages(chunks)]))
+        return templates
+
+    def seed_books(self, n, genres, user_ids, content_kb):
+        templates = self._content_templates(content_kb)
+        ids = []
+        for batch in self._batches(range(n)):
+            books = []
+            for i in batch:
+                title = f"The {self.rng.choice(WORDS).title()} {self.rng.choice(WORDS).title()} {i} {self.tag}"
+                author = f"{self.rng.choice(WORDS).title()} {self.rng.choice(WORDS).title()}"
+                genre = self.rng.choice(genres)
+                slug = f"{slugify(title)}-by-{slugify(author)}"
+                published = self.rng.random() < 0.9
+                books.append(Book(
+                    title=title,
+                    slug=slug,
+                    author=author,
+                    genre=genre,
+                    summary=" ".join(sentence(self.rng) for _ in range(3)),
+                    book_language=self.rng.choice(LANGUAGES),
+                    uploaded_by_id=self.rng.choice(user_ids) if user_ids else None,
+                    cover_front=COVER,
+                    is_published=published,
+                    is_draft=not published,
+                    views_count=int(5000 * self.rng.random() ** 4),
+                    search_document=build_search_document(title, author, genre.name, slug),
+                ))
+
+            with transaction.atomic():
+                books = Book.objects.bulk_create(books)
+                choices = [self.rng.choice(templates) for _ in books]
+                contents = BookContent.objects.bulk_create([
+                    BookContent(book=book, content=html, chunks=chunks, page_count=len(pages))
+                    for book, (html, chunks, pages) in zip(books, choices)
+                ])
+                BookPage.objects.bulk_create(
+                    [
+                        BookPage(content=content, number=number, html=page, text=text)
+                        for content, (_, _, pages) in zip(contents, choices)
+                        for number, (page, text) in enumerate(pages, start=1)
+                    ],
+                    batch_size=self.batch,
+                )
+                BookPage.objects.filter(content__in=contents).update(
+                    search_vector=SearchVector("text", config=CONTENT_SEARCH_CONFIG)
+                )
+            ids.extend(book.id for book in books)
+            self.log(f"  books: {len(ids)}/{n}")
+
+        self._spread_dates(Book, "uploaded_at", ids)
+        return ids
+
+    def seed_pairs(self, model, user_ids, book_ids, per_user, date_field):
+        if not user_ids or not book_ids:
+            return
+        total = int(len(user_ids) * per_user)
+        pairs = {
+            (self.rng.choice(user_ids), book_ids[skewed(self.rng, len(book_ids))])
+            for _ in range(total)
+        }
+        ids = []
+        for batch in self._batches(list(pairs)):
+            created = model.objects.bulk_create([model(user_id=u, book_id=b) for u, b in batch])
+            ids.extend(obj.id for obj in created)
+        self._spread_dates(model, date_field, ids, days=30)
+        self.log(f"{len(ids)} {model._meta.verbose_name_plural}.")
+
+    def seed_posts(self, user_ids, book_ids, per_user):
+        total = int(len(user_ids) * per_user)
+        ids = []
+        for batch in self._batches(range(total)):
+            posts = []
+            for i in batch:
+                content = " ".join(sentence(self.rng) for _ in range(self.rng.randint(1, 4)))
+                posts.append(Post(
+                    author_id=self.rng.choice(user_ids),
+                    book_id=book_ids[skewed(self.rng, len(book_ids))] if self.rng.random() < 0.6 else None,
+                    content=content,
+                    slug=f"{slugify(content[:50])}-{self.tag}-{i}",
+                ))
+            ids.extend(post.id for post in Post.objects.bulk_create(posts))
+        self._spread_dates(Post, "created_at", ids, days=90)
+        self.log(f"{len(ids)} posts.")
+        return ids
+
+    def seed_comments(self, user_ids, post_ids, per_post):
+        if not post_ids:
+            return
+        total = int(len(post_ids) * per_post)
+        count = 0
+        for batch in self._batches(range(total)):
+            Comment.objects.bulk_create([
+                Comment(
+                    post_id=post_ids[skewed(self.rng, len(post_ids))],
+                    author_id=self.rng.choice(user_ids),
+                    content=sentence(self.rng),
+                )
+                for _ in batch
+            ])
+            count += len(batch)
+        self.log(f"{count} comments.")
+
+    def seed_post_likes(self, user_ids, post_ids, per_user):
+        if not post_ids:
+            return
+        through = Post.likes.through
+        pairs = {
+            (self.rng.choice(user_ids), post_ids[skewed(self.rng, len(post_ids))])
+            for _ in range(int(len(user_ids) * per_user))
+        }
+        for batch in self._batches(list(pairs)):
+            through.objects.bulk_create([through(user_id=u, post_id=p) for u, p in batch], ignore_conflicts=True)
+        self.log(f"{len(pairs)} post likes.")
+
+    def seed_notifications(self, user_ids, post_ids, per_user):
+        if not post_ids:
+            return
+        post_type = ContentType.objects.get_for_model(Post)
+        total = int(len(user_ids) * per_user)
+        for batch in self._batches(range(total)):
+            Notification.objects.bulk_create([
+                Notification(
+                    recipient_id=self.rng.choice(user_ids),
+                    actor_id=self.rng.choice(user_ids),
+                    message="liked your post.",
+                    notification_type="like",
+                    content_type=post_type,
+                    object_id=self.rng.choice(post_ids),
+                    is_read=self.rng.random() < 0.6,
+                )
+                for _ in batch
+            ])
+        self.log(f"{total} notifications.")
+
+    def recount(self):
+        """Recomputes every denormalized counter from the rows it summarizes."""
+        def count_of(model, field):
+            return Coalesce(
+                Subquery(
+                    model.objects.filter(**{field: OuterRef("pk")})
+                    .order_by()
+                    .values(field)
+                    .annotate(n=Count("*"))
+                    .values("n")
+                ),
+                Value(0),
+            )
+
+        with transaction.atomic():
+            Book.objects.update(
+                likes_count=count_of(Like, "book"),
+                read_later_count=count_of(ReadLater, "book"),
+            )
+            Post.objects.update(
+                likes_count=count_of(Post.likes.through, "post"),
+                comments_count=count_of(Comment, "post"),
+            )
+        self.log("Counters recomputed.")
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from books.trending import update_trending_scores
+
+
+class Command(BaseCommand):
+    help = "Folds new likes, saves and views into Book.trending_score. Celery beat runs it every 10 minutes (books.tasks.update_trending_scores)."
+
+    def handle(self, *args, **options):
+        updated = update_trending_scores()
+        self.stdout.write(self.style.SUCCESS(f"Updated trending scores for {updated} book(s)."))
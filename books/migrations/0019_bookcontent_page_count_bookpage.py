@@ -0,0 +1,59 @@
+# Generated by Django 5.2.2 on 2026-10-18 13:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+PAGE_BYTE_BUDGET = 12 * 1024
+
+
+def build_book_pages(apps, schema_editor):
+    BookContent = apps.get_model('books', 'BookContent')
+    BookPage = apps.get_model('books', 'BookPage')
+
+    for content in BookContent.objects.only('id', 'chunks').iterator(chunk_size=50):
+        pages = []
+        current, current_size = [], 0
+        for chunk in content.chunks or []:
+            size = len(chunk.encode('utf-8'))
+            if current and current_size + size > PAGE_BYTE_BUDGET:
+                pages.append(''.join(current))
+                current, current_size = [], 0
+            current.append(chunk)
+            current_size += size
+        if current:
+            pages.append(''.join(current))
+
+        BookPage.objects.bulk_create(
+            [BookPage(content_id=content.id, number=i, html=html) for i, html in enumerate(pages, start=1)],
+            batch_size=500,
+        )
+        BookContent.objects.filter(pk=content.pk).update(page_count=len(pages))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0018_genre_image'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookcontent',
+            name='page_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='BookPage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('number', models.PositiveIntegerField()),
+                ('html', models.TextField()),
+                ('content', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pages', to='books.bookcontent')),
+            ],
+            options={
+                'ordering': ['number'],
+                'unique_together': {('content', 'number')},
+            },
+        ),
+        migrations.RunPython(build_book_pages, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.2 on 2026-10-18 13:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0019_bookcontent_page_count_bookpage'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['-uploaded_at', '-id'], name='book_pub_newest_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['-likes_count', '-uploaded_at', '-id'], name='book_pub_popular_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(condition=models.Q(('is_published', True)), fields=['-views_count', '-uploaded_at', '-id'], name='book_pub_views_idx'),
+        ),
+    ]
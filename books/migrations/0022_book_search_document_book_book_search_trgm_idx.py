@@ -0,0 +1,33 @@
+# Generated by Django 5.2.2 on 2026-10-18 13:40
+
+import django.contrib.postgres.indexes
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0021_book_trending_engagement_book_trending_score_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='search_document',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunSQL(
+            """
+            UPDATE books_book AS b
+            SET search_document = concat_ws(' ', b.title, b.author,
+                (SELECT g.name FROM books_genre AS g WHERE g.id = b.genre_id), b.slug)
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_document'], name='book_search_trgm_idx', opclasses=['gin_trgm_ops']),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.2 on 2026-10-18 13:42
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import html
+import re
+from django.db import migrations, models
+from django.utils.html import strip_tags
+
+BLOCK_END_RE = re.compile(r'(</p>|</div>|</li>|</h\d>|</tr>|<br\s*/?>)', re.IGNORECASE)
+
+
+def fill_page_text(apps, schema_editor):
+    BookPage = apps.get_model('books', 'BookPage')
+
+    batch = []
+    for page in BookPage.objects.only('id', 'html').iterator(chunk_size=500):
+        page.text = html.unescape(strip_tags(BLOCK_END_RE.sub(r'\1\n', page.html))).strip()
+        batch.append(page)
+        if len(batch) >= 500:
+            BookPage.objects.bulk_update(batch, ['text'])
+            batch = []
+    if batch:
+        BookPage.objects.bulk_update(batch, ['text'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0022_book_search_document_book_book_search_trgm_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bookpage',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='bookpage',
+            name='text',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.RunPython(fill_page_text, migrations.RunPython.noop),
+        migrations.RunSQL(
+            "UPDATE books_bookpage SET search_vector = to_tsvector('english'::regconfig, text)",
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='bookpage',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='bookpage_search_idx'),
+        ),
+    ]
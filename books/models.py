@@ -1,14 +1,18 @@
-from django.db import models
+from django.db import models, transaction
 from django.contrib.auth.models import User
 from django.utils.text import slugify
 import os
 import re
+import html as html_lib
 import bleach
 from django.urls import reverse
 from cloudinary.models import CloudinaryField
 from django_ckeditor_5.fields import CKEditor5Field
 from django.contrib.postgres.indexes import GinIndex
+from django.contrib.postgres.search import SearchVector, SearchVectorField
+from django.utils.html import strip_tags
 from bleach.css_sanitizer import CSSSanitizer
+from LeafyReads.tracking import ChangeTrackingMixin
 
 def book_folder(instance):
     return f"books/{slugify(instance.title)}"
@@ -62,6 +66,21 @@ class Genre(models.Model):
         return self.name
 
 
+def build_search_document(title, author, genre_name, slug):
+    """Text the trigram search index is built on (title, author, genre and slug)."""
+    return " ".join(part for part in (title, author, genre_name, slug) if part)
+
+
+def next_free_slug(base_slug, taken):
+    """`base_slug`, or the first of `base_slug-1`, `base_slug-2`, ... that is not in `taken`."""
+    unique_slug = base_slug
+    counter = 1
+    while unique_slug in taken:
+        unique_slug = f"{base_slug}-{counter}"
+        counter += 1
+    return unique_slug
+
+
 class BookQuerySet(models.QuerySet):
     def with_related(self):
         return self.select_related("genre", "genre__category", "content")
@@ -69,7 +88,7 @@ class BookQuerySet(models.QuerySet):
 
 # BOOK MODEL
 
-class Book(models.Model):
+class Book(ChangeTrackingMixin, models.Model):
     title = models.CharField(max_length=200, unique=True)
     slug = models.SlugField(unique=True, max_length=255)
     author = models.CharField(max_length=100)
@@ -123,6 +142,13 @@ class Book(models.Model):
     read_later_count = models.PositiveIntegerField(default=0, db_index=True)
     views_count = models.PositiveIntegerField(default=0, db_index=True)
 
+    # Denormalized for the GIN trigram index used by search (see books/search.py)
+    search_document = models.TextField(default="", blank=True, editable=False)
+
+    # Maintained by `python manage.py update_trending` (see books/trending.py)
+    trending_score = models.FloatField(default=0)
+    trending_engagement = models.PositiveIntegerField(default=0)
+
     objects = BookQuerySet.as_manager()
 
     class Meta:
@@ -136,17 +162,60 @@ class Book(models.Model):
                 fields=['title', 'author', 'slug'],
                 opclasses=['gin_trgm_ops', 'gin_trgm_ops', 'gin_trgm_ops'],
             ),
+            GinIndex(
+                name='book_search_trgm_idx',
+                fields=['search_document'],
+                opclasses=['gin_trgm_ops'],
+            ),
+            # Keyset pagination over published books, one per library sort order
+            models.Index(
+                name='book_pub_newest_idx',
+                fields=['-uploaded_at', '-id'],
+                condition=models.Q(is_published=True),
+            ),
+            models.Index(
+                name='book_pub_popular_idx',
+                fields=['-likes_count', '-uploaded_at', '-id'],
+                condition=models.Q(is_published=True),
+            ),
+            models.Index(
+                name='book_pub_views_idx',
+                fields=['-views_count', '-uploaded_at', '-id'],
+                condition=models.Q(is_published=True),
+            ),
+            # Trending lists: overall, per genre and per language
+            models.Index(
+                name='book_pub_trending_idx',
+                fields=['-trending_score', '-id'],
+                condition=models.Q(is_published=True),
+            ),
+            models.Index(
+                name='book_genre_trending_idx',
+                fields=['genre', '-trending_score', '-id'],
+                condition=models.Q(is_published=True),
+            ),
+            models.Index(
+                name='book_lang_trending_idx',
+                fields=['book_language', '-trending_score', '-id'],
+                condition=models.Q(is_published=True),
+            ),
         ]
 
     def save(self, *args, **kwargs):
         if not self.pk:
             base_slug = f"{slugify(self.slug)}-by-{slugify(self.author)}"
-            unique_slug = base_slug
-            counter = 1
-            while Book.objects.filter(slug=unique_slug).exists():
-                unique_slug = f"{base_slug}-{counter}"
-                counter += 1
-            self.slug = unique_slug
+            taken = Book.objects.filter(slug__startswith=base_slug).values_list("slug", flat=True)
+            self.slug = next_free_slug(base_slug, set(taken))
+
+        # Only when its parts changed, so other saves never load the genre
+        if self.has_changed("title", "author", "genre", "slug"):
+            self.search_document = build_search_document(
+                self.title, self.author, self.genre.name if self.genre_id else None, self.slug
+            )
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None and {"title", "author", "genre", "slug"} & set(update_fields):
+                kwargs["update_fields"] = list(update_fields) + ["search_document"]
+
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -157,79 +226,164 @@ class Book(models.Model):
 
 
 
+# Reader pages are cut by size, not paragraph count, so one page row stays a few KB
+PAGE_BYTE_BUDGET = 12 * 1024
+
+
+def build_pages(chunks, budget=PAGE_BYTE_BUDGET):
+    """Groups consecutive chunks into pages of at most `budget` UTF-8 bytes."""
+    pages = []
+    current = []
+    current_size = 0
+
+    for chunk in chunks:
+        size = len(chunk.encode("utf-8"))
+        if current and current_size + size > budget:
+            pages.append("".join(current))
+            current = []
+            current_size = 0
+        current.append(chunk)
+        current_size += size
+
+    if current:
+        pages.append("".join(current))
+    return pages
+
+
+CONTENT_SEARCH_CONFIG = "english"
+BLOCK_END_RE = re.compile(r"(</p>|</div>|</li>|</h\d>|</tr>|<br\s*/?>)", re.IGNORECASE)
+
+
+def page_text(html):
+    """Plain text of a page; block ends become newlines so words don't run together."""
+    return html_lib.unescape(strip_tags(BLOCK_END_RE.sub(r"\1\n", html))).strip()
+
+
+def sanitize_content(html):
+    """Strips everything but the editor's formatting tags, attributes and styles."""
+    allowed_tags = [
+        'p', 'b', 'i', 'u', 'em', 'strong', 'a', 'span', 'div', 'br',
+        'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 
+        'ul', 'ol', 'li', 
+        'blockquote', 's', 'strike', 'del', 'sub', 'sup', 'mark', 'hr',
+        'pre', 'code',
+        'img', 'figure', 'figcaption',
+        'table', 'tbody', 'thead', 'tr', 'td', 'th', 'caption'
+    ]
+
+    allowed_attrs = {
+        '*': ['class', 'style'],
+        'a': ['href', 'rel', 'target'],
+        'img': ['src', 'alt', 'style', 'width', 'height'],
+        'table': ['border', 'cellpadding', 'cellspacing'],
+        'th': ['scope', 'colspan', 'rowspan'],
+        'td': ['colspan', 'rowspan'],
+    }
+    
+    # --- NEW CSS SANITIZER SETUP ---
+    allowed_css_properties = [
+        'color', 'font-weight', 'background-color', 'text-align', 
+        'font-size', 'font-family', 'list-style-type', 'width', 'height'
+    ]
+    css_sanitizer = CSSSanitizer(allowed_css_properties=allowed_css_properties)
+
+    return bleach.clean(
+        html, 
+        tags=allowed_tags, 
+        attributes=allowed_attrs, 
+        css_sanitizer=css_sanitizer,
+        strip=True
+    )
+
+
+def split_chunks(html):
+    """Splits sanitized HTML after every paragraph, div or line break."""
+    pattern = r'(</p>|</div>|<br\s*/?>)'
+    parts = re.split(pattern, html, flags=re.IGNORECASE)
+
+    clean_chunks = []
+    current_buffer = ""
+
+    for part in parts:
+        current_buffer += part
+        if re.match(pattern, part, re.IGNORECASE):
+            if re.search(r'\S', current_buffer):
+                clean_chunks.append(current_buffer)
+            current_buffer = "" 
+
+    if current_buffer.strip():
+        clean_chunks.append(current_buffer)
+
+    if len(clean_chunks) < 2 and len(html) > 1000:
+        clean_chunks = [html[i:i+1000] for i in range(0, len(html), 1000)]
+
+    return clean_chunks
+
+
 # BOOK CONTENT MODEL
-class BookContent(models.Model):
+class BookContent(ChangeTrackingMixin, models.Model):
     book = models.OneToOneField(Book, on_delete=models.CASCADE, related_name="content")
     content = CKEditor5Field("content", config_name="extends")
     chunks = models.JSONField(default=list, blank=True)
+    page_count = models.PositiveIntegerField(default=0)
     updated_at = models.DateTimeField(auto_now=True)
 
+    # chunks and pages are derived from content, no need to snapshot them
+    tracked_fields = ("book", "content")
+
     def save(self, *args, **kwargs):
+        if not self._state.adding and not self.has_changed("content"):
+            # Same HTML as stored: keep the chunks, pages and search vectors
+            super().save(*args, **kwargs)
+            return
+
         if self.content:
             # --- 1. SECURITY: Sanitize HTML (Prevent XSS) ---
-            allowed_tags = [
-                'p', 'b', 'i', 'u', 'em', 'strong', 'a', 'span', 'div', 'br',
-                'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 
-                'ul', 'ol', 'li', 
-                'blockquote', 's', 'strike', 'del', 'sub', 'sup', 'mark', 'hr',
-                'pre', 'code',
-                'img', 'figure', 'figcaption',
-                'table', 'tbody', 'thead', 'tr', 'td', 'th', 'caption'
-            ]
-
-            allowed_attrs = {
-                '*': ['class', 'style'],
-                'a': ['href', 'rel', 'target'],
-                'img': ['src', 'alt', 'style', 'width', 'height'],
-                'table': ['border', 'cellpadding', 'cellspacing'],
-                'th': ['scope', 'colspan', 'rowspan'],
-                'td': ['colspan', 'rowspan'],
-            }
-            
-            # --- NEW CSS SANITIZER SETUP ---
-            allowed_css_properties = [
-                'color', 'font-weight', 'background-color', 'text-align', 
-                'font-size', 'font-family', 'list-style-type', 'width', 'height'
-            ]
-            css_sanitizer = CSSSanitizer(allowed_css_properties=allowed_css_properties)
-
-            # Clean the content
-            self.content = bleach.clean(
-                self.content, 
-                tags=allowed_tags, 
-                attributes=allowed_attrs, 
-                css_sanitizer=css_sanitizer,  # <--- CHANGED THIS ARGUMENT
-                strip=True
-            )
-            
+            self.content = sanitize_content(self.content)
+
             # --- 2. CHUNKING LOGIC ---
-            pattern = r'(</p>|</div>|<br\s*/?>)'
-            parts = re.split(pattern, self.content, flags=re.IGNORECASE)
+            self.chunks = split_chunks(self.content)
+        else:
+            self.chunks = []
 
-            clean_chunks = []
-            current_buffer = ""
+        # --- 3. PAGE STORAGE (one row per reader page) ---
+        pages = build_pages(self.chunks)
+        self.page_count = len(pages)
+
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            self.pages.all().delete()
+            BookPage.objects.bulk_create(
+                [
+                    BookPage(content=self, number=i, html=html, text=page_text(html))
+                    for i, html in enumerate(pages, start=1)
+                ],
+                batch_size=500,
+            )
+            # --- 4. FULL-TEXT INDEX (tsvector per page, GIN indexed) ---
+            self.pages.update(search_vector=SearchVector("text", config=CONTENT_SEARCH_CONFIG))
 
-            for part in parts:
-                current_buffer += part
-                if re.match(pattern, part, re.IGNORECASE):
-                    if re.search(r'\S', current_buffer):
-                        clean_chunks.append(current_buffer)
-                    current_buffer = "" 
+    def __str__(self):
+        return f"Content for {self.book.title}"
 
-            if current_buffer.strip():
-                clean_chunks.append(current_buffer)
 
-            if len(clean_chunks) < 2 and len(self.content) > 1000:
-                clean_chunks = [self.content[i:i+1000] for i in range(0, len(self.content), 1000)]
+class BookPage(models.Model):
+    content = models.ForeignKey(BookContent, on_delete=models.CASCADE, related_name="pages")
+    number = models.PositiveIntegerField()
+    html = models.TextField()
+    # Plain text of the page, what the full-text index and snippets are built on
+    text = models.TextField(default="", blank=True)
+    search_vector = SearchVectorField(null=True, editable=False)
 
-            self.chunks = clean_chunks
-        else:
-            self.chunks = []
-            
-        super().save(*args, **kwargs)
+    class Meta:
+        ordering = ["number"]
+        unique_together = ("content", "number")
+        indexes = [
+            GinIndex(fields=["search_vector"], name="bookpage_search_idx"),
+        ]
 
     def __str__(self):
-        return f"Content for {self.book.title}"
+        return f"Page {self.number} of {self.content_id}"
 
 # REVIEW MODEL
 
@@ -309,6 +463,15 @@ class ReadBy(models.Model):
     
 
 
+class CounterFlush(models.Model):
+    """A snapshot of buffered counters (books.counters) already written to the DB."""
+    snapshot = models.CharField(max_length=64, unique=True)
+    applied_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return self.snapshot
+
+
 class SearchQueryLog(models.Model):
     query = models.CharField(max_length=255, unique=True, db_index=True)
     count = models.PositiveIntegerField(default=1)
@@ -0,0 +1,41 @@
+"""Compact cache projections of book models for list templates (see LeafyReads.rows)."""
+from LeafyReads.cache import local_cache
+from LeafyReads.rows import RowSpec, rows_key
+from books.models import Book, Genre, ReadBy
+
+GENRES_TIMEOUT = 60 * 60 * 24
+
+# Keys of the packed lists, versioned with the row layout
+HOME_CATEGORIES_KEY = rows_key("home_categories")
+LIBRARY_CATEGORIES_KEY = rows_key("library_categories")
+POPULAR_SIDEBAR_KEY = rows_key("popular_books_sidebar")
+
+
+def recent_reads_key(user_id):
+    return rows_key(f"library_recent_user_{user_id}")
+
+# Category cards and filter chips
+GENRE_ROWS = RowSpec(Genre, ["id", "name", "slug", "lucidicon", "image"])
+
+
+
+def cached_genres(key=LIBRARY_CATEGORIES_KEY):
+    """All genres (ordered by name) as rows, from process memory in the common case.
+    Dropped by books.signals.invalidate_genre_caches."""
+    packed = local_cache.get(key)
+    if packed is None:
+        packed = GENRE_ROWS.pack(Genre.objects.all())
+        local_cache.set(key, packed, timeout=GENRES_TIMEOUT)
+    return GENRE_ROWS.unpack(packed)
+
+
+# Book cards in the library grid and list views
+BOOK_CARD_ROWS = RowSpec(Book, [
+    "id", "title", "slug", "author", "summary", "cover_front",
+    "likes_count", "views_count", "is_published",
+])
+
+# "Recently read" shelves and the community sidebar
+READ_BY_ROWS = RowSpec(ReadBy, [
+    "id", "book__id", "book__title", "book__slug", "book__author", "book__cover_front",
+])
@@ -0,0 +1,136 @@
+"""
+Book search.
+
+Title search is two-stage:
+1. Candidates: `search_document %> query` (word similarity at least
+   settings.SEARCH_WORD_SIMILARITY_THRESHOLD), which Postgres answers from
+   the GIN trigram index `book_search_trgm_idx` instead of scanning the table.
+2. Rerank: a weighted sum of TrigramSimilarity over title, author, genre and
+   slug, computed for those candidates only and kept above 0.05.
+
+The gate costs recall. The weighted cutoff alone passes rows that share very
+few trigrams with the query, and no threshold that keeps all of those filters
+anything. Measured on a seed_scale_data catalogue of 45k published books with
+30 queries (titles, authors, genres, typos, long phrases), the default 0.3:
+    * made a first page plus its count about 2.3x faster (median 1.4s -> 0.5s);
+    * left the first 50 results unchanged for 29 of the 30 queries;
+    * dropped about two thirds of the low-scoring tail past the first page;
+    * cut long phrases hardest: "best horror books about storms" went from
+      27.7k weak matches to 290, losing 13 of its first 50.
+0.2 kept every first page but was only 1.5x faster. 0 turns the gate off.
+
+Content search ("inside books") matches BookPage.search_vector, a tsvector
+per reader page on the GIN index `bookpage_search_idx`. Books are ranked by
+their best page, and ts_headline snippets are only built for the books that
+end up on the results page.
+"""
+from django.conf import settings
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, TrigramSimilarity
+from django.db.models import F, Func, OuterRef, Q, Subquery, TextField
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from books.models import BookPage, CONTENT_SEARCH_CONFIG, Genre
+
+# ts_headline markers, swapped for <mark> after the snippet text is escaped
+START_SEL = "\x02"
+STOP_SEL = "\x03"
+
+
+def set_word_similarity_threshold(connection):
+    """Sets the candidate gate's threshold for a new database connection."""
+    threshold = settings.SEARCH_WORD_SIMILARITY_THRESHOLD
+    if threshold and connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT set_config('pg_trgm.word_similarity_threshold', %s, false)",
+                [str(threshold)],
+            )
+
+
+def refresh_search_documents(queryset):
+    """Rebuilds search_document in SQL, e.g. for every book of a renamed genre."""
+    genre_name = Genre.objects.filter(id=OuterRef("genre_id")).values("name")[:1]
+    return queryset.update(
+        search_document=Func(
+            F("title"), F("author"), Subquery(genre_name), F("slug"),
+            function="concat_ws",
+            template="%(function)s(' ', %(expressions)s)",
+            output_field=TextField(),
+        )
+    )
+
+
+def search_books(queryset, query, genre_weight=0.6):
+    """Filters `queryset` to trigram matches of `query` and annotates `similarity`."""
+    if settings.SEARCH_WORD_SIMILARITY_THRESHOLD:
+        queryset = queryset.filter(search_document__trigram_word_similar=query)
+    return (
+        queryset.annotate(
+            similarity=(
+                TrigramSimilarity('title', query) * 1.0 +
+                TrigramSimilarity('author', query) * 0.8 +
+                TrigramSimilarity('genre__name', query) * genre_weight +
+                TrigramSimilarity('slug', query) * 0.5
+            )
+        )
+        .filter(similarity__gt=0.05)
+    )
+
+
+def _content_query(query):
+    return SearchQuery(query, config=CONTENT_SEARCH_CONFIG, search_type="websearch")
+
+
+def search_content(queryset, query):
+    """
+    Filters `queryset` to books whose text matches `query` and annotates
+    `content_rank` and `match_page` (number of the best matching page).
+    """
+    search_query = _content_query(query)
+    matching_pages = BookPage.objects.filter(search_vector=search_query)
+    best_page = (
+        matching_pages.filter(content__book_id=OuterRef("pk"))
+        .annotate(rank=SearchRank(F("search_vector"), search_query))
+        .order_by("-rank", "number")
+    )
+    return (
+        # Semi-join on the GIN index first, so only matching books get ranked
+        queryset.filter(id__in=matching_pages.values("content__book_id"))
+        .annotate(
+            content_rank=Subquery(best_page.values("rank")[:1]),
+            match_page=Subquery(best_page.values("number")[:1]),
+        )
+    )
+
+
+def attach_snippets(books, query):
+    """Sets `snippet` (safe HTML with <mark> highlights) on books from search_content()."""
+    books = list(books)
+    if not books:
+        return books
+
+    pages = Q()
+    for book in books:
+        pages |= Q(content__book_id=book.id, number=book.match_page)
+
+    headlines = dict(
+        BookPage.objects.filter(pages)
+        .annotate(
+            snippet=SearchHeadline(
+                "text",
+                _content_query(query),
+                config=CONTENT_SEARCH_CONFIG,
+                start_sel=START_SEL,
+                stop_sel=STOP_SEL,
+                max_words=35,
+                min_words=15,
+                max_fragments=2,
+            )
+        )
+        .values_list("content__book_id", "snippet")
+    )
+    for book in books:
+        snippet = escape(headlines.get(book.id, ""))
+        book.snippet = mark_safe(snippet.replace(START_SEL, "<mark>").replace(STOP_SEL, "</mark>"))
+    return books
@@ -0,0 +1,107 @@
+from celery import shared_task
+from django.contrib.contenttypes.models import ContentType
+from django.db import IntegrityError, transaction
+from django.template.loader import render_to_string
+from django.utils.html import strip_tags
+from LeafyReads.cache import bump_generation, SEARCH
+from LeafyReads.tasks import task_key
+from books import counters, trending
+from books.models import Book
+from books.search import refresh_search_documents
+from home.models import Notification
+from home.notifications import forget_notifications_many
+from home.outbox import queue_emails
+
+
+def book_published_notification(book):
+    """The unsaved 'your book is live' notification for the uploader."""
+    display_title = (book.title[:30] + '..') if len(book.title) > 30 else book.title
+    return Notification(
+        recipient=book.uploaded_by,
+        notification_type='book_published', 
+        message=f'<strong>Congratulations!</strong> Your book <strong>{display_title}</strong> is now LIVE 🚀.',
+        content_type=ContentType.objects.get_for_model(Book),
+        object_id=book.id
+    )
+
+
+def book_published_email(book):
+    """queue_email() arguments for the 'your book is live' e-mail, or None if the uploader has no address."""
+    user = book.uploaded_by
+    
+    # Check 1: Does user have an email?
+    if not user or not user.email:
+        return None
+
+    subject = f"Your book '{book.title}' is now LIVE! 🚀"
+    
+    # Generate URL 
+    book_url = f"https://leafyreads.com/book/library/book-details/{book.slug}/"
+    
+    # Check 2: Does book have a cover? (Avoid template crash)
+    cover_url = book.cover_front.url if book.cover_front else ""
+
+    # Render HTML Template
+    context = {
+        'user': user,
+        'book': book,
+        'book_url': book_url,
+        'cover_url': cover_url 
+    }
+    
+    # Load 'templates/emails/book_published.html'
+    html_message = render_to_string('emails/book_published.html', context)
+    plain_message = strip_tags(html_message) # Fallback text
+    return {
+        'subject': subject,
+        'body': plain_message,
+        'recipient_list': [user.email],
+        'html_message': html_message,
+    }
+
+@shared_task(bind=True)
+def notify_books_published(self, book_ids):
+    """The 'your book is live' notification and e-mail for each uploader."""
+    books = [
+        book for book in Book.objects.filter(id__in=book_ids, is_published=True).select_related("uploaded_by")
+        if book.uploaded_by_id
+    ]
+    if not books:
+        return
+    notifications = [book_published_notification(book) for book in books]
+    for book, notification in zip(books, notifications):
+        notification.task_key = task_key(self, book.id)
+    try:
+        # Mail is queued with the notifications, so a redelivered task that
+        # hits their task_keys queues none either
+        with transaction.atomic():
+            Notification.objects.bulk_create(notifications)
+            # Sent by the send_outbox worker
+            queue_emails([email for email in map(book_published_email, books) if email])
+    except IntegrityError:
+        return
+    # bulk_create skips the unread counter receiver
+    forget_notifications_many(book.uploaded_by_id for book in books)
+
+
+@shared_task
+def refresh_genre_search(genre_id):
+    refresh_search_documents(Book.objects.filter(genre_id=genre_id))
+    bump_generation(SEARCH)
+
+
+# --- Periodic (CELERY_BEAT_SCHEDULE) ---
+
+@shared_task
+def flush_view_counts():
+    return counters.flush_view_counts()
+
+
+@shared_task
+def flush_failed_searches():
+    return counters.flush_failed_searches()
+
+
+@shared_task
+def update_trending_scores():
+    return trending.update_trending_scores()
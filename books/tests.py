@@ -1 +1,752 @@
-# Create your tests here.
+import pickle
+import threading
+import time
+import uuid
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from LeafyReads import cache as shared_cache
+from LeafyReads.cache import bump_generation, get_generation, get_or_compute, hot_cache, TieredCache, HOME, LIBRARY, SEARCH
+from LeafyReads.pagination import CursorPaginator, _encode
+from LeafyReads.rows import Row, RowSpec, pack_page, unpack_page
+from LeafyReads.tracking import when_changed
+from books import autocomplete, counters, trending
+from books.autocomplete import AutocompleteIndex
+from books.models import Book, BookContent, Category, CounterFlush, Genre, ReadBy, SearchQueryLog
+from books.rows import BOOK_CARD_ROWS, GENRE_ROWS, READ_BY_ROWS
+from books.views import stored_language
+
+# Views render {% static %}; the manifest storage needs collectstatic first
+PLAIN_STATIC = {**settings.STORAGES, "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"}}
+
+
+class RowSpecTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("reader", password="x", first_name="Ada", last_name="Reader")
+        category = Category.objects.create(name="Fiction", slug="fiction")
+        cls.genre = Genre.objects.create(
+            category=category, name="Fantasy", slug="fantasy", lucidicon="wand", image="genres/fantasy"
+        )
+        cls.book = Book.objects.create(
+            title="The Hobbit", slug="the-hobbit", author="Tolkien", genre=cls.genre,
+            cover_front="books/hobbit", likes_count=3, is_published=True,
+        )
+        cls.orphan = Book.objects.create(
+            title="No Genre", slug="no-genre", author="Anon", cover_front="books/none", is_published=True,
+        )
+        cls.read = ReadBy.objects.create(user=cls.user, book=cls.book)
+
+    def test_queryset_and_instances_pack_the_same(self):
+        queryset = Genre.objects.filter(pk=self.genre.pk)
+        self.assertEqual(GENRE_ROWS.pack(queryset), GENRE_ROWS.pack(list(queryset)))
+
+    def test_round_trip_keeps_field_values(self):
+        [row] = BOOK_CARD_ROWS.unpack(BOOK_CARD_ROWS.pack(Book.objects.filter(pk=self.book.pk)))
+        for name in BOOK_CARD_ROWS.fields:
+            self.assertEqual(str(getattr(row, name)), str(getattr(self.book, name)), name)
+        self.assertEqual(row.pk, self.book.pk)
+
+    def test_cloudinary_fields_are_stored_as_strings(self):
+        genre = Genre.objects.get(pk=self.genre.pk)
+        [packed] = GENRE_ROWS.pack([genre])
+        stored = Genre._meta.get_field("image").get_prep_value(genre.image)
+        self.assertEqual(packed[GENRE_ROWS.fields.index("image")], stored)
+        [row] = GENRE_ROWS.unpack([packed])
+        self.assertEqual(row.image.public_id, "genres/fantasy")
+
+    def test_related_fields_become_nested_rows(self):
+        [row] = READ_BY_ROWS.unpack(READ_BY_ROWS.pack(ReadBy.objects.filter(pk=self.read.pk)))
+        self.assertIsInstance(row.book, Row)
+        self.assertEqual(row.book.title, "The Hobbit")
+        self.assertEqual(row.book, self.book)
+        self.assertEqual(str(row.book), "The Hobbit")
+
+    def test_null_foreign_key_unpacks_as_none(self):
+        spec = RowSpec(Book, ["id", "title", "genre__id", "genre__name"])
+        rows = spec.unpack(spec.pack(Book.objects.filter(pk__in=[self.book.pk, self.orphan.pk]).order_by("id")))
+        self.assertEqual(rows[0].genre.name, "Fantasy")
+        self.assertIsNone(rows[1].genre)
+
+    def test_model_methods_run_on_rows(self):
+        spec = RowSpec(User, ["id", "first_name", "last_name"])
+        [row] = spec.unpack(spec.pack([self.user]))
+        self.assertEqual(row.get_full_name(), "Ada Reader")
+        self.assertEqual(row, self.user)
+
+    def test_missing_field_raises(self):
+        [row] = GENRE_ROWS.unpack(GENRE_ROWS.pack([self.genre]))
+        with self.assertRaises(AttributeError):
+            row.category
+
+    def test_rows_pickle(self):
+        [row] = READ_BY_ROWS.unpack(READ_BY_ROWS.pack([self.read]))
+        copy = pickle.loads(pickle.dumps(row))
+        self.assertEqual(copy, row)
+        self.assertEqual(copy.book.title, "The Hobbit")
+
+    def test_cursor_page_round_trip(self):
+        books = Book.objects.filter(is_published=True).only(*BOOK_CARD_ROWS.fields, "uploaded_at")
+        page = CursorPaginator(books, 1).get_page("")
+        restored = unpack_page(BOOK_CARD_ROWS, pack_page(BOOK_CARD_ROWS, page))
+        self.assertEqual([row.pk for row in restored], [book.pk for book in page])
+        self.assertEqual(restored.next_cursor, page.next_cursor)
+
+
+class ChangeTrackingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(
+            title="Emma", slug="emma", author="Austen", summary="Matchmaking", cover_front="books/emma"
+        )
+
+    def setUp(self):
+        self.loaded = Book.objects.get(pk=self.book.pk)
+
+    def test_loaded_instance_is_clean(self):
+        self.assertEqual(self.loaded.changed_fields, set())
+        self.assertFalse(self.loaded.has_changed())
+
+    def test_changes_are_reported(self):
+        self.loaded.title = "Persuasion"
+        self.assertEqual(self.loaded.changed_fields, {"title"})
+        self.assertTrue(self.loaded.has_changed("title", "author"))
+        self.assertFalse(self.loaded.has_changed("author"))
+        self.assertEqual(self.loaded.loaded_value("title"), "Emma")
+
+    def test_setting_the_same_value_is_not_a_change(self):
+        self.loaded.title = "Emma"
+        self.loaded.price = None
+        self.assertEqual(self.loaded.changed_fields, set())
+
+    def test_unsaved_instances_count_every_field_as_changed(self):
+        book = Book(title="New", author="Someone")
+        self.assertIn("title", book.changed_fields)
+        self.assertIn("summary", book.changed_fields)
+        self.assertIsNone(book.loaded_value("title"))
+
+    def test_deferred_fields_are_unknown_until_loaded(self):
+        book = Book.objects.only("id", "title").get(pk=self.book.pk)
+        self.assertEqual(book.changed_fields, set())
+        self.assertIsNone(book.loaded_value("summary"))
+
+        # Loading the deferred field snapshots it too
+        self.assertEqual(book.summary, "Matchmaking")
+        self.assertEqual(book.loaded_value("summary"), "Matchmaking")
+        self.assertEqual(book.changed_fields, set())
+
+        book.summary = "Changed"
+        self.assertEqual(book.changed_fields, {"summary"})
+
+    def test_deferred_field_assigned_without_loading_counts_as_changed(self):
+        book = Book.objects.only("id", "title").get(pk=self.book.pk)
+        book.summary = "Matchmaking"
+        self.assertEqual(book.changed_fields, {"summary"})
+
+    def test_save_takes_a_new_snapshot(self):
+        self.loaded.title = "Persuasion"
+        self.loaded.save()
+        self.assertEqual(self.loaded.changed_fields, set())
+        self.assertEqual(self.loaded.loaded_value("title"), "Persuasion")
+
+    def test_save_with_update_fields_only_snapshots_those_fields(self):
+        self.loaded.title = "Persuasion"
+        self.loaded.summary = "Second chances"
+        self.loaded.save(update_fields=["title"])
+        self.assertEqual(self.loaded.changed_fields, {"summary"})
+        self.assertEqual(self.loaded.loaded_value("title"), "Persuasion")
+        self.assertEqual(self.loaded.loaded_value("summary"), "Matchmaking")
+
+    def test_refresh_from_db_takes_a_new_snapshot(self):
+        Book.objects.filter(pk=self.book.pk).update(author="Jane Austen")
+        self.loaded.refresh_from_db(fields=["author"])
+        self.assertEqual(self.loaded.loaded_value("author"), "Jane Austen")
+        self.assertEqual(self.loaded.changed_fields, set())
+
+    def test_summary_only_save_is_one_update(self):
+        generations = [get_generation(family) for family in (LIBRARY, SEARCH, HOME)]
+        self.loaded.summary = "Second chances"
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks() as callbacks:
+            self.loaded.save()
+        self.assertEqual(len(queries), 1, [query["sql"] for query in queries])
+        self.assertTrue(queries[0]["sql"].startswith("UPDATE"))
+        self.assertEqual(callbacks, [])
+        self.assertEqual([get_generation(family) for family in (LIBRARY, SEARCH, HOME)], generations)
+
+    def test_search_document_follows_its_fields(self):
+        self.loaded.title = "Persuasion"
+        self.loaded.save(update_fields=["title"])
+        self.assertEqual(
+            Book.objects.values_list("search_document", flat=True).get(pk=self.book.pk),
+            self.loaded.search_document,
+        )
+        self.assertIn("Persuasion", self.loaded.search_document)
+
+    def test_tracked_fields_limit_what_is_tracked(self):
+        content = BookContent.objects.create(book=self.book, content="<p>Hello</p>")
+        content = BookContent.objects.get(pk=content.pk)
+        content.page_count = 99
+        self.assertEqual(content.changed_fields, set())
+        content.content = "<p>Bye</p>"
+        self.assertEqual(content.changed_fields, {"content"})
+
+
+class WhenChangedTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.book = Book.objects.create(title="Emma", slug="emma", author="Austen", cover_front="books/emma")
+
+    def setUp(self):
+        self.calls = []
+
+        @when_changed("title", "author")
+        def receiver(sender, instance, **kwargs):
+            self.calls.append(instance)
+            return "ran"
+
+        self.receiver = receiver
+        self.loaded = Book.objects.get(pk=self.book.pk)
+
+    def test_skips_saves_that_do_not_touch_the_fields(self):
+        self.loaded.summary = "Matchmaking"
+        self.assertIsNone(self.receiver(Book, instance=self.loaded, signal=pre_save))
+        self.assertIsNone(self.receiver(Book, instance=self.loaded, signal=post_save, created=False))
+        self.assertEqual(self.calls, [])
+
+    def test_runs_when_a_field_changed(self):
+        self.loaded.author = "Jane Austen"
+        self.assertEqual(self.receiver(Book, instance=self.loaded, signal=pre_save), "ran")
+        self.assertEqual(self.receiver(Book, instance=self.loaded, signal=post_save, created=False), "ran")
+
+    def test_runs_for_new_instances(self):
+        book = Book(title="New", author="Someone")
+        self.assertEqual(self.receiver(Book, instance=book, signal=pre_save), "ran")
+        self.assertEqual(self.receiver(Book, instance=self.loaded, signal=post_save, created=True), "ran")
+
+    def test_other_signals_always_run(self):
+        self.assertEqual(self.receiver(Book, instance=self.loaded, signal=post_delete), "ran")
+
+    def test_connected_receiver_sees_real_saves(self):
+        post_save.connect(self.receiver, sender=Book)
+        self.addCleanup(post_save.disconnect, self.receiver, sender=Book)
+
+        self.loaded.summary = "Matchmaking"
+        self.loaded.save()
+        self.assertEqual(self.calls, [])
+
+        self.loaded.title = "Persuasion"
+        self.loaded.save()
+        self.assertEqual(self.calls, [self.loaded])
+
+
+class AutocompleteIndexTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.dune = Book.objects.create(
+            title="Dune", slug="dune", author="Frank Herbert", cover_front="books/dune",
+            likes_count=5, is_published=True,
+        )
+        cls.messiah = Book.objects.create(
+            title="Dune Messiah", slug="dune-messiah", author="Frank Herbert", cover_front="books/messiah",
+            likes_count=9, is_published=True,
+        )
+        cls.dunes = Book.objects.create(
+            title="Sand", slug="sand", author="Ann Dunestone", cover_front="books/sand",
+            likes_count=50, is_published=True,
+        )
+        cls.draft = Book.objects.create(
+            title="Dune Draft", slug="dune-draft", author="Nobody", cover_front="books/draft",
+        )
+
+    def setUp(self):
+        self.index = AutocompleteIndex()
+        self.index.rebuild()
+
+    def titles(self, query, **kwargs):
+        return [book["title"] for book in self.index.suggest(query, **kwargs)]
+
+    def test_suggest_prefers_title_matches_then_likes(self):
+        self.assertEqual(self.titles("dun"), ["Dune Messiah", "Dune", "Sand"])
+
+    def test_suggest_returns_what_the_dropdown_needs(self):
+        [book] = self.index.suggest("sand")
+        self.assertEqual(
+            book, {"id": self.dunes.id, "title": "Sand", "author": "Ann Dunestone", "slug": self.dunes.slug}
+        )
+
+    def test_every_term_has_to_match(self):
+        self.assertEqual(self.titles("dune mes"), ["Dune Messiah"])
+        self.assertEqual(self.titles("frank dun"), ["Dune Messiah", "Dune"])
+        self.assertEqual(self.titles("dune zzz"), [])
+
+    def test_suggest_ignores_case_accents_and_punctuation(self):
+        self.assertEqual(self.titles("DÛNE, méss"), ["Dune Messiah"])
+        self.assertEqual(self.titles("?!"), [])
+
+    def test_limit(self):
+        self.assertEqual(self.titles("dun", limit=1), ["Dune Messiah"])
+
+    def test_unpublished_books_are_not_indexed(self):
+        self.assertNotIn("Dune Draft", self.titles("draft"))
+
+    def test_patch_adds_a_published_book(self):
+        self.draft.is_published = True
+        self.index.patch(self.draft)
+        self.assertEqual(self.titles("draft"), ["Dune Draft"])
+
+    def test_patch_replaces_the_old_words(self):
+        self.dune.title = "Children of Dune"
+        self.index.patch(self.dune)
+        self.assertEqual(self.titles("children"), ["Children of Dune"])
+        self.assertEqual(self.titles("dune"), ["Dune Messiah", "Children of Dune", "Sand"])
+        self.dune.title = "Arrakis"
+        self.index.patch(self.dune)
+        self.assertEqual(self.titles("children"), [])
+        self.assertEqual(self.titles("dune"), ["Dune Messiah", "Sand"])
+
+    def test_patch_removes_an_unpublished_book(self):
+        self.messiah.is_published = False
+        self.index.patch(self.messiah)
+        self.assertEqual(self.titles("dun"), ["Dune", "Sand"])
+
+    def test_remove(self):
+        self.index.remove(self.dune.id)
+        self.assertEqual(self.titles("dun"), ["Dune Messiah", "Sand"])
+        self.index.remove(self.dune.id)
+        self.assertEqual(self.titles("dun"), ["Dune Messiah", "Sand"])
+
+    def test_changes_never_touch_a_snapshot_in_use(self):
+        books, words = snapshot = self.index._snapshot
+        before = (dict(books), list(words))
+        self.index.patch(Book(id=self.draft.id, title="X", author="Y", is_published=True))
+        self.index.remove(self.dune.id)
+        self.assertEqual((books, words), before)
+        self.assertIsNot(self.index._snapshot, snapshot)
+
+    def test_patch_before_the_first_build_is_ignored(self):
+        index = AutocompleteIndex()
+        index.patch(self.dune)
+        index.remove(self.dune.id)
+        self.assertEqual(index._snapshot, ({}, []))
+
+    def test_book_saves_patch_the_index_after_commit(self):
+        with mock.patch.object(autocomplete, "index", self.index):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.draft.is_published = True
+                self.draft.save()
+                self.assertEqual(self.titles("draft"), [])
+            self.assertEqual(self.titles("draft"), ["Dune Draft"])
+
+            with self.captureOnCommitCallbacks(execute=True):
+                self.draft.delete()
+            self.assertEqual(self.titles("draft"), [])
+
+    def test_unrelated_saves_do_not_patch_the_index(self):
+        snapshot = self.index._snapshot
+        with mock.patch.object(autocomplete, "index", self.index):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.dune.summary = "Spice"
+                self.dune.save()
+        self.assertIs(self.index._snapshot, snapshot)
+
+
+class CursorPaginatorTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.books = [
+            Book.objects.create(
+                title=f"Book {i}", slug=f"book-{i}", author="Author", cover_front="books/x",
+                likes_count=i % 3, is_published=True,
+            )
+            for i in range(7)
+        ]
+
+    def paginator(self, per_page=3):
+        return CursorPaginator(Book.objects.order_by("-likes_count"), per_page)
+
+    def walk(self, paginator):
+        seen = []
+        page = paginator.get_page("")
+        seen += [book.pk for book in page]
+        while page.has_next():
+            page = paginator.get_page(page.next_cursor)
+            seen += [book.pk for book in page]
+        return seen
+
+    def test_walk_visits_every_row_once_despite_ties(self):
+        expected = list(Book.objects.order_by("-likes_count", "-id").values_list("pk", flat=True))
+        self.assertEqual(self.walk(self.paginator()), expected)
+
+    def test_walk_over_an_annotation(self):
+        paginator = CursorPaginator(
+            Book.objects.annotate(score=F("likes_count") * 1.5).order_by("-score"), 2
+        )
+        self.assertEqual(sorted(self.walk(paginator)), sorted(book.pk for book in self.books))
+
+    def assertFirstPage(self, cursor):
+        paginator = self.paginator()
+        self.assertEqual(
+            [book.pk for book in paginator.get_page(cursor)],
+            [book.pk for book in paginator.get_page("")],
+        )
+
+    def test_tampered_values_fall_back_to_the_first_page(self):
+        ordering = self.paginator().ordering
+        self.assertFirstPage(_encode({"o": ordering, "v": ["x", 1]}))
+        self.assertFirstPage(_encode({"o": ordering, "v": [1, "x"]}))
+        self.assertFirstPage(_encode({"o": ordering, "v": [{"a": 1}, [2]]}))
+        self.assertFirstPage(_encode({"o": ordering, "v": [None, 1]}))
+        self.assertFirstPage(_encode({"o": ordering, "v": [1]}))
+
+    def test_malformed_cursors_fall_back_to_the_first_page(self):
+        self.assertFirstPage("not a cursor")
+        self.assertFirstPage(_encode(["a", "list"]))
+        self.assertFirstPage(_encode({"o": ["-uploaded_at", "-id"], "v": [1, 1]}))
+
+    @override_settings(STORAGES=PLAIN_STATIC)
+    def test_tampered_datetime_cursor_in_the_library(self):
+        cursor = _encode({"o": ["-uploaded_at", "-id"], "v": ["yesterday", 1]})
+        response = self.client.get(reverse("library"), {"cursor": cursor})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["books"].object_list[0].pk, self.books[-1].pk)
+
+    @override_settings(STORAGES=PLAIN_STATIC)
+    def test_tampered_cursor_in_search(self):
+        cursor = _encode({"o": ["-similarity", "-likes_count", "-id"], "v": ["x", "y", "z"]})
+        response = self.client.get(reverse("searchbooks"), {"q": "book", "cursor": cursor})
+        self.assertEqual(response.status_code, 200)
+
+
+class TrendingTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.genre = Genre.objects.create(name="Horror", slug="horror")
+
+    def book(self, title, language="English", genre=None, **fields):
+        fields = {"is_published": True, **fields}
+        return Book.objects.create(
+            title=title, slug=title, author="Author", cover_front="books/x",
+            book_language=language, genre=genre or self.genre, **fields
+        )
+
+    def ranking(self, **segment):
+        return list(trending.trending_books(**segment).values_list("title", flat=True))
+
+    def test_only_changed_books_are_written(self):
+        self.book("quiet")
+        self.book("liked", likes_count=2)
+        self.assertEqual(trending.update_trending_scores(), 1)
+        self.assertEqual(trending.update_trending_scores(), 0)
+
+    def test_recent_engagement_outranks_the_same_engagement_earlier(self):
+        old, new = self.book("old", views_count=1), self.book("new", views_count=1)
+        # First seen: dated at upload, far enough back to not matter below
+        trending.update_trending_scores()
+        now = timezone.now() + 10 * trending.HALF_LIFE
+        Book.objects.filter(pk=old.pk).update(likes_count=1)
+        trending.update_trending_scores(now=now)
+        Book.objects.filter(pk=new.pk).update(likes_count=1)
+        trending.update_trending_scores(now=now + trending.HALF_LIFE)
+
+        old.refresh_from_db()
+        new.refresh_from_db()
+        # One half-life later the same engagement counts twice as much
+        self.assertAlmostEqual(new.trending_score - old.trending_score, 1.0, places=2)
+        self.assertEqual(self.ranking()[:2], ["new", "old"])
+
+    def test_unlikes_never_add_score(self):
+        book = self.book("book", likes_count=3)
+        trending.update_trending_scores()
+        book.refresh_from_db()
+        score = book.trending_score
+
+        Book.objects.filter(pk=book.pk).update(likes_count=1)
+        self.assertEqual(trending.update_trending_scores(), 1)
+        book.refresh_from_db()
+        self.assertEqual((book.trending_score, book.trending_engagement), (score, 5))
+
+    def test_segments(self):
+        other_genre = Genre.objects.create(name="Poetry", slug="poetry")
+        self.book("en-horror", trending_score=3)
+        self.book("fr-horror", "French", trending_score=2)
+        self.book("fr-poetry", "French", genre=other_genre, trending_score=1)
+        self.book("draft", "French", trending_score=9, is_draft=True, is_published=False)
+
+        self.assertEqual(self.ranking(), ["en-horror", "fr-horror", "fr-poetry"])
+        self.assertEqual(self.ranking(genre=self.genre), ["en-horror", "fr-horror"])
+        self.assertEqual(self.ranking(language="French"), ["fr-horror", "fr-poetry"])
+        self.assertEqual(self.ranking(genre=self.genre, language="French"), ["fr-horror"])
+
+    @override_settings(STORAGES=PLAIN_STATIC)
+    def test_trending_views_use_the_segment_lists(self):
+        self.book("en", trending_score=3)
+        self.book("fr-low", "French", trending_score=1)
+        self.book("fr-high", "French", trending_score=2)
+        bump_generation(LIBRARY)
+
+        response = self.client.get(reverse("library"), {"sort": "trending", "lang": "french"})
+        self.assertEqual([book.title for book in response.context["books"]], ["fr-high", "fr-low"])
+        response = self.client.get(reverse("category", args=["horror"]), {"sort": "trending"})
+        self.assertEqual([book.title for book in response.context["books"]], ["en", "fr-high", "fr-low"])
+
+    def test_stored_language(self):
+        self.assertEqual(stored_language("french"), "French")
+        self.assertEqual(stored_language("Klingon"), "Klingon")
+        self.assertEqual(stored_language(""), "")
+
+
+# Counter keys the tests own, so a run never touches real pending counts
+TEST_COUNTER_KEYS = {
+    name: f"test:{getattr(counters, name)}"
+    for name in dir(counters)
+    if name.startswith(("PENDING_", "FLUSHING_")) and name.endswith("_KEY")
+}
+
+
+class CounterTestMixin:
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch.multiple(counters, **TEST_COUNTER_KEYS)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.redis = counters._redis()
+        self.redis.delete(*TEST_COUNTER_KEYS.values())
+        self.addCleanup(self.redis.delete, *TEST_COUNTER_KEYS.values())
+        self.book = Book.objects.create(title="Dune", slug="dune", author="Herbert", cover_front="books/dune")
+
+    def views(self):
+        return Book.objects.values_list("views_count", flat=True).get(pk=self.book.pk)
+
+    def leftover_keys(self):
+        return [key for key in TEST_COUNTER_KEYS.values() if self.redis.exists(key)]
+
+
+class WriteBehindCounterTests(CounterTestMixin, TestCase):
+    def flush_views(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return counters.flush_view_counts()
+
+    def flush_searches(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            return counters.flush_failed_searches()
+
+    def test_views_are_buffered_until_flushed(self):
+        for _ in range(3):
+            counters.record_view(self.book.pk)
+        self.assertEqual(self.views(), 0)
+        self.assertEqual(counters.pending_views([self.book.pk]), {self.book.pk: 3})
+        self.assertEqual(counters.overlay_pending_views([self.book])[0].views_count, 3)
+
+        self.assertEqual(self.flush_views(), 1)
+        self.assertEqual(self.views(), 3)
+        self.assertEqual(counters.pending_views([self.book.pk]), {})
+        self.assertEqual(self.leftover_keys(), [])
+        self.assertEqual(self.flush_views(), 0)
+
+    def test_flush_that_died_before_cleanup_is_not_applied_twice(self):
+        counters.record_view(self.book.pk)
+        counters.record_view(self.book.pk)
+        # Commits, but the snapshot is never deleted (as if the process died right after)
+        with self.captureOnCommitCallbacks(execute=False):
+            counters.flush_view_counts()
+        self.assertEqual(self.views(), 2)
+        counters.record_view(self.book.pk)
+
+        # The next run only clears the leftover snapshot, the one after takes the new view
+        self.assertEqual(self.flush_views(), 0)
+        self.assertEqual(self.views(), 2)
+        self.assertEqual(self.flush_views(), 1)
+        self.assertEqual(self.views(), 3)
+
+    def test_flush_started_during_another_flush_loses_nothing(self):
+        counters.record_view(self.book.pk)
+        apply_once = counters._apply_once
+
+        def meanwhile(*args, **kwargs):
+            # The first flush holds its snapshot; others run and views keep coming
+            with mock.patch.object(counters, "_apply_once", apply_once):
+                self.flush_views()
+                counters.record_view(self.book.pk)
+                counters.record_view(self.book.pk)
+                self.flush_views()
+                counters.record_view(self.book.pk)
+            return apply_once(*args, **kwargs)
+
+        with mock.patch.object(counters, "_apply_once", meanwhile):
+            self.flush_views()
+        self.flush_views()
+        self.assertEqual(self.views(), 4)
+        self.assertEqual(self.leftover_keys(), [])
+
+    def test_late_cleanup_keeps_a_newer_snapshot(self):
+        counters.record_view(self.book.pk)
+        with self.captureOnCommitCallbacks(execute=False) as late_cleanup:
+            counters.flush_view_counts()
+        self.flush_views()  # clears the leftover
+        counters.record_view(self.book.pk)
+        # A newer snapshot is taken but not applied yet when the old cleanup finally runs
+        snapshot_id = counters._take_snapshot(
+            self.redis, counters.FLUSHING_VIEWS_ID_KEY, (counters.PENDING_VIEWS_KEY, counters.FLUSHING_VIEWS_KEY)
+        )
+        for callback in late_cleanup:
+            callback()
+        self.assertEqual(counters._take_snapshot(self.redis, counters.FLUSHING_VIEWS_ID_KEY), snapshot_id)
+        self.flush_views()
+        self.assertEqual(self.views(), 2)
+
+    def test_failed_searches_are_upserted(self):
+        counters.record_failed_search("dragons")
+        counters.record_failed_search("dragons")
+        counters.record_failed_search("elves")
+        self.assertEqual(self.flush_searches(), 2)
+        counters.record_failed_search("dragons")
+        self.assertEqual(self.flush_searches(), 1)
+        self.assertEqual(
+            dict(SearchQueryLog.objects.values_list("query", "count")), {"dragons": 3, "elves": 1}
+        )
+        self.assertEqual(self.leftover_keys(), [])
+
+    def test_failed_search_flush_started_during_another_loses_nothing(self):
+        counters.record_failed_search("dragons")
+        apply_once = counters._apply_once
+
+        def meanwhile(*args, **kwargs):
+            with mock.patch.object(counters, "_apply_once", apply_once):
+                self.flush_searches()
+                counters.record_failed_search("dragons")
+                self.flush_searches()
+            return apply_once(*args, **kwargs)
+
+        with mock.patch.object(counters, "_apply_once", meanwhile):
+            self.flush_searches()
+        self.assertEqual(SearchQueryLog.objects.get(query="dragons").count, 2)
+        self.assertEqual(self.leftover_keys(), [])
+
+
+class ConcurrentFlushTests(CounterTestMixin, TransactionTestCase):
+    """Flushes racing each other in threads, with their own DB connections, while views come in."""
+
+    def test_concurrent_flushes_count_every_view_once(self):
+        recorded = 300
+        done = threading.Event()
+        errors = []
+
+        def flusher():
+            try:
+                while not done.is_set():
+                    counters.flush_view_counts()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=flusher) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for _ in range(recorded):
+            counters.record_view(self.book.pk)
+        done.set()
+        for thread in threads:
+            thread.join()
+
+        # Any leftover snapshot first, then what is still pending
+        counters.flush_view_counts()
+        counters.flush_view_counts()
+        self.assertEqual(errors, [])
+        self.assertEqual(self.views(), recorded)
+        self.assertEqual(self.leftover_keys(), [])
+        self.assertTrue(CounterFlush.objects.exists())
+
+
+class GetOrComputeTests(SimpleTestCase):
+    def setUp(self):
+        # Keys of their own, so runs never see each other's entries
+        self.key = f"test:{uuid.uuid4().hex}"
+        self.family = f"test-{uuid.uuid4().hex}"
+
+    def hold_lock(self, key):
+        lock = shared_cache._lock_key(key)
+        shared_cache.caches[shared_cache.DATA_ALIAS].add(lock, 1, 30)
+        self.addCleanup(shared_cache.caches[shared_cache.DATA_ALIAS].delete, lock)
+
+    def test_a_stampede_computes_once(self):
+        computed = []
+        results = []
+        start = threading.Barrier(8)
+
+        def compute():
+            computed.append(1)
+            time.sleep(0.3)
+            return "value"
+
+        def reader():
+            start.wait()
+            results.append(get_or_compute(self.key, compute, timeout=60))
+
+        threads = [threading.Thread(target=reader) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(computed), 1)
+        self.assertEqual(results, ["value"] * 8)
+
+    def test_stale_value_while_another_worker_rebuilds(self):
+        get_or_compute(self.key, lambda: "old", timeout=60, family=self.family)
+        bump_generation(self.family)
+        self.hold_lock(shared_cache.versioned_key(self.family, self.key))
+
+        self.assertEqual(get_or_compute(self.key, lambda: "new", timeout=60, family=self.family), "old")
+        with mock.patch.object(shared_cache, "LOCK_WAIT", 0.1):
+            fresh = get_or_compute(self.key, lambda: "new", timeout=60, family=self.family, stale=False)
+        self.assertEqual(fresh, "new")
+
+
+class TieredCacheTests(SimpleTestCase):
+    def setUp(self):
+        self.key = f"test:{uuid.uuid4().hex}"
+        self.addCleanup(hot_cache.delete, self.key)
+
+    def listening(self, tiered):
+        # The listener starts on first use and clears L1 once it has subscribed
+        tiered.get(self.key)
+        time.sleep(0.5)
+        return tiered
+
+    def test_reads_are_served_from_memory(self):
+        tiered = self.listening(TieredCache(hot_cache))
+        tiered.set(self.key, "first", 60)
+        hot_cache.set(self.key, "second", 60)
+        self.assertEqual(tiered.get(self.key), "first")
+
+        tiered.delete(self.key)
+        self.assertIsNone(tiered.get(self.key))
+        self.assertIsNone(hot_cache.get(self.key))
+
+    def test_l1_entries_expire(self):
+        tiered = self.listening(TieredCache(hot_cache, timeout=0.05))
+        tiered.set(self.key, "first", 60)
+        hot_cache.set(self.key, "second", 60)
+        time.sleep(0.1)
+        self.assertEqual(tiered.get(self.key), "second")
+
+    def test_a_delete_reaches_other_workers(self):
+        writer, reader = TieredCache(hot_cache), self.listening(TieredCache(hot_cache))
+        reader.set(self.key, "first", 60)
+        self.assertEqual(reader._local_get(self.key), "first")
+
+        writer.delete(self.key)
+        deadline = time.monotonic() + 2
+        while reader._local_get(self.key) is not None and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertIsNone(reader.get(self.key))
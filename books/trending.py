@@ -0,0 +1,78 @@
+"""
+Materialized trending scores.
+
+Scores use forward decay: engagement gained at time t adds
+delta * 2^((t - EPOCH) / HALF_LIFE) to a book's score. Ranking by that sum is the
+same as ranking by the score decayed to "now", so stored scores never have to be
+decayed and each run only writes the books whose engagement changed. Scores are
+stored as log2 of the sum so the growing factor never overflows.
+"""
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.db.models import F
+from django.utils import timezone
+
+from LeafyReads.cache import bump_generation, HOME
+from books.models import Book
+
+EPOCH = datetime(2024, 1, 1, tzinfo=dt_timezone.utc)
+HALF_LIFE = timedelta(days=3)
+
+# Same weights the home page used: likes and saves matter more than views
+ENGAGEMENT = F("likes_count") * 5 + F("read_later_count") * 3 + F("views_count")
+
+
+def _log2_add(a, b):
+    """log2(2**a + 2**b) without overflowing."""
+    if a is None:
+        return b
+    hi, lo = max(a, b), min(a, b)
+    return hi + math.log2(1 + 2 ** (lo - hi))
+
+
+def _weight(moment):
+    return (moment - EPOCH) / HALF_LIFE
+
+
+def update_trending_scores(now=None):
+    """
+    Folds engagement gained since the last run into Book.trending_score.
+    Returns the number of books updated.
+    """
+    now = now or timezone.now()
+    changed = (
+        Book.objects.filter(is_published=True)
+        .annotate(engagement=ENGAGEMENT)
+        .exclude(engagement=F("trending_engagement"))
+        .only("id", "uploaded_at", "trending_score", "trending_engagement")
+    )
+
+    updates = []
+    for book in changed.iterator(chunk_size=2000):
+        delta = book.engagement - book.trending_engagement
+        if delta > 0:
+            # A book seen for the first time gets its engagement dated at upload,
+            # so old catalogue titles start out already decayed
+            first_seen = book.trending_engagement == 0 and book.trending_score == 0
+            moment = book.uploaded_at if first_seen else now
+            contribution = math.log2(delta) + _weight(moment)
+            book.trending_score = max(_log2_add(book.trending_score or None, contribution), 0.0)
+        # Unlikes and unsaves only move the snapshot, they never add score
+        book.trending_engagement = book.engagement
+        updates.append(book)
+
+    Book.objects.bulk_update(updates, ["trending_score", "trending_engagement"], batch_size=500)
+    if updates:
+        bump_generation(HOME)
+    return len(updates)
+
+
+def trending_books(genre=None, language=None):
+    """Published books by trending score, optionally for one genre or language."""
+    books = Book.objects.filter(is_published=True)
+    if genre is not None:
+        books = books.filter(genre=genre)
+    if language:
+        books = books.filter(book_language=language)
+    return books.order_by("-trending_score", "-id")
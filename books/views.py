@@ -1,20 +1,27 @@
 from django.shortcuts import render, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.core.paginator import Paginator
+from LeafyReads.pagination import CursorPaginator
 from django.http import JsonResponse
 from django.db import transaction
-from django.db.models import Q, Count, F, OuterRef, Subquery, IntegerField, Exists
+from django.db.models import Q, Count, OuterRef, Subquery, IntegerField, Exists
 from django.db.models.functions import Coalesce
 from django.core.cache import cache
-from django.contrib.postgres.search import TrigramSimilarity
+from LeafyReads.cache import get_or_compute, versioned_key, local_cache, LIBRARY, SEARCH
 from django.utils.html import strip_tags
-from home.models import Notification 
+from home.notifications import mark_notifications_read
 from django.contrib.contenttypes.models import ContentType
 import hashlib
 import random
 from django.utils import timezone
 from datetime import timedelta
-from books.models import Book, BookContent, Genre, ReadLater, Like, ReadBy, SearchQueryLog
+from books.models import Book, BookPage, Genre, ReadLater, Like, ReadBy
+from books.counters import record_failed_search, record_view, overlay_pending_views
+from books import autocomplete
+from books.rows import BOOK_CARD_ROWS, POPULAR_SIDEBAR_KEY, READ_BY_ROWS, cached_genres, recent_reads_key
+from LeafyReads.rows import pack_page, rows_key, unpack_page
+from books.search import attach_snippets, search_books, search_content
+from books.trending import trending_books
 #  Language choice to filter language based books
 
 LANGUAGE_CHOICES = [
@@ -48,17 +55,70 @@ def apply_common_filters(queryset, lang_param, sort_param):
     if lang_param:
         queryset = queryset.filter(book_language__iexact=lang_param)
         
-    # 2. Sorting
+    # 2. Sorting (id tiebreaker keeps cursor pagination stable)
     if sort_param == 'popular':
-        queryset = queryset.order_by('-likes_count', '-uploaded_at')
+        queryset = queryset.order_by('-likes_count', '-uploaded_at', '-id')
     elif sort_param == 'views':
-        queryset = queryset.order_by('-views_count', '-uploaded_at')
+        queryset = queryset.order_by('-views_count', '-uploaded_at', '-id')
     elif sort_param == 'oldest':
-        queryset = queryset.order_by('uploaded_at')
+        queryset = queryset.order_by('uploaded_at', 'id')
+    elif sort_param == 'trending':
+        queryset = queryset.order_by('-trending_score', '-id')
     
     return queryset
 
 
+def stored_language(lang_param):
+    """The ?lang= value as the upload forms store it, so an exact match can use an index."""
+    lowered = lang_param.lower()
+    return next((code for code, _ in LANGUAGE_CHOICES if code.lower() == lowered), lang_param)
+
+
+def popular_books_sidebar():
+    """Most liked published books, shared by the category and search sidebars."""
+    packed = get_or_compute(
+        POPULAR_SIDEBAR_KEY,
+        lambda: BOOK_CARD_ROWS.pack(Book.objects.filter(is_published=True).order_by('-likes_count')[:21]),
+        timeout=3600,
+        cache=local_cache,
+    )
+    return BOOK_CARD_ROWS.unpack(packed)
+
+
+def paginate_books(queryset, page_number, cursor, per_page=50):
+    """
+    Keyset page when a `?cursor=` is given, numbered page otherwise.
+    Both carry `next_cursor`, so the Next link never needs OFFSET or COUNT(*).
+    """
+    cursor_paginator = CursorPaginator(queryset, per_page)
+    if cursor:
+        return cursor_paginator.get_page(cursor)
+
+    page = Paginator(cursor_paginator.queryset, per_page).get_page(page_number)
+    page.next_cursor = cursor_paginator.cursor_for(page[-1]) if page.has_next() else None
+    return page
+
+
+def get_reader_page(content_obj, page_number):
+    """Returns (page_obj, html) for a single stored page of a book.
+
+    Only the requested BookPage row is read, so the cost of a page turn
+    does not depend on the size of the book.
+    """
+    page_count = content_obj.page_count if content_obj else 0
+    paginator = Paginator(range(page_count), 1)
+    page_obj = paginator.get_page(page_number)
+
+    html = ""
+    if page_count:
+        html = (
+            BookPage.objects.filter(content_id=content_obj.id, number=page_obj.number)
+            .values_list("html", flat=True)
+            .first()
+        ) or ""
+    return page_obj, html
+
+
 def home(request, slug):
     # --- 1. VIEW COUNTER LOGIC ---
     book_id = Book.objects.filter(slug=slug).values_list('id', flat=True).first()
@@ -80,12 +140,12 @@ def home(request, slug):
                 should_increment = True
 
         if should_increment:
-            Book.objects.filter(id=book_id).update(views_count=F('views_count') + 1)
+            record_view(book_id)
             request.session[session_key] = timezone.now().isoformat()
             request.session.modified = True
 
     # --- 2. FETCH BOOK & USER DATA ---
-    book_qs = Book.objects.select_related("content")
+    book_qs = Book.objects.select_related("content").defer("content__content", "content__chunks")
     
     if request.user.is_authenticated:
         saved_subquery = ReadLater.objects.filter(
@@ -140,21 +200,15 @@ def home(request, slug):
     # --- 5. DEVICE DETECTION & RENDERING ---
     if request.user_agent.is_mobile:
         template_name = "mobileBook.html"
-        content_chunks = getattr(content_obj, "chunks", []) if has_content else []
-
-        # Paginate the pre-split chunks
-        paragraphs_per_page = 30 
-        paginator = Paginator(content_chunks, paragraphs_per_page)
-        page_number = request.GET.get('page')
-        page_obj = paginator.get_page(page_number)
 
-        # Join only the paragraphs needed for THIS page
-        display_content = "".join(page_obj.object_list)
+        # Read only the stored page needed for THIS request
+        page_obj, display_content = get_reader_page(content_obj if has_content else None, request.GET.get('page'))
         pagination_context = page_obj 
 
     else:
         template_name = "book.html"
         if has_content:
+            # Deferred above, so the full text is only loaded for the flipbook
             display_content = getattr(content_obj, "content", "")
 
     return render(
@@ -200,15 +254,15 @@ def book_page_view(request, slug):
                 should_increment = True
 
         if should_increment:
-            # Increment DB Counter efficiently
-            Book.objects.filter(id=book_id).update(views_count=F('views_count') + 1)
+            # Buffered in Redis, flushed to the DB by `flush_view_counts`
+            record_view(book_id)
             
             # Update Session Timestamp
             request.session[session_key] = timezone.now().isoformat()
             request.session.modified = True
 
     # --- 2. MAIN DATA FETCHING ---
-    book_qs = Book.objects.select_related("content")
+    book_qs = Book.objects.select_related("content").defer("content__content", "content__chunks")
     
     if request.user.is_authenticated:
         saved_subquery = ReadLater.objects.filter(book=OuterRef("pk"), user=request.user)
@@ -223,17 +277,13 @@ def book_page_view(request, slug):
             ReadBy.objects.get_or_create(user=request.user, book=book)
         transaction.on_commit(save_read)
 
-    # --- 4. CONTENT & PAGINATION (Strictly Chunk/Scroll based) ---
+    # --- 4. CONTENT & PAGINATION (One stored page per request) ---
     try:
         content_obj = book.content
-        content_chunks = getattr(content_obj, "chunks", []) if content_obj else []
     except:
-        content_chunks = []
+        content_obj = None
 
-    paginator = Paginator(content_chunks, 50)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-    display_content = "".join(page_obj.object_list)
+    page_obj, display_content = get_reader_page(content_obj, request.GET.get('page'))
 
     # --- 5. RENDER ---
     return render(request, "mobileBook.html", {
@@ -255,20 +305,20 @@ def openBook(request, slug):
         slug=slug,
         is_published=True,
     )
+    # Views are flushed in batches, show the exact count here
+    overlay_pending_views([book])
     if request.user.is_authenticated:
         content_type = ContentType.objects.get_for_model(Book)
         
-        Notification.objects.filter(
-            recipient=request.user,
-            content_type=content_type,
-            object_id=book.id,
-            is_read=False
-        ).update(is_read=True)
-    # 2. Optimized Content Fetching
-    content_data = BookContent.objects.filter(book=book).values("chunks").first()
+        mark_notifications_read(request.user, content_type=content_type, object_id=book.id)
+    # 2. Optimized Content Fetching (first stored page only)
+    raw_text = (
+        BookPage.objects.filter(content__book=book, number=1)
+        .values_list("html", flat=True)
+        .first()
+    )
     
-    if content_data and content_data.get("chunks"):
-        raw_text = " ".join(content_data["chunks"][:5])
+    if raw_text:
         book.bookcontent = strip_tags(raw_text)[:900]
     else:
         book.bookcontent = ""
@@ -301,51 +351,55 @@ def openBook(request, slug):
 
 
 def library(request):
-    categories = cache.get("library_categories")
-    if categories is None:
-        categories = list(Genre.objects.all())
-        cache.set("library_categories", categories, timeout=60 * 60 * 24)
-
-    categories = categories[:]
+    categories = cached_genres()
     random.shuffle(categories)
 
     # 1. Get Parameters
     page_number = request.GET.get("page", 1)
+    cursor = request.GET.get("cursor", "")[:256]
     sort_param = request.GET.get("sort", "newest") 
     lang_param = request.GET.get("lang", "").strip()
 
     # 2. Build Cache Key (Includes filters)
-    books_cache_key = f"library_books_p{page_number}_s{sort_param}_l{lang_param}"
-    
-    books = cache.get(books_cache_key)
-    
-    if books is None:
-        books_queryset = Book.objects.defer("content").filter(is_published=True)
-        
-        # 3. Apply Common Filters
-        books_queryset = apply_common_filters(books_queryset, lang_param, sort_param)
+    books_cache_key = rows_key(f"books_p{page_number}_s{sort_param}_l{lang_param}")
+
+    def load_books():
+        if sort_param == 'trending':
+            # Per-language list, read through book_lang_trending_idx
+            books_queryset = trending_books(language=stored_language(lang_param))
+        else:
+            # 3. Apply Common Filters
+            books_queryset = apply_common_filters(Book.objects.filter(is_published=True), lang_param, sort_param)
+
+        # Card fields plus every column a sort/cursor can use
+        books_queryset = books_queryset.only(*BOOK_CARD_ROWS.fields, "uploaded_at", "trending_score")
         
         # Default Sort
         if sort_param == 'newest':
-            books_queryset = books_queryset.order_by('-uploaded_at')
+            books_queryset = books_queryset.order_by('-uploaded_at', '-id')
 
-        paginator = Paginator(books_queryset, 50)
-        books = paginator.get_page(page_number)
-        
-        cache.set(books_cache_key, books, timeout=60 * 15)
+        return pack_page(BOOK_CARD_ROWS, paginate_books(books_queryset, page_number, cursor))
+
+    if cursor:
+        # Keyset pages are an index range scan; caching them would give every
+        # cursor a client makes up an entry of its own
+        packed_books = load_books()
+    else:
+        packed_books = get_or_compute(books_cache_key, load_books, timeout=60 * 15, family=LIBRARY)
+    books = unpack_page(BOOK_CARD_ROWS, packed_books)
 
     recently_read_books = []
     if request.user.is_authenticated:
-        user_recent_key = f"library_recent_user_{request.user.id}"
-        recently_read_books = cache.get(user_recent_key)
+        user_recent_key = recent_reads_key(request.user.id)
+        packed_recent = cache.get(user_recent_key)
         
-        if recently_read_books is None:
-            recently_read_books = list(
-                ReadBy.objects.filter(user=request.user)
-                .select_related("book")
-                .order_by("-readed_at")[:10]
+        if packed_recent is None:
+            packed_recent = READ_BY_ROWS.pack(
+                ReadBy.objects.filter(user=request.user).order_by("-readed_at")[:10]
             )
-            cache.set(user_recent_key, recently_read_books, timeout=60 * 60)
+            cache.set(user_recent_key, packed_recent, timeout=60 * 60)
+
+        recently_read_books = READ_BY_ROWS.unpack(packed_recent)
 
     return render(
         request,
@@ -366,36 +420,31 @@ def categories(request, slug):
     
     # 1. Get Parameters
     page_number = request.GET.get("page", 1)
+    cursor = request.GET.get("cursor", "")[:256]
     sort_param = request.GET.get("sort", "newest") 
     lang_param = request.GET.get("lang", "").strip()
 
-    # 2. Base Query
-    books_queryset = Book.objects.filter(genre=current_genre, is_published=True)
+    if sort_param == 'trending':
+        # Per-genre (or per-language) list, read through its trending index
+        books_queryset = trending_books(genre=current_genre, language=stored_language(lang_param))
+    else:
+        # 2. Base Query
+        books_queryset = Book.objects.filter(genre=current_genre, is_published=True)
 
-    # 3. Apply Common Filters
-    books_queryset = apply_common_filters(books_queryset, lang_param, sort_param)
+        # 3. Apply Common Filters
+        books_queryset = apply_common_filters(books_queryset, lang_param, sort_param)
 
     # Default sort
     if sort_param == 'newest':
-        books_queryset = books_queryset.order_by("-uploaded_at")
+        books_queryset = books_queryset.order_by("-uploaded_at", "-id")
 
-    paginator = Paginator(books_queryset, 50)
-    books = paginator.get_page(page_number)
+    books = paginate_books(books_queryset, page_number, cursor)
     
     # --- 4. RECOMMENDATION LOGIC (Always Fetch) ---
     # We fetch this every time now, so it's available even if 'books' has data.
-    related_books = cache.get("popular_books_sidebar")
-    
-    if not related_books:
-        related_books = list(
-            Book.objects.filter(is_published=True)
-            .only("id", "title", "slug", "author", "cover_front", "likes_count", "views_count")
-            .order_by('-likes_count')[:21]
-        )
-        # Cache for 1 hour to keep it fast
-        cache.set("popular_books_sidebar", related_books, 3600)
+    related_books = popular_books_sidebar()
 
-    all_categories = Genre.objects.all().order_by("name")
+    all_categories = cached_genres()
     return render(
         request,
         "library.html",
@@ -432,27 +481,23 @@ def myBooks(request):
 def searchbooks(request):
     book_query = request.GET.get("q", "").strip()
     page_number = request.GET.get("page", 1)
+    cursor = request.GET.get("cursor", "")[:256]
     
     # 1. Get Parameters
     sort_param = request.GET.get("sort", "relevance") 
     lang_param = request.GET.get("lang", "").strip()
+    # "content" searches inside the text of the books instead of titles
+    search_in = "content" if request.GET.get("in") == "content" else "titles"
 
-    # 2. Update Cache Key
-    cache_key = f"search_{book_query}_p{page_number}_s{sort_param}_l{lang_param}"
-    context = cache.get(cache_key)
+    # 2. Update Cache Key (pages reached by cursor are not cached, see library())
+    cache_key = versioned_key(SEARCH, f"{book_query}_p{page_number}_s{sort_param}_l{lang_param}_i{search_in}")
+    context = cache.get(cache_key) if not cursor else None
     
     if context:
         return render(request, "library.html", context)
 
     # Sidebar
-    cached_suggestions = cache.get("popular_books_sidebar")
-    if not cached_suggestions:
-        cached_suggestions = list(
-            Book.objects.filter(is_published=True)
-            .only("id", "title", "slug", "author", "cover_front", "likes_count", "views_count", "is_published")
-            .order_by('-likes_count')[:12]
-        )
-        cache.set("popular_books_sidebar", cached_suggestions, 3600)
+    cached_suggestions = popular_books_sidebar()[:12]
 
     suggested_books = None
     no_results_found = False
@@ -464,45 +509,44 @@ def searchbooks(request):
     )
 
     if book_query:
-        # Search Logic
-        books_queryset = books_queryset.annotate(
-            similarity=(
-                TrigramSimilarity('title', book_query) * 1.0 +
-                TrigramSimilarity('author', book_query) * 0.8 +
-                TrigramSimilarity('genre__name', book_query) * 0.6 +
-                TrigramSimilarity('slug', book_query) * 0.5
-            )
-        ).filter(
-            similarity__gt=0.05  
-        )
+        if search_in == "content":
+            # Full-text search over the book pages
+            books_queryset = search_content(books_queryset, book_query)
+            relevance = ('-content_rank', '-likes_count', '-id')
+        else:
+            # Search Logic (index candidates, then weighted rerank)
+            books_queryset = search_books(books_queryset, book_query)
+            relevance = ('-similarity', '-likes_count', '-id')
         
         # 3. Apply Common Filters
         books_queryset = apply_common_filters(books_queryset, lang_param, sort_param)
 
         # 4. Sorting (Search Specific)
         if sort_param == 'popular':
-            books_queryset = books_queryset.order_by('-likes_count')
+            books_queryset = books_queryset.order_by('-likes_count', '-id')
         elif sort_param == 'views':
-            books_queryset = books_queryset.order_by('-views_count')
+            books_queryset = books_queryset.order_by('-views_count', '-id')
         elif sort_param == 'oldest':
-            books_queryset = books_queryset.order_by('uploaded_at')
+            books_queryset = books_queryset.order_by('uploaded_at', 'id')
         elif sort_param == 'newest':
-            books_queryset = books_queryset.order_by('-uploaded_at')
+            books_queryset = books_queryset.order_by('-uploaded_at', '-id')
+        elif sort_param == 'trending':
+            books_queryset = books_queryset.order_by('-trending_score', '-id')
         else:
             # Default: Relevance
-            books_queryset = books_queryset.order_by('-similarity', '-likes_count')
+            books_queryset = books_queryset.order_by(*relevance)
 
-        paginator = Paginator(books_queryset, 50)
-        books = paginator.get_page(page_number)
+        books = paginate_books(books_queryset, page_number, cursor)
+        if search_in == "content":
+            books.object_list = attach_snippets(books, book_query)
 
         if len(books) == 0:
             no_results_found = True
             try:
                 clean_query = book_query.lower().strip()[:200]
                 if clean_query and len(clean_query) > 2:
-                    SearchQueryLog.objects.update_or_create(
-                        query=clean_query, defaults={'count': F('count') + 1}
-                    )
+                    # Counted in Redis, written by `manage.py flush_failed_searches`
+                    record_failed_search(clean_query)
             except Exception:
                 pass
             suggested_books = cached_suggestions
@@ -513,22 +557,23 @@ def searchbooks(request):
         # No Search provided - treat like Library
         books_queryset = apply_common_filters(books_queryset, lang_param, sort_param)
         if sort_param == 'relevance' or sort_param == 'newest':
-             books_queryset = books_queryset.order_by("-uploaded_at")
+             books_queryset = books_queryset.order_by("-uploaded_at", "-id")
 
-        paginator = Paginator(books_queryset, 50)
-        books = paginator.get_page(page_number)
+        books = paginate_books(books_queryset, page_number, cursor)
         suggested_books = cached_suggestions
 
     context = {
         "books": books,
         "search": book_query,
+        "search_in": search_in,
         "title": f"Results for '{book_query}'" if book_query else "All Books",
         "no_results_found": no_results_found,
         "suggested_books": suggested_books,
         "languages": LANGUAGE_CHOICES,
     }
     
-    cache.set(cache_key, context, timeout=60 * 2)
+    if not cursor:
+        cache.set(cache_key, context, timeout=60 * 2)
 
     return render(request, "library.html", context)
 
@@ -539,9 +584,14 @@ def ajax_search(request):
 
     if len(query) < 2:
         return JsonResponse({"results": []})
+
+    # Prefix matches come from the in-process index; Postgres only handles fuzzy misses
+    results = autocomplete.index.suggest(query)
+    if results:
+        return JsonResponse({"results": results})
         
     safe_query = hashlib.md5(query.encode('utf-8')).hexdigest()
-    cache_key = f"ajax_search_{safe_query}"
+    cache_key = versioned_key(SEARCH, f"ajax_{safe_query}")
     cached_results = cache.get(cache_key)
     
     if cached_results:
@@ -549,19 +599,8 @@ def ajax_search(request):
 
     
     books = list(
-        Book.objects.filter(is_published=True)
-        .annotate(
-            similarity=(
-                # Weighted search: Title matches are most important
-                TrigramSimilarity('title', query) * 1.0 +
-                TrigramSimilarity('author', query) * 0.8 +
-                TrigramSimilarity('slug', query) * 0.5 +
-                TrigramSimilarity('genre__name', query) * 0.5
-            )
-        )
-        .filter(
-            similarity__gt=0.05 
-        )
+        # Weighted search: Title matches are most important
+        search_books(Book.objects.filter(is_published=True), query, genre_weight=0.5)
         .only("id", "title", "author", "slug") 
         .order_by(
             '-similarity',
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.2 on 2026-10-18 13:35
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0020_book_book_pub_newest_idx_book_book_pub_popular_idx_and_more'),
+        ('community', '0004_alter_post_options_post_comments_count_and_more'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-created_at', '-id'], name='community_p_created_a970d0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-likes_count'], name='community_p_likes_c_54ee16_idx'),
+        ),
+    ]
@@ -32,8 +32,9 @@ class Post(models.Model):
     likes_count = models.PositiveIntegerField(default=0)
     comments_count = models.PositiveIntegerField(default=0)
 
-    indexes = [
-            models.Index(fields=['-created_at']),
+    class Meta:
+        indexes = [
+            models.Index(fields=['-created_at', '-id']),
             models.Index(fields=['-likes_count']),
         ]
 
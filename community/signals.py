@@ -1,34 +1,30 @@
 from django.db.models.signals import post_save, post_delete, m2m_changed
 from django.dispatch import receiver
-from django.core.cache import cache
+from LeafyReads.cache import bump_generation, COMMUNITY
+from LeafyReads.tasks import enqueue
 from .models import Post, Comment
+from .tasks import refresh_post_counts
 
 # 1. Main Cache Invalidator
-# This handles New Posts, Deleted Posts, AND Like Updates 
+# This handles New Posts and Deleted Posts; count changes bump it from refresh_post_counts
 @receiver([post_save, post_delete], sender=Post)
 def invalidate_community_cache(sender, instance, **kwargs):
-    try:
-        cache.delete_pattern("community_feed:page:*")
-    except AttributeError:
-        cache.clear()
+    # One Redis INCR, cheaper than a task. Readers get the previous feed until one of them
+    # rebuilds it; the author's redirect after posting waits for the rebuild (views.community)
+    bump_generation(COMMUNITY)
 
-# 2. Update Like Count (Calculates count & Saves Post )
+# 2. Like Count (recounted in the background)
 @receiver(m2m_changed, sender=Post.likes.through)
 def update_post_likes_count(sender, instance, action, **kwargs):
     if action in ["post_add", "post_remove", "post_clear"]:
-        instance.likes_count = instance.likes.count()
-        instance.save(update_fields=['likes_count']) 
+        enqueue(refresh_post_counts, instance.pk)
 
 # 3. Comment Counts
 @receiver(post_save, sender=Comment)
 def update_comment_count_save(sender, instance, created, **kwargs):
     if created:
-        post = instance.post
-        post.comments_count = post.comments.count()
-        post.save(update_fields=['comments_count'])
+        enqueue(refresh_post_counts, instance.post_id)
 
 @receiver(post_delete, sender=Comment)
 def update_comment_count_delete(sender, instance, **kwargs):
-    post = instance.post
-    post.comments_count = post.comments.count()
-    post.save(update_fields=['comments_count'])
\ No newline at end of file
+    enqueue(refresh_post_counts, instance.post_id)
@@ -0,0 +1,24 @@
+from celery import shared_task
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from LeafyReads.cache import bump_generation, COMMUNITY
+from .models import Post, Comment
+
+
+def _count(queryset):
+    # COUNT per post as a subquery; posts with no rows get 0 instead of NULL
+    return Coalesce(
+        Subquery(queryset.filter(post_id=OuterRef('pk')).values('post_id').annotate(n=Count('*')).values('n')),
+        0,
+    )
+
+
+@shared_task
+def refresh_post_counts(post_id):
+    """Recounts a post's likes and comments in one UPDATE."""
+    Post.objects.filter(pk=post_id).update(
+        likes_count=_count(Post.likes.through.objects.all()),
+        comments_count=_count(Comment.objects.all()),
+    )
+    # update() skips post_save, so the feed is invalidated here
+    bump_generation(COMMUNITY)
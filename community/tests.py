@@ -1,2 +1,85 @@
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_in
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from LeafyReads import cache as shared_cache
+from LeafyReads.cache import COMMUNITY, versioned_key
+from LeafyReads.pagination import _encode
+from LeafyReads.rows import rows_key
+from books.models import Book
+from home.signals import show_login_message
+from .models import Post, PostImage
+from .views import POST_ROWS
+
+# Views render {% static %}; the manifest storage needs collectstatic first
+PLAIN_STATIC = {**settings.STORAGES, "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"}}
+
+
+class FeedRowsTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("poster", password="x")
+        cls.book = Book.objects.create(title="Dune", slug="dune", author="Herbert", cover_front="books/dune")
+        cls.with_book = Post.objects.create(author=cls.user, book=cls.book, content="Spice")
+        cls.plain = Post.objects.create(author=cls.user, content="Hello")
+        PostImage.objects.create(post=cls.with_book, image="posts/a")
+        PostImage.objects.create(post=cls.with_book, image="posts/b")
+
+    def test_feed_round_trip(self):
+        posts = Post.objects.select_related("author", "book").only(*POST_ROWS.fields).order_by("id")
+        with_book, plain = POST_ROWS.unpack(POST_ROWS.pack(list(posts)))
+
+        self.assertEqual(with_book, self.with_book)
+        self.assertEqual(with_book.author, self.user)
+        self.assertEqual(with_book.author.username, "poster")
+        self.assertEqual(with_book.book.title, "Dune")
+        self.assertEqual(
+            sorted(image.image.public_id for image in with_book.images.all()), ["posts/a", "posts/b"]
+        )
+
+        self.assertIsNone(plain.book)
+        self.assertFalse(plain.images.exists())
+        self.assertEqual(plain.images.count(), 0)
+
+
+@override_settings(STORAGES=PLAIN_STATIC)
+class FeedCursorTests(TestCase):
+    def test_tampered_cursor_shows_the_first_page(self):
+        user = User.objects.create_user("poster", password="x")
+        post = Post.objects.create(author=user, content="Hello")
+        cursor = _encode({"o": ["-created_at", "-id"], "v": ["not a date", "x"]})
+        response = self.client.get(reverse("community"), {"cursor": cursor})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([p.pk for p in response.context["posts"]], [post.pk])
+
+
+@override_settings(STORAGES=PLAIN_STATIC)
+class FeedAfterPostingTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user("poster", password="x")
+        user_logged_in.disconnect(show_login_message)
+        self.addCleanup(user_logged_in.connect, show_login_message)
+
+    def hold_rebuild_lock(self):
+        # Another worker busy rebuilding the new generation of the feed
+        lock = shared_cache._lock_key(versioned_key(COMMUNITY, rows_key("feed:first")))
+        shared_cache.caches[shared_cache.DATA_ALIAS].add(lock, 1, 30)
+        self.addCleanup(shared_cache.caches[shared_cache.DATA_ALIAS].delete, lock)
+
+    def feed(self, client):
+        return [post.content for post in client.get(reverse("community")).context["posts"]]
+
+    def test_author_sees_their_post_while_others_get_the_stale_feed(self):
+        Post.objects.create(author=self.author, content="Earlier")
+        self.assertEqual(self.feed(self.client), ["Earlier"])
+
+        self.client.force_login(self.author)
+        with mock.patch("community.views.bump_generation", side_effect=lambda *families: self.hold_rebuild_lock()), \
+                mock.patch.object(shared_cache, "LOCK_WAIT", 0.1):
+            self.client.post(reverse("community"), {"content": "Fresh"})
+            self.assertEqual(self.feed(self.client_class()), ["Earlier"])
+            self.assertEqual(self.feed(self.client), ["Fresh", "Earlier"])
@@ -1,5 +1,5 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from django.core.paginator import Paginator
+from LeafyReads.pagination import CursorPaginator
 from django.contrib import messages
 from django.http import JsonResponse
 from django.contrib.auth.decorators import login_required
@@ -7,45 +7,67 @@ from django.views.decorators.http import require_POST, require_GET
 from django.utils.timesince import timesince
 from django.template.defaultfilters import truncatechars
 from django.core.cache import cache
+from LeafyReads.cache import get_or_compute, bump_generation, COMMUNITY
 from django.contrib.contenttypes.models import ContentType
 from .models import Post, PostImage, Comment
+from home.notifications import mark_notifications_read
 from books.models import ReadBy, Book
+from books.rows import READ_BY_ROWS
+from LeafyReads.rows import RowSpec, rows_key
+
+# What the feed template reads from a post, cached as tuples
+POST_ROWS = RowSpec(
+    Post,
+    [
+        "id", "content", "created_at", "likes_count", "comments_count",
+        "author__id", "author__username", "author__first_name", "author__last_name",
+        "book__id", "book__title", "book__slug", "book__author", "book__cover_front",
+    ],
+    children={"images": RowSpec(PostImage, ["id", "post_id", "image"])},
+)
 
 # -------------------------------------------------------------------------
 # 1. COMMUNITY FEED
 # -------------------------------------------------------------------------
 def community(request):
-    page_number = request.GET.get('page', '1')
-    feed_cache_key = f"community_feed:page:{page_number}"
-    
-    cached_data = cache.get(feed_cache_key)
+    cursor = request.GET.get('cursor', '')[:256]
 
-    if cached_data is None:
+    def load_feed():
         # --- DB QUERY ---
         posts_qs = (
             Post.objects
             .select_related('author', 'book')
-            .prefetch_related('images')
-            .order_by('-created_at')
+            .only(*POST_ROWS.fields)
+            .order_by('-created_at', '-id')
         )
 
-        paginator = Paginator(posts_qs, 20)
-        page = paginator.get_page(page_number)
+        # Keyset pagination: no OFFSET and no COUNT(*) however deep the feed goes
+        paginator = CursorPaginator(posts_qs, 20)
+        page = paginator.get_page(cursor)
 
-        # Force evaluation for caching
-        posts_list = list(page.object_list)
-        
-        cached_data = {
-            'posts': posts_list,
+        # Cache only what the feed renders; images come in one extra query
+        return {
+            'posts': POST_ROWS.pack(page),
             'has_next': page.has_next(),
-            'next_page_number': page.next_page_number() if page.has_next() else None,
+            'next_cursor': page.next_cursor,
         }
-        cache.set(feed_cache_key, cached_data, 900)
+
+    if cursor:
+        # Older pages are an index range scan; caching them would give every
+        # cursor a client makes up an entry of its own
+        cached_data = load_feed()
+    else:
+        # Right after posting, the author waits for the rebuilt feed instead of the
+        # previous one, so their post is there
+        just_posted = request.session.pop("just_posted", False)
+        cached_data = get_or_compute(
+            rows_key("feed:first"), load_feed, timeout=900, family=COMMUNITY, stale=not just_posted
+        )
 
     # Unpack
-    posts = cached_data['posts']
+    posts = POST_ROWS.unpack(cached_data['posts'])
     has_next = cached_data['has_next']
-    next_page_number = cached_data['next_page_number']
+    next_cursor = cached_data['next_cursor']
 
     # 2. PERSONALIZATION (Is Liked?)
     if request.user.is_authenticated:
@@ -62,15 +84,14 @@ def community(request):
     # 3. SIDEBAR
     books = []
     if request.user.is_authenticated:
-        sidebar_key = f"user_sidebar:{request.user.id}"
-        books = cache.get(sidebar_key)
+        sidebar_key = rows_key(f"user_sidebar:{request.user.id}")
+        packed_books = cache.get(sidebar_key)
+
+        if packed_books is None:
+            packed_books = READ_BY_ROWS.pack(ReadBy.objects.filter(user=request.user)[:5])
+            cache.set(sidebar_key, packed_books, 1800)
 
-        if books is None:
-            books = list(
-                ReadBy.objects.filter(user=request.user)
-                .select_related('book')[:5]
-            )
-            cache.set(sidebar_key, books, 1800)
+        books = READ_BY_ROWS.unpack(packed_books)
 
     # 4. POST SUBMISSION
     if request.method == "POST":
@@ -96,11 +117,9 @@ def community(request):
             PostImage.objects.create(post=post, image=image_file)
 
         # Invalidate Cache
-        try:
-            cache.delete_pattern("community_feed:page:*")
-        except AttributeError:
-            cache.clear()
+        bump_generation(COMMUNITY)
 
+        request.session["just_posted"] = True
         messages.success(request, "Your post has been published!")
         return redirect("community")
 
@@ -108,7 +127,7 @@ def community(request):
         "posts": posts,
         "books": books,
         "has_next": has_next, 
-        "next_page_number": next_page_number,
+        "next_cursor": next_cursor,
     }
     return render(request, "community.html", context)
 
@@ -124,11 +143,7 @@ def viewPost(request, slug):
         post.has_liked = post.likes.filter(id=request.user.id).exists()
         
         post_type = ContentType.objects.get_for_model(Post)
-        request.user.notifications.filter(
-            content_type=post_type,
-            object_id=post.id, 
-            is_read=False
-        ).update(is_read=True)
+        mark_notifications_read(request.user, content_type=post_type, object_id=post.id)
 
     return render(request, 'viewpost.html', {'post': post})
 
@@ -142,18 +157,16 @@ def like_post(request):
     post_id = request.POST.get('post_id')
     post = get_object_or_404(Post, id=post_id)
     
-    if request.user in post.likes.all():
+    if post.likes.filter(id=request.user.id).exists():
         post.likes.remove(request.user)
         is_liked = False
     else:
         post.likes.add(request.user)
         is_liked = True
 
-    # Signal updates the count, but we must refresh to see it in this request
-    post.refresh_from_db()
-
+    # likes_count is recounted in the background; count here so the response is current
     return JsonResponse({
-        'likes_count': post.likes_count, 
+        'likes_count': post.likes.count(), 
         'is_liked': is_liked
     })
 
@@ -175,10 +188,7 @@ def delete_post(request, post_id):
     post.delete()
     
     # Invalidate Cache
-    try:
-        cache.delete_pattern("community_feed:page:*")
-    except AttributeError:
-        cache.clear()
+    bump_generation(COMMUNITY)
 
     return JsonResponse({
         'status': 'success', 
@@ -254,11 +264,8 @@ def delete_comment(request, comment_id):
     comment = get_object_or_404(Comment, id=comment_id)
 
     if comment.author == request.user or request.user.is_superuser:
-        post = comment.post 
+        # Signal recounts comments_count in the background
         comment.delete()
-        
-        post.comments_count = post.comments.count()
-        post.save()
 
         return JsonResponse({'status': 'success', 'message': 'Comment deleted successfully'})
     
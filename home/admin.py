@@ -1,6 +1,6 @@
 from django.contrib import admin
 from unfold.admin import ModelAdmin
-from home.models import Notification,Feedback
+from home.models import Notification,Feedback,EmailOutbox
 
 # Register your models here.
 
@@ -12,4 +12,10 @@ class NotificationAdmin(ModelAdmin):
 @admin.register(Feedback)
 class FeedbackAdmin(ModelAdmin):
     list_display = ('user', 'feedback_type','message')
-    list_filter = ('feedback_type',)
\ No newline at end of file
+    list_filter = ('feedback_type',)
+
+@admin.register(EmailOutbox)
+class EmailOutboxAdmin(ModelAdmin):
+    list_display = ('subject', 'to', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    search_fields = ('subject',)
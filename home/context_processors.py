@@ -1,16 +1,15 @@
-from .models import Notification
+from django.utils.functional import SimpleLazyObject
+from .notifications import unread_count
+
 
 def notifications(request):
     if request.user.is_authenticated:
-        notifs = Notification.objects.filter(recipient=request.user).select_related('actor').prefetch_related('content_object')
-        unread_count = Notification.objects.filter(recipient=request.user, is_read=False).count()
-        
+        user_id = request.user.id
+        # Lazy: only templates that show the count pay for the cache read.
+        # The dropdown itself is fetched from `notifications_dropdown` when the bell is opened.
         return {
-            'notifications': notifs[:10],
-            'unread_notification_count': unread_count
+            'unread_notification_count': SimpleLazyObject(lambda: unread_count(user_id))
         }
-
     return {
-        'notifications': [], 
         'unread_notification_count': 0
-    }
\ No newline at end of file
+    }
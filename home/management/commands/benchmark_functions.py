@@ -0,0 +1,175 @@
+import datetime
+import json
+import platform
+import random
+import statistics
+import time
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from books.models import next_free_slug, sanitize_content, split_chunks
+from books.templatetags.cloudinary_filters import optimize_cloudinary_images
+from userSection.views import calculate_day_streak, calculate_reading_tastes
+
+DEFAULT_BASELINE = Path(settings.BASE_DIR) / "benchmarks" / "functions.json"
+
+SIZES = {"100KB": 100 * 1024, "1MB": 1024 * 1024, "10MB": 10 * 1024 * 1024}
+
+WORDS = (
+    "the a reader turned page slowly while river light fell across old letters and "
+    "nobody in house knew what story she would tell next morning under quiet sky"
+).split()
+
+
+# --- Inputs ---
+
+def editor_html(size, rng):
+    """CKEditor-like HTML of roughly `size` characters: paragraphs, headings, images, styles and some junk to strip."""
+    blocks = []
+    total = 0
+    while total < size:
+        words = " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 80)))
+        roll = rng.random()
+        if roll < 0.06:
+            block = f"<h2>{words[:60]}</h2>"
+        elif roll < 0.10:
+            block = (
+                f'<figure class="image"><img src="https://res.cloudinary.com/demo/image/upload/'
+                f'v{rng.randint(1, 10**9)}/books/page{rng.randint(1, 999)}.jpg" alt="{words[:20]}"></figure>'
+            )
+        elif roll < 0.14:
+            block = f'<p style="text-align:center;position:absolute">{words}</p><script>track()</script>'
+        elif roll < 0.18:
+            block = f'<div onclick="x()"><strong>{words}</strong><br>{words}</div>'
+        else:
+            block = f"<p>{words}</p>"
+        blocks.append(block)
+        total += len(block)
+    return "".join(blocks)
+
+
+def read_history(rng, reads=5000, streak=40):
+    """Read datetimes over two years, ending in an unbroken streak of `streak` days."""
+    now = datetime.datetime(2025, 6, 1, 20, 0)
+    history = [now - datetime.timedelta(days=day, hours=rng.randint(0, 12)) for day in range(streak)]
+    history += [now - datetime.timedelta(days=rng.randint(streak + 1, 730)) for _ in range(reads - streak)]
+    history.sort(reverse=True)
+    return history, now.date()
+
+
+def genre_counts(rng, genres=200):
+    rows = [{"book__genre__name": f"Genre {i}", "count": rng.randint(1, 500)} for i in range(genres)]
+    rows[-1]["book__genre__name"] = None
+    return sorted(rows, key=lambda row: -row["count"])
+
+
+def cases(sizes, rng):
+    """name -> (function, argument). Inputs are built here so they are not part of the timing."""
+    result = {}
+    for label in sizes:
+        raw = editor_html(SIZES[label], rng)
+        clean = sanitize_content(raw)
+        result[f"sanitize_content[{label}]"] = (sanitize_content, raw)
+        result[f"split_chunks[{label}]"] = (split_chunks, clean)
+        result[f"optimize_cloudinary_images[{label}]"] = (optimize_cloudinary_images, clean)
+
+    history, today = read_history(rng)
+    result["calculate_day_streak[5000 reads]"] = (lambda h: calculate_day_streak(h, today), history)
+    counts = genre_counts(rng)
+    result["calculate_reading_tastes[200 genres]"] = (calculate_reading_tastes, counts)
+    taken = {"a-tale-by-someone"} | {f"a-tale-by-someone-{i}" for i in range(1, 1000)}
+    result["next_free_slug[1000 taken]"] = (lambda t: next_free_slug("a-tale-by-someone", t), taken)
+    return result
+
+
+class Command(BaseCommand):
+    help = (
+        "Microbenchmarks of the CPU-bound helpers run on page views and saves (content sanitizing "
+        "and chunking, Cloudinary URL rewriting, profile statistics, slug generation). Compares the "
+        "median of each against a stored baseline and fails when one got slower than the threshold."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--sizes", nargs="*", choices=list(SIZES), default=list(SIZES), help="HTML sizes to run.")
+        parser.add_argument("--only", nargs="*", help="Substrings of the benchmark names to run.")
+        parser.add_argument("--min-time", type=float, default=1.0, help="Seconds to keep repeating each benchmark.")
+        parser.add_argument("--min-rounds", type=int, default=3)
+        parser.add_argument("--max-rounds", type=int, default=1000)
+        parser.add_argument("--baseline", default=str(DEFAULT_BASELINE), help="Stored results to compare against.")
+        parser.add_argument("--threshold", type=float, default=0.25, help="Allowed median slowdown (0.25 = 25%%).")
+        parser.add_argument("--save-baseline", action="store_true", help="Write these results as the new baseline.")
+
+    def _time(self, function, argument, options):
+        function(argument)  # warm up regex caches, imports and the like
+        timings = []
+        deadline = time.perf_counter() + options["min_time"]
+        while len(timings) < options["max_rounds"] and (
+            len(timings) < options["min_rounds"] or time.perf_counter() < deadline
+        ):
+            started = time.perf_counter()
+            function(argument)
+            timings.append(time.perf_counter() - started)
+        return {
+            "rounds": len(timings),
+            "min_ms": round(min(timings) * 1000, 4),
+            "median_ms": round(statistics.median(timings) * 1000, 4),
+            "mean_ms": round(statistics.fmean(timings) * 1000, 4),
+            "stddev_ms": round(statistics.stdev(timings) * 1000, 4) if len(timings) > 1 else 0.0,
+        }
+
+    def handle(self, *args, **options):
+        benchmarks = cases(options["sizes"], random.Random(42))
+        if options["only"]:
+            benchmarks = {
+                name: case for name, case in benchmarks.items()
+                if any(part in name for part in options["only"])
+            }
+            if not benchmarks:
+                raise CommandError("No benchmark matches --only.")
+
+        results = {}
+        for name, (function, argument) in benchmarks.items():
+            results[name] = self._time(function, argument, options)
+            stats = results[name]
+            self.stdout.write(
+                f"{name:<40} median={stats['median_ms']:>11.3f}ms min={stats['min_ms']:>11.3f}ms "
+                f"rounds={stats['rounds']}"
+            )
+
+        baseline_path = Path(options["baseline"])
+        if options["save_baseline"]:
+            stored = {"benchmarks": {}}
+            if baseline_path.exists():
+                stored = json.loads(baseline_path.read_text())
+            stored["python"] = platform.python_version()
+            stored["machine"] = platform.machine()
+            stored["benchmarks"].update(results)
+            baseline_path.parent.mkdir(parents=True, exist_ok=True)
+            baseline_path.write_text(json.dumps(stored, indent=2, sort_keys=True) + "\n")
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {baseline_path}"))
+            return
+
+        if not baseline_path.exists():
+            raise CommandError(f"No baseline at {baseline_path}. Run with --save-baseline first.")
+        self._compare(results, json.loads(baseline_path.read_text()), options["threshold"])
+
+    def _compare(self, results, baseline, threshold):
+        regressions = []
+        for name, current in results.items():
+            before = baseline.get("benchmarks", {}).get(name)
+            if not before or not before.get("median_ms"):
+                self.stdout.write(f"{name:<40} no baseline")
+                continue
+            change = current["median_ms"] / before["median_ms"] - 1
+            line = f"{name:<40} {before['median_ms']}ms -> {current['median_ms']}ms ({change:+.0%})"
+            if change > threshold:
+                regressions.append(name)
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(line)
+
+        if regressions:
+            raise CommandError(f"Median regressed more than {threshold:.0%} on: {', '.join(regressions)}")
+        self.stdout.write(self.style.SUCCESS(f"No regression above {threshold:.0%}"))
@@ -0,0 +1,197 @@
+import json
+import statistics
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.db.models import Count
+from django.test import Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from books.models import Book, Genre
+
+
+class Command(BaseCommand):
+    help = (
+        "In-process HTTP benchmark of the main pages against the configured Postgres and Redis. "
+        "Reports p50/p95/p99 latency and throughput per endpoint, writes them to a JSON file and "
+        "can fail when p95 regressed against an earlier run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--requests", type=int, default=200, help="Measured requests per endpoint.")
+        parser.add_argument("--warmup", type=int, default=20, help="Unmeasured requests per endpoint (fills caches).")
+        parser.add_argument("--concurrency", type=int, default=4, help="Client threads per endpoint.")
+        parser.add_argument("--only", nargs="*", help="Endpoint names to run (default: all).")
+        parser.add_argument("--user", help="Username for the logged-in endpoints (default: the most active reader).")
+        parser.add_argument("--label", default="", help="Dataset label stored with the results, e.g. 10k.")
+        parser.add_argument("--output", default="benchmark_http.json", help="Where to write the results.")
+        parser.add_argument("--compare", help="Earlier results file to compare against.")
+        parser.add_argument("--threshold", type=float, default=0.2, help="Allowed p95 slowdown vs --compare (0.2 = 20%%).")
+        parser.add_argument("--seed", type=int, help="Top the database up to this many books (seed_scale_data) first.")
+
+    # --- Targets ---
+
+    def _targets(self, user):
+        book = (
+            Book.objects.filter(is_published=True, content__page_count__gt=1)
+            .order_by("-views_count", "id")
+            .only("id", "slug", "title")
+            .first()
+        )
+        genre = Genre.objects.annotate(n=Count("books")).order_by("-n", "id").first()
+        if book is None or genre is None:
+            raise CommandError("No published books with content. Seed the database first.")
+
+        term = book.title.split()[0][:20]
+        return {
+            "home": (reverse("home"), None),
+            "library": (reverse("library"), None),
+            "category": (reverse("category", args=[genre.slug]), None),
+            "searchbooks": (f"{reverse('searchbooks')}?q={term}", None),
+            "ajax_search": (f"{reverse('ajax_search')}?q={term[:4]}", None),
+            "read-book": (reverse("read-book", args=[book.slug]), None),
+            "pageView": (f"{reverse('pageView', args=[book.slug])}?page=2", None),
+            "book": (reverse("book", args=[book.slug]), None),
+            "community": (reverse("community"), None),
+            "profilepage": (reverse("profilepage"), user),
+        }
+
+    # --- Measuring ---
+
+    def _run(self, url, user, count, concurrency):
+        def worker(n):
+            client = Client()
+            if user is not None:
+                client.force_login(user)
+            timings = []
+            statuses = {}
+            try:
+                for _ in range(n):
+                    started = time.perf_counter()
+                    response = client.get(url)
+                    timings.append(time.perf_counter() - started)
+                    statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            finally:
+                connections.close_all()
+            return timings, statuses
+
+        shares = [count // concurrency + (1 if i < count % concurrency else 0) for i in range(concurrency)]
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            results = list(pool.map(worker, [share for share in shares if share]))
+        elapsed = time.perf_counter() - started
+
+        timings = sorted(t for result in results for t in result[0])
+        statuses = {}
+        for _, result_statuses in results:
+            for status, n in result_statuses.items():
+                statuses[str(status)] = statuses.get(str(status), 0) + n
+        return timings, statuses, elapsed
+
+    @staticmethod
+    def _summary(timings, statuses, elapsed):
+        cuts = statistics.quantiles(timings, n=100, method="inclusive") if len(timings) > 1 else timings * 99
+        return {
+            "requests": len(timings),
+            "status_codes": statuses,
+            "p50_ms": round(cuts[49] * 1000, 2),
+            "p95_ms": round(cuts[94] * 1000, 2),
+            "p99_ms": round(cuts[98] * 1000, 2),
+            "mean_ms": round(statistics.fmean(timings) * 1000, 2),
+            "throughput_rps": round(len(timings) / elapsed, 1) if elapsed else None,
+        }
+
+    def _commit(self):
+        try:
+            return subprocess.run(
+                ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                cwd=settings.BASE_DIR,
+            ).stdout.strip()
+        except Exception:
+            return None
+
+    def handle(self, *args, **options):
+        if options["seed"]:
+            missing = options["seed"] - Book.objects.count()
+            if missing > 0:
+                call_command("seed_scale_data", books=missing, stdout=self.stdout)
+            if not options["label"]:
+                options["label"] = str(options["seed"])
+
+        if options["user"]:
+            user = User.objects.filter(username=options["user"]).first()
+            if user is None:
+                raise CommandError(f"No user named {options['user']!r}.")
+        else:
+            user = User.objects.annotate(n=Count("readby")).order_by("-n", "id").first()
+
+        targets = self._targets(user)
+        if options["only"]:
+            unknown = set(options["only"]) - set(targets)
+            if unknown:
+                raise CommandError(f"Unknown endpoint(s): {', '.join(sorted(unknown))}")
+            targets = {name: targets[name] for name in options["only"]}
+
+        results = {
+            "commit": self._commit(),
+            "timestamp": timezone.now().isoformat(),
+            "dataset": {
+                "label": options["label"],
+                "books": Book.objects.count(),
+                "users": User.objects.count(),
+            },
+            "config": {
+                "requests": options["requests"],
+                "warmup": options["warmup"],
+                "concurrency": options["concurrency"],
+            },
+            "endpoints": {},
+        }
+
+        # Production-like: no debug toolbar or DEBUG query logging, test client host allowed
+        with override_settings(DEBUG=False, ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, "testserver"]):
+            for name, (url, login_as) in targets.items():
+                if options["warmup"]:
+                    self._run(url, login_as, options["warmup"], 1)
+                timings, statuses, elapsed = self._run(url, login_as, options["requests"], options["concurrency"])
+                summary = {"url": url, **self._summary(timings, statuses, elapsed)}
+                results["endpoints"][name] = summary
+                self.stdout.write(
+                    f"{name:<12} p50={summary['p50_ms']:>8}ms p95={summary['p95_ms']:>8}ms "
+                    f"p99={summary['p99_ms']:>8}ms {summary['throughput_rps']:>7} req/s {statuses}"
+                )
+
+        with open(options["output"], "w") as fh:
+            json.dump(results, fh, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Results written to {options['output']}"))
+
+        if options["compare"]:
+            self._compare(results, options["compare"], options["threshold"])
+
+    def _compare(self, results, path, threshold):
+        with open(path) as fh:
+            baseline = json.load(fh)
+
+        regressions = []
+        for name, current in results["endpoints"].items():
+            before = baseline.get("endpoints", {}).get(name)
+            if not before or not before.get("p95_ms"):
+                continue
+            change = current["p95_ms"] / before["p95_ms"] - 1
+            line = f"{name:<12} p95 {before['p95_ms']}ms -> {current['p95_ms']}ms ({change:+.0%})"
+            if change > threshold:
+                regressions.append(name)
+                self.stdout.write(self.style.ERROR(line))
+            else:
+                self.stdout.write(line)
+
+        if regressions:
+            raise CommandError(f"p95 regressed more than {threshold:.0%} on: {', '.join(regressions)}")
+        self.stdout.write(self.style.SUCCESS(f"No p95 regression above {threshold:.0%} vs {path}"))
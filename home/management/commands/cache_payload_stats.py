@@ -0,0 +1,85 @@
+import pickle
+import time
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from LeafyReads.rows import pack_page, unpack_page
+from LeafyReads.pagination import CursorPaginator
+from books.models import Book, Genre, ReadBy
+from books.rows import BOOK_CARD_ROWS, GENRE_ROWS, READ_BY_ROWS
+from community.models import Post
+from community.views import POST_ROWS
+
+
+class Command(BaseCommand):
+    help = (
+        "Compares the cached payload of each list key as pickled model instances (before) "
+        "and as packed row tuples (after): bytes per key and time to load one cache hit."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=200, help="Loads timed per payload.")
+
+    def _measure(self, payload, load, repeat):
+        data = pickle.dumps(payload, pickle.HIGHEST_PROTOCOL)
+        started = time.perf_counter()
+        for _ in range(repeat):
+            load(pickle.loads(data))
+        return len(data), (time.perf_counter() - started) / repeat * 1e6
+
+    def _report(self, name, before, after, repeat):
+        size_before, time_before = self._measure(*before, repeat)
+        size_after, time_after = self._measure(*after, repeat)
+        self.stdout.write(
+            f"{name}: {size_before} -> {size_after} bytes "
+            f"({size_after / size_before * 100 if size_before else 0:.0f}%), "
+            f"load {time_before:.0f} -> {time_after:.0f} us"
+        )
+
+    def handle(self, *args, **options):
+        repeat = options["repeat"]
+        same = lambda value: value
+
+        # home_categories / library_categories
+        genres = Genre.objects.all()
+        self._report(
+            "categories",
+            (list(genres), same),
+            (GENRE_ROWS.pack(genres), GENRE_ROWS.unpack),
+            repeat,
+        )
+
+        # library_books_* (first page, newest)
+        books = Book.objects.filter(is_published=True).order_by("-uploaded_at", "-id")
+        old_page = CursorPaginator(books.defer("content"), 50).get_page("")
+        old_page.object_list = list(old_page.object_list)
+        new_page = CursorPaginator(books.only(*BOOK_CARD_ROWS.fields, "uploaded_at"), 50).get_page("")
+        self._report(
+            "library_books",
+            (old_page, same),
+            (pack_page(BOOK_CARD_ROWS, new_page), lambda packed: unpack_page(BOOK_CARD_ROWS, packed)),
+            repeat,
+        )
+
+        # library_recent_user_* / user_sidebar:* (the most active reader)
+        reader = User.objects.filter(readby__isnull=False).order_by("-readby__readed_at").first()
+        if reader:
+            reads = ReadBy.objects.filter(user=reader).order_by("-readed_at")[:10]
+            self._report(
+                "recent_reads",
+                (list(reads.select_related("book")), same),
+                (READ_BY_ROWS.pack(reads), READ_BY_ROWS.unpack),
+                repeat,
+            )
+
+        # community feed (first page)
+        posts = Post.objects.order_by("-created_at", "-id")
+        old_posts = list(posts.select_related("author", "book").prefetch_related("images")[:20])
+        new_posts = list(posts.select_related("author", "book").only(*POST_ROWS.fields)[:20])
+        self._report(
+            "community_feed",
+            (old_posts, same),
+            (POST_ROWS.pack(new_posts), POST_ROWS.unpack),
+            repeat,
+        )
@@ -0,0 +1,37 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django_redis import get_redis_connection
+
+
+class Command(BaseCommand):
+    help = (
+        "Reports memory usage, eviction policy and hit rate for every cache alias. "
+        "Hit/miss counters are per Redis server, so aliases sharing a server report the same rate."
+    )
+
+    def handle(self, *args, **options):
+        for alias in settings.CACHES:
+            try:
+                client = get_redis_connection(alias)
+                memory = client.info("memory")
+                stats = client.info("stats")
+                keys = client.dbsize()
+            except NotImplementedError:
+                self.stdout.write(f"{alias}: not a Redis cache, skipped")
+                continue
+            except Exception as e:
+                self.stdout.write(self.style.ERROR(f"{alias}: unavailable ({e})"))
+                continue
+
+            hits = stats.get("keyspace_hits", 0)
+            misses = stats.get("keyspace_misses", 0)
+            hit_rate = (hits / (hits + misses) * 100) if hits + misses else 0
+
+            self.stdout.write(
+                f"{alias}: keys={keys} "
+                f"used_memory={memory.get('used_memory_human')} "
+                f"maxmemory={memory.get('maxmemory_human')} "
+                f"policy={memory.get('maxmemory_policy')} "
+                f"evicted={stats.get('evicted_keys', 0)} "
+                f"hit_rate={hit_rate:.1f}%"
+            )
@@ -0,0 +1,39 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from home.outbox import RateLimiter, send_due
+
+
+class Command(BaseCommand):
+    help = (
+        "Sends queued EmailOutbox mail in batches over one SMTP connection, with retries and a rate limit. "
+        "Celery beat runs the same drain every minute (home.tasks.send_outbox); "
+        "run it by hand, or with --loop as a long-running worker instead of beat."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=50)
+        parser.add_argument("--rate", type=float, default=settings.EMAIL_OUTBOX_RATE, help="Max messages per second (0 = unlimited).")
+        parser.add_argument("--loop", action="store_true", help="Keep polling instead of exiting when the outbox is drained.")
+        parser.add_argument("--idle", type=float, default=5.0, help="Seconds to wait between polls of an empty outbox (--loop).")
+
+    def handle(self, *args, **options):
+        limiter = RateLimiter(options["rate"])
+        totals = [0, 0, 0]
+        try:
+            while True:
+                counts = send_due(options["batch_size"], options["rate"], limiter=limiter)
+                totals = [total + count for total, count in zip(totals, counts)]
+                if any(counts):
+                    self.stdout.write(f"sent={counts[0]} retried={counts[1]} failed={counts[2]}")
+                    continue
+                if not options["loop"]:
+                    break
+                time.sleep(options["idle"])
+        except KeyboardInterrupt:
+            pass
+        self.stdout.write(self.style.SUCCESS(
+            f"Sent {totals[0]}, will retry {totals[1]}, gave up on {totals[2]}."
+        ))
@@ -0,0 +1,95 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test import override_settings
+
+from LeafyReads.instrumentation import receiver_budget, trace_signals
+from books.models import Book, BookContent, Genre, Like, ReadBy, ReadLater
+from community.models import Comment, Post
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Runs the common writes (book create/update/publish/delete, likes, read-laters, reads, "
+        "posts, post likes, comments) inside a rolled back transaction and reports the time, "
+        "calls and queries of every traced signal receiver, per signal and per sender."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=5, help="Times to run the whole scenario.")
+        parser.add_argument("--json", dest="json_output", help="Also write the numbers to this file.")
+
+    def scenario(self, author, reader, genre, n):
+        book = Book(
+            title=f"Signal costs {n}",
+            slug=f"signal-costs-{n}",
+            author="Signal Costs",
+            genre=genre,
+            uploaded_by=author,
+            cover_front="image/upload/v1/samples/book-cover.jpg",
+            is_draft=False,
+        )
+        book.save()
+        BookContent.objects.create(book=book, content="<p>One.</p><p>Two.</p>" * 50)
+
+        book.summary = "Updated."
+        book.save()
+        book.is_published = True
+        book.save()
+
+        Like.objects.create(user=reader, book=book).delete()
+        ReadLater.objects.create(user=reader, book=book).delete()
+        ReadBy.objects.create(user=reader, book=book)
+
+        post = Post.objects.create(author=reader, book=book, content="What did everyone think of the ending?")
+        post.likes.add(author)
+        Comment.objects.create(post=post, author=author, content="Loved it.").delete()
+        post.delete()
+
+        book.delete()
+
+    def handle(self, *args, **options):
+        author = User.objects.order_by("id").first()
+        reader = User.objects.exclude(pk=getattr(author, "pk", None)).order_by("id").first()
+        genre = Genre.objects.order_by("id").first()
+        if not (author and reader and genre):
+            self.stderr.write("Needs at least two users and one genre (see seed_scale_data).")
+            return
+
+        # Keep the publish e-mail in memory
+        with override_settings(EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend"):
+            with trace_signals() as trace:
+                try:
+                    with transaction.atomic():
+                        for n in range(options["repeat"]):
+                            self.scenario(author, reader, genre, n)
+                        raise Rollback
+                except Rollback:
+                    pass
+
+        report = trace.as_dict()
+        for signal_name, senders in report.items():
+            signal_ms = sum(r["ms"] for receivers in senders.values() for r in receivers.values())
+            self.stdout.write(self.style.MIGRATE_HEADING(f"{signal_name}  ({signal_ms:.1f} ms)"))
+            for sender, receivers in senders.items():
+                sender_ms = sum(r["ms"] for r in receivers.values())
+                sender_queries = sum(r["queries"] for r in receivers.values())
+                self.stdout.write(f"  {sender}  ({sender_ms:.1f} ms, {sender_queries} queries)")
+                for receiver, stats in sorted(receivers.items(), key=lambda item: -item[1]["ms"]):
+                    line = (
+                        f"    {receiver:<55} calls={stats['calls']:<4} total={stats['ms']:>8.2f}ms "
+                        f"max={stats['max_ms']:>7.2f}ms queries={stats['queries']:<4} "
+                        f"budget={receiver_budget(receiver)}ms"
+                    )
+                    self.stdout.write(self.style.ERROR(line) if stats["over_budget"] else line)
+
+        if options["json_output"]:
+            with open(options["json_output"], "w") as fh:
+                json.dump(report, fh, indent=2)
+        self.stdout.write(self.style.SUCCESS("Done; every change was rolled back."))
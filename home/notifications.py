@@ -0,0 +1,71 @@
+"""
+Unread notification counter and dropdown cache.
+
+The unread count lives in the hot cache alias and is kept up to date by the
+create and mark-read paths, so page renders never run a COUNT. A missing key
+simply falls back to the database on the next read.
+"""
+from django.core.cache import cache
+
+from LeafyReads.cache import hot_cache
+from home.models import Notification
+
+UNREAD_TIMEOUT = 60 * 60
+DROPDOWN_TIMEOUT = 60
+
+
+def unread_key(user_id):
+    return f"notif_unread:{user_id}"
+
+
+def dropdown_key(user_id):
+    return f"notif_dropdown:{user_id}"
+
+
+def unread_count(user_id):
+    count = hot_cache.get(unread_key(user_id))
+    if count is None:
+        count = Notification.objects.filter(recipient_id=user_id, is_read=False).count()
+        hot_cache.add(unread_key(user_id), count, timeout=UNREAD_TIMEOUT)
+    return count
+
+
+def notification_added(user_id):
+    cache.delete(dropdown_key(user_id))
+    try:
+        hot_cache.incr(unread_key(user_id))
+    except ValueError:
+        # Not cached yet, the next read counts from the DB
+        pass
+
+
+def notifications_read(user_id, count):
+    cache.delete(dropdown_key(user_id))
+    if not count:
+        return
+    try:
+        if hot_cache.decr(unread_key(user_id), count) < 0:
+            hot_cache.delete(unread_key(user_id))
+    except ValueError:
+        pass
+
+
+def forget_notifications(user_id):
+    """Drops both cached values when the change can't be applied as a delta."""
+    hot_cache.delete(unread_key(user_id))
+    cache.delete(dropdown_key(user_id))
+
+
+def forget_notifications_many(user_ids):
+    """forget_notifications() for many users in two round trips."""
+    user_ids = set(user_ids)
+    if user_ids:
+        hot_cache.delete_many([unread_key(user_id) for user_id in user_ids])
+        cache.delete_many([dropdown_key(user_id) for user_id in user_ids])
+
+
+def mark_notifications_read(user, **filters):
+    """Marks the user's matching unread notifications as read and updates the counter."""
+    updated = Notification.objects.filter(recipient=user, is_read=False, **filters).update(is_read=True)
+    notifications_read(user.id, updated)
+    return updated
@@ -0,0 +1,175 @@
+"""
+Durable outgoing e-mail.
+
+Request code only inserts EmailOutbox rows (queue_email / queue_emails), in
+the same transaction as the change that caused the mail, so nothing is lost
+when a worker restarts. The send_outbox command drains them with send_due():
+due rows are claimed in a short transaction with SELECT ... FOR UPDATE SKIP
+LOCKED (several workers can run side by side) and marked SENDING with a
+lease, then sent outside any transaction over one reused connection at no
+more than settings.EMAIL_OUTBOX_RATE messages a second. Each result is
+recorded as soon as it is known; failures are retried with exponential
+backoff until settings.EMAIL_OUTBOX_MAX_ATTEMPTS. Rows whose lease ran out
+(the worker died mid-batch) are due again, so a mail that went out just
+before such a crash may be sent twice.
+"""
+import logging
+import random
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+from django.utils import timezone
+
+from home.models import EmailOutbox
+
+logger = logging.getLogger(__name__)
+
+BACKOFF_BASE = 60  # seconds before the first retry, doubled on each further one
+BACKOFF_MAX = 6 * 60 * 60
+# How long a claimed batch is left to its worker before others may take it over
+CLAIM_LEASE = timedelta(minutes=10)
+
+
+def _row(subject, body, recipient_list, html_message=None, from_email=None):
+    return EmailOutbox(
+        subject=subject[:255],
+        body=body,
+        html_body=html_message or '',
+        from_email=from_email or '',
+        to=list(recipient_list),
+    )
+
+
+def queue_email(subject, body, recipient_list, html_message=None, from_email=None):
+    """Same arguments as send_mail(); stores the mail for the worker instead of sending it."""
+    row = _row(subject, body, recipient_list, html_message, from_email)
+    row.save()
+    return row
+
+
+def queue_emails(emails):
+    """queue_email() for many mails (dicts of its arguments) in one INSERT."""
+    return EmailOutbox.objects.bulk_create([_row(**email) for email in emails])
+
+
+def backoff(attempts):
+    """Delay before retry number `attempts`, with jitter so failed batches don't retry in lockstep."""
+    delay = min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+    return timedelta(seconds=delay * random.uniform(0.8, 1.2))
+
+
+def _message(row, connection):
+    message = EmailMultiAlternatives(
+        row.subject, row.body, row.from_email or settings.DEFAULT_FROM_EMAIL, row.to, connection=connection
+    )
+    if row.html_body:
+        message.attach_alternative(row.html_body, 'text/html')
+    return message
+
+
+class RateLimiter:
+    def __init__(self, per_second):
+        self.interval = 1.0 / per_second if per_second else 0.0
+        self.next_at = 0.0
+
+    def wait(self):
+        now = time.monotonic()
+        if now < self.next_at:
+            time.sleep(self.next_at - now)
+            now = self.next_at
+        self.next_at = now + self.interval
+
+
+def _close(connection):
+    try:
+        connection.close()
+    except Exception:
+        # Already broken; open() makes a new one
+        pass
+
+
+def _give_up_or_retry(row, error, max_attempts):
+    """Records a failed attempt; True if the row is given up on."""
+    row.last_error = f"{type(error).__name__}: {error}"[:2000]
+    if row.attempts >= max_attempts:
+        row.status = EmailOutbox.FAILED
+        logger.error("Giving up on outbox mail %s after %s attempts: %s", row.id, row.attempts, error)
+        return True
+    row.status = EmailOutbox.PENDING
+    row.next_attempt_at = timezone.now() + backoff(row.attempts)
+    return False
+
+
+def _claim(batch_size):
+    """Claims up to `batch_size` due rows: marks them SENDING under a lease, in one short transaction."""
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(
+            EmailOutbox.objects.filter(
+                status__in=(EmailOutbox.PENDING, EmailOutbox.SENDING), next_attempt_at__lte=now
+            )
+            .order_by('next_attempt_at', 'id')
+            .select_for_update(skip_locked=True)[:batch_size]
+        )
+        for row in rows:
+            row.status = EmailOutbox.SENDING
+            # Counted on claim, so a mail that keeps killing its worker is still given up on
+            row.attempts += 1
+            row.next_attempt_at = now + CLAIM_LEASE
+        EmailOutbox.objects.bulk_update(rows, ['status', 'attempts', 'next_attempt_at'])
+    return rows
+
+
+def _record(row, lease):
+    """Saves the outcome of a claimed row, unless its lease ran out and another worker took it."""
+    EmailOutbox.objects.filter(pk=row.pk, status=EmailOutbox.SENDING, next_attempt_at=lease).update(
+        status=row.status, next_attempt_at=row.next_attempt_at, last_error=row.last_error, sent_at=row.sent_at,
+    )
+
+
+def send_due(batch_size=50, rate=None, max_attempts=None, connection=None, limiter=None):
+    """
+    Sends one batch of due mail. Returns (sent, retried, failed) counts;
+    all zeros means nothing was due.
+    """
+    rate = settings.EMAIL_OUTBOX_RATE if rate is None else rate
+    max_attempts = max_attempts or settings.EMAIL_OUTBOX_MAX_ATTEMPTS
+    limiter = limiter or RateLimiter(rate)
+    sent = retried = failed = 0
+
+    rows = _claim(batch_size)
+    if not rows:
+        return 0, 0, 0
+
+    # No transaction from here on: a slow SMTP server holds no locks
+    connection = connection or get_connection()
+    try:
+        for row in rows:
+            lease = row.next_attempt_at
+            limiter.wait()
+            try:
+                # Opens on first use and after a failure; a no-op while connected
+                connection.open()
+                # One message per call so a bad address only fails its own row
+                if not connection.send_messages([_message(row, connection)]):
+                    raise RuntimeError("the mail backend sent nothing")
+            except Exception as e:
+                if _give_up_or_retry(row, e, max_attempts):
+                    failed += 1
+                else:
+                    retried += 1
+                # The server may have dropped us; the next row starts on a fresh connection
+                _close(connection)
+            else:
+                row.status = EmailOutbox.SENT
+                row.sent_at = timezone.now()
+                row.last_error = ''
+                sent += 1
+            _record(row, lease)
+    finally:
+        _close(connection)
+
+    return sent, retried, failed
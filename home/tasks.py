@@ -0,0 +1,139 @@
+"""
+Notifications created in the background for home.signals, and the e-mail
+outbox drain that CELERY_BEAT_SCHEDULE runs every minute.
+
+The notification tasks take ids and look the rows up again; anything deleted
+in the meantime means there is nothing left to notify about. Each notification
+carries a task_key, so a task that runs twice does not notify twice.
+"""
+import time
+
+from celery import shared_task
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
+from django.db import IntegrityError
+from community.models import Post, Comment
+from home import outbox
+from home.models import Notification
+from LeafyReads.tasks import create_once, task_key
+
+
+def _post_preview(post, length):
+    # If the post is about a book, use the book title. Otherwise, use content.
+    if post.book:
+        return post.book.title
+    if post.content:
+        return post.content[:length] + "..." if len(post.content) > length else post.content
+    return "Update"
+
+
+@shared_task(bind=True)
+def notify_post_like(self, post_id, liker_ids):
+    post = Post.objects.select_related('author', 'book').filter(pk=post_id).first()
+    if post is None:
+        return
+    post_preview = _post_preview(post, 40)
+    # Don't notify if I like my own post
+    for liker in User.objects.filter(pk__in=liker_ids).exclude(pk=post.author_id).only('id', 'username'):
+        create_once(
+            Notification, task_key(self, liker.id),
+            recipient=post.author,
+            actor=liker,
+            notification_type='like',
+            content_object=post, # Links to the Post so clicking it goes to the post
+            message=f"<strong>{liker.username}</strong> liked your post <strong>“{post_preview}”</strong> ❤️"
+        )
+
+
+@shared_task(bind=True)
+def notify_new_comment(self, comment_id):
+    comment = Comment.objects.select_related('author', 'post__author').filter(pk=comment_id).first()
+    if comment is None or comment.post.author_id == comment.author_id:
+        return
+    post = comment.post
+    # Truncate post content if it doesn't have a title (posts usually just have content)
+    post_preview = post.content[:40] + "..."
+    if hasattr(post, 'title') and post.title:
+        post_preview = post.title
+
+    create_once(
+        Notification, task_key(self),
+        recipient=post.author,
+        actor=comment.author,
+        notification_type='comment',
+        content_object=post,
+        message=f"<strong>{comment.author.username}</strong> commented on your post <strong>“{post_preview}”</strong> 💬"
+    )
+
+
+@shared_task(bind=True)
+def notify_new_post(self, post_id):
+    """The author's 'published' notification, and a mention for the uploader of the book it is about."""
+    post = Post.objects.select_related('author', 'book__uploaded_by').filter(pk=post_id).first()
+    if post is None:
+        return
+
+    create_once(
+        Notification, task_key(self, 'author'),
+        recipient=post.author,
+        actor=post.author,
+        notification_type='post_publish',
+        content_object=post,
+        message=f"<strong>Your post “{post.content[:30]}...”</strong> has been published to the community 📢"
+    )
+
+    book = post.book
+    if book and book.uploaded_by and book.uploaded_by_id != post.author_id:
+        create_once(
+            Notification, task_key(self, 'uploader'),
+            recipient=book.uploaded_by,
+            actor=post.author,
+            notification_type='book_mention',
+            content_object=post,
+            message=f"<strong>{post.author.username}</strong> mentioned your book <strong>“{book.title}”</strong> in a discussion 📚"
+        )
+
+
+@shared_task
+def cleanup_post_notifications(post_id):
+    # Removes "User liked your post", "User commented...", etc.
+    Notification.objects.filter(
+        content_type=ContentType.objects.get_for_model(Post),
+        object_id=post_id
+    ).delete()
+
+
+@shared_task(bind=True)
+def notify_post_delete(self, author_id, message):
+    try:
+        # If the user was deleted as well, there is nobody to tell
+        author = User.objects.get(pk=author_id)
+        create_once(
+            Notification, task_key(self),
+            recipient=author,
+            actor=author,
+            notification_type='post_delete',
+            content_object=author,
+            message=message
+        )
+    except (User.DoesNotExist, IntegrityError):
+        pass
+
+
+# Leaves the rest for the next beat run instead of overlapping it
+SEND_OUTBOX_BUDGET = 50
+
+
+@shared_task
+def send_outbox():
+    """Sends due outbox mail until none is left or SEND_OUTBOX_BUDGET seconds have passed."""
+    deadline = time.monotonic() + SEND_OUTBOX_BUDGET
+    limiter = outbox.RateLimiter(settings.EMAIL_OUTBOX_RATE)
+    totals = [0, 0, 0]
+    while time.monotonic() < deadline:
+        counts = outbox.send_due(limiter=limiter)
+        if not any(counts):
+            break
+        totals = [total + count for total, count in zip(totals, counts)]
+    return totals
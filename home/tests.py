@@ -1,2 +1,245 @@
+from datetime import timedelta
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_in
+from django.contrib.contenttypes.models import ContentType
+from django.core import mail
+from django.db import connection as db_connection
+from django.dispatch import Signal
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from LeafyReads import instrumentation
+
+from books.models import Book
+from books.tasks import notify_books_published
+from community.models import Post
+from home import outbox, tasks
+from home.models import EmailOutbox, Notification
+from home.notifications import unread_key
+from home.signals import show_login_message
+from LeafyReads.cache import hot_cache
+
+# Views render {% static %}; the manifest storage needs collectstatic first
+PLAIN_STATIC = {**settings.STORAGES, "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"}}
+
+
+class TaskRedeliveryTests(TestCase):
+    """A task message delivered twice (acks_late after a worker died) notifies once."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user("author", email="author@example.com", password="x")
+        cls.liker = User.objects.create_user("liker", password="x")
+        cls.book = Book.objects.create(
+            title="Dune", slug="dune", author="Herbert", cover_front="books/dune",
+            uploaded_by=cls.author, is_published=True,
+        )
+        cls.post = Post.objects.create(author=cls.liker, book=cls.book, content="Spice must flow")
+
+    def run_twice(self, task, *args):
+        for _ in range(2):
+            task.apply(args, task_id="redelivered")
+
+    def test_new_post(self):
+        self.run_twice(tasks.notify_new_post, self.post.pk)
+        self.assertEqual(
+            sorted(Notification.objects.values_list("notification_type", flat=True)),
+            ["book_mention", "post_publish"],
+        )
+
+    def test_post_like(self):
+        post = Post.objects.create(author=self.author, content="Hello")
+        self.run_twice(tasks.notify_post_like, post.pk, [self.liker.pk])
+        self.assertEqual(Notification.objects.filter(notification_type="like").count(), 1)
+
+    def test_separate_messages_still_notify(self):
+        post = Post.objects.create(author=self.author, content="Hello")
+        tasks.notify_post_like.apply((post.pk, [self.liker.pk]), task_id="first")
+        tasks.notify_post_like.apply((post.pk, [self.liker.pk]), task_id="second")
+        self.assertEqual(Notification.objects.filter(notification_type="like").count(), 2)
+
+    def test_books_published_queues_one_mail(self):
+        self.run_twice(notify_books_published, [self.book.pk])
+        self.assertEqual(Notification.objects.filter(notification_type="book_published").count(), 1)
+        self.assertEqual(EmailOutbox.objects.count(), 1)
+
+
+class FakeMailConnection:
+    """Stands in for the SMTP backend: `results` are what each send returns, or the error it raises."""
+
+    def __init__(self, *results, during_send=None):
+        self.results = list(results)
+        self.during_send = during_send
+        self.sent = []
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def send_messages(self, messages):
+        if self.during_send:
+            self.during_send()
+        result = self.results.pop(0) if self.results else 1
+        if isinstance(result, Exception):
+            raise result
+        self.sent += messages
+        return result
+
+
+class OutboxTests(TestCase):
+    def send(self, *results, **kwargs):
+        return outbox.send_due(rate=0, connection=FakeMailConnection(*results), **kwargs)
+
+    def make_due(self, row):
+        EmailOutbox.objects.filter(pk=row.pk).update(next_attempt_at=timezone.now())
+
+    def test_queued_mail_is_sent_once(self):
+        row = outbox.queue_email("Hi", "Body", ["a@example.com"], html_message="<p>Body</p>")
+        self.assertEqual(outbox.send_due(rate=0), (1, 0, 0))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].alternatives[0][0], "<p>Body</p>")
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.attempts), (EmailOutbox.SENT, 1))
+        self.assertEqual(outbox.send_due(rate=0), (0, 0, 0))
+
+    def test_failures_back_off_then_give_up(self):
+        row = outbox.queue_email("Hi", "Body", ["a@example.com"])
+        before = timezone.now()
+        self.assertEqual(self.send(OSError("refused"), max_attempts=3), (0, 1, 0))
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.attempts), (EmailOutbox.PENDING, 1))
+        self.assertIn("refused", row.last_error)
+        # BACKOFF_BASE with +-20% jitter
+        self.assertGreaterEqual(row.next_attempt_at, before + timedelta(seconds=48))
+        self.assertLessEqual(row.next_attempt_at, timezone.now() + timedelta(seconds=72))
+        # Not due again until then
+        self.assertEqual(self.send(), (0, 0, 0))
+
+        self.make_due(row)
+        before = timezone.now()
+        self.assertEqual(self.send(OSError("refused"), max_attempts=3), (0, 1, 0))
+        row.refresh_from_db()
+        self.assertGreaterEqual(row.next_attempt_at, before + timedelta(seconds=96))
+
+        self.make_due(row)
+        self.assertEqual(self.send(OSError("refused"), max_attempts=3), (0, 0, 1))
+        row.refresh_from_db()
+        self.assertEqual((row.status, row.attempts), (EmailOutbox.FAILED, 3))
+        self.make_due(row)
+        self.assertEqual(self.send(), (0, 0, 0))
+
+    def test_a_backend_that_sends_nothing_is_a_failure(self):
+        row = outbox.queue_email("Hi", "Body", ["a@example.com"])
+        self.assertEqual(self.send(0), (0, 1, 0))
+        row.refresh_from_db()
+        self.assertEqual(row.status, EmailOutbox.PENDING)
+        self.assertIsNone(row.sent_at)
+
+    def test_one_bad_row_does_not_fail_the_batch(self):
+        outbox.queue_emails([
+            {"subject": "1", "body": "b", "recipient_list": ["a@example.com"]},
+            {"subject": "2", "body": "b", "recipient_list": ["b@example.com"]},
+        ])
+        self.assertEqual(self.send(ValueError("bad address"), 1), (1, 1, 0))
+
+    def test_rows_are_claimed_before_sending(self):
+        row = outbox.queue_email("Hi", "Body", ["a@example.com"])
+        seen = []
+
+        def during_send():
+            seen.append(EmailOutbox.objects.values_list("status", "next_attempt_at").get(pk=row.pk))
+
+        outbox.send_due(rate=0, connection=FakeMailConnection(during_send=during_send))
+        status, lease = seen[0]
+        self.assertEqual(status, EmailOutbox.SENDING)
+        self.assertGreater(lease, timezone.now() + outbox.CLAIM_LEASE - timedelta(minutes=1))
+
+    def test_expired_claims_are_taken_over(self):
+        live = outbox.queue_email("live", "Body", ["a@example.com"])
+        expired = outbox.queue_email("expired", "Body", ["a@example.com"])
+        EmailOutbox.objects.filter(pk=live.pk).update(
+            status=EmailOutbox.SENDING, next_attempt_at=timezone.now() + outbox.CLAIM_LEASE
+        )
+        EmailOutbox.objects.filter(pk=expired.pk).update(
+            status=EmailOutbox.SENDING, next_attempt_at=timezone.now() - timedelta(seconds=1), attempts=1
+        )
+        connection = FakeMailConnection()
+        self.assertEqual(outbox.send_due(rate=0, connection=connection), (1, 0, 0))
+        self.assertEqual([message.subject for message in connection.sent], ["expired"])
+        expired.refresh_from_db()
+        self.assertEqual((expired.status, expired.attempts), (EmailOutbox.SENT, 2))
+
+
+class OutboxLockTests(TransactionTestCase):
+    def test_nothing_is_locked_while_sending(self):
+        outbox.queue_email("Hi", "Body", ["a@example.com"])
+        in_transaction = []
+        connection = FakeMailConnection(during_send=lambda: in_transaction.append(db_connection.in_atomic_block))
+        self.assertEqual(outbox.send_due(rate=0, connection=connection), (1, 0, 0))
+        self.assertEqual(in_transaction, [False])
+
+
+frames = []
+
+
+def record_frame(signal, sender, **kwargs):
+    frames.append(instrumentation._receiver_frame.get())
+
+
+class SignalTracingTests(SimpleTestCase):
+    """Receiver tracing wraps the private Signal._live_receivers; these fail if Django changes it."""
+
+    def setUp(self):
+        self.signal = Signal()
+        self.signal.connect(record_frame)
+        frames.clear()
+        modules = instrumentation._traced_modules
+        self.addCleanup(setattr, Signal, "_live_receivers", instrumentation._original_live_receivers)
+        self.addCleanup(setattr, instrumentation, "_traced_modules", modules)
+
+    def test_live_receivers_contract(self):
+        self.assertIsNotNone(instrumentation._original_live_receivers)
+        sync_receivers, async_receivers = instrumentation._original_live_receivers(self.signal, None)
+        self.assertEqual((list(sync_receivers), list(async_receivers)), ([record_frame], []))
+
+    @override_settings(SIGNAL_TRACING=False)
+    def test_off_by_default(self):
+        instrumentation.install_signal_tracing()
+        self.assertIs(Signal._live_receivers, instrumentation._original_live_receivers)
+
+    @override_settings(SIGNAL_TRACING=True, SIGNAL_TRACE_MODULES=[__name__])
+    def test_traced_only_while_collecting(self):
+        instrumentation.install_signal_tracing()
+        self.assertIs(Signal._live_receivers, instrumentation._live_traced_receivers)
+
+        self.signal.send(sender=User)
+        with instrumentation.trace_signals() as trace:
+            self.signal.send(sender=User)
+
+        self.assertIsNone(frames[0])
+        self.assertIsInstance(frames[1], instrumentation.ReceiverFrame)
+        receivers = trace.as_dict()[repr(self.signal)]["auth.User"]
+        self.assertEqual(receivers[f"{__name__}.record_frame"]["calls"], 1)
+
+
+@override_settings(STORAGES=PLAIN_STATIC)
+class NotificationBadgeTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user("reader", password="x")
+        hot_cache.delete(unread_key(self.user.pk))
+        user_logged_in.disconnect(show_login_message)
+        self.addCleanup(user_logged_in.connect, show_login_message)
+        self.client.force_login(self.user)
+
+    def test_dot_only_with_unread_notifications(self):
+        self.assertNotContains(self.client.get(reverse("aboutUs")), 'class="notify-dot"')
+        Notification.objects.create(
+            recipient=self.user, message="Hi", notification_type="promotion",
+            content_type=ContentType.objects.get_for_model(User), object_id=self.user.pk,
+        )
+        self.assertContains(self.client.get(reverse("aboutUs")), 'class="notify-dot"', count=2)
@@ -10,5 +10,6 @@ urlpatterns = [
     path('logout/', views.customLogout, name='logout'),
     path('redirecting/<id>',views.promo_link, name="promo_link"),
     path('ajax/submit-feedback/', views.submit_feedback, name='submit_feedback'),
+    path('ajax/notifications/', views.notifications_dropdown, name='notifications_dropdown'),
 
 ]
@@ -1,69 +1,56 @@
 from django.shortcuts import render, redirect
 from django.contrib.auth import logout
 from django.contrib import messages
-from books.models import Genre, Book
 from home.models import Notification
 from django.core.cache import cache
+from LeafyReads.cache import get_or_compute, HOME
+from books.trending import trending_books
+from books.rows import HOME_CATEGORIES_KEY, cached_genres
 import random
-from django.db.models import F, ExpressionWrapper, FloatField, Func
-from django.db.models.functions import Now, ExtractDay
 import json
 from django.http import JsonResponse
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import require_POST, require_GET
+from django.template.loader import render_to_string
+from .notifications import dropdown_key, unread_count, DROPDOWN_TIMEOUT
 from .models import Feedback
 
 def home(request):
     # 1. Categories
-    categories = cache.get("home_categories")
-    if categories is None:
-        categories = list(Genre.objects.only("id", "name", "slug", "lucidicon"))
-        cache.set("home_categories", categories, timeout=60 * 60 * 24)
-    
-    categories = categories[:]
+    categories = cached_genres(HOME_CATEGORIES_KEY)
     random.shuffle(categories)
 
-    # 2. TRENDING ALGORITHM (Static Fields + Gravity)
-    books = cache.get("home_books_trending")
-
-    if books is None:
-        books = list(
-            Book.objects.filter(is_published=True)
+    # 2. TRENDING (materialized by `update_trending`, read through an index)
+    books = get_or_compute(
+        "books_trending",
+        lambda: list(
+            trending_books()
             .select_related("genre")
-            .defer("pdf_file", "audio_file", "price", "isbn", "updated_at")
-            .annotate(
-                # Calculate "Engagement Score" 
-                # We give high weight to Likes/Saves, low weight to Views
-                engagement=ExpressionWrapper(
-                    (F('likes_count') * 5) + 
-                    (F('read_later_count') * 3) + 
-                    (F('views_count') * 1),
-                    output_field=FloatField()
-                ),
-                
-                # Calculate "Age" in days (handling NULLs/New uploads)
-                # We add +2 to age so brand new books don't divide by zero
-                book_age=ExpressionWrapper(
-                    ExtractDay(Now() - F('uploaded_at')) + 2.0,
-                    output_field=FloatField()
-                )
-            )
-            .annotate(
-                # Apply Gravity
-                # Score = Engagement / Age^1.5
-                # The power (1.5) determines how fast books "fall" off the trending list.
-                # Higher number = Faster turnover (Fresh content wins).
-                trending_score=ExpressionWrapper(
-                    F('engagement') / Func(F('book_age'), 1.5, function='POWER'),
-                    output_field=FloatField()
-                )
-            )
-            .order_by('-trending_score')[:28]
-        )
-
-        cache.set("home_books_trending", books, timeout=60 * 15)
+            .defer("pdf_file", "audio_file", "price", "isbn", "updated_at")[:28]
+        ),
+        timeout=60 * 15,
+        family=HOME,
+    )
 
     return render(request, "home.html", {"books": books, "category": categories})
 
+@require_GET
+def notifications_dropdown(request):
+    if not request.user.is_authenticated:
+        return JsonResponse({'html': '', 'unread_count': 0})
+
+    key = dropdown_key(request.user.id)
+    html = cache.get(key)
+    if html is None:
+        notifs = (
+            Notification.objects.filter(recipient=request.user)
+            .select_related('actor')
+            .prefetch_related('content_object')[:10]
+        )
+        html = render_to_string('notification_list.html', {'notifications': notifs}, request=request)
+        cache.set(key, html, timeout=DROPDOWN_TIMEOUT)
+
+    return JsonResponse({'html': html, 'unread_count': unread_count(request.user.id)})
+
 def aboutUs(request):
     return render(request, "aboutUs.html")
 
@@ -10,8 +10,59 @@ from django.db.models import Count, Exists, OuterRef
 from django.db.models import Q
 from home.models import Notification,ContentType
 from django.utils import timezone
+from books.counters import overlay_pending_views
+from home.notifications import mark_notifications_read
 import json
 
+TASTE_COLORS = ['var(--dash-primary)', '#f59e0b', '#3b82f6', '#ef4444', '#8b5cf6']
+
+
+def calculate_day_streak(history, today):
+    """Consecutive days with a read, ending today or yesterday. `history` is read datetimes, any order."""
+    read_dates = set(dt.date() for dt in history)
+    one_day = timezone.timedelta(days=1)
+    curr = today if today in read_dates else today - one_day
+    day_streak = 0
+    while curr in read_dates:
+        day_streak += 1
+        curr -= one_day
+    return day_streak
+
+
+def calculate_reading_tastes(genre_counts):
+    """Top three genres plus 'Other' with their percentages, and the conic-gradient for the donut."""
+    genre_counts = list(genre_counts)
+    total_read = sum(g['count'] for g in genre_counts)
+
+    reading_tastes = [
+        {
+            'label': g['book__genre__name'] or 'Unknown',
+            'count': g['count'],
+            'color': TASTE_COLORS[i],
+        }
+        for i, g in enumerate(genre_counts[:3])
+    ]
+    other_count = total_read - sum(item['count'] for item in reading_tastes)
+    if other_count > 0:
+        reading_tastes.append({
+            'label': 'Other',
+            'count': other_count,
+            'color': TASTE_COLORS[3]
+        })
+
+    current_percentage = 0
+    gradient_parts = []
+    for item in reading_tastes:
+        percentage = (item['count'] / total_read) * 100 if total_read > 0 else 0
+        item['percentage'] = round(percentage)
+        next_percentage = current_percentage + percentage
+        gradient_parts.append(f"{item['color']} {current_percentage}% {next_percentage}%")
+        current_percentage = next_percentage
+
+    donut_gradient = ", ".join(gradient_parts) if gradient_parts else "var(--dash-track) 0% 100%"
+    return reading_tastes, donut_gradient
+
+
 @login_required
 def profilepage(request):
     user = request.user
@@ -30,63 +81,11 @@ def profilepage(request):
 
     # Calculate Day Streak
     history = ReadBy.objects.filter(user=user).order_by('-readed_at').values_list('readed_at', flat=True)
-    read_dates = sorted(list(set(dt.date() for dt in history)), reverse=True)
-    day_streak = 0
-    if read_dates:
-        today = timezone.now().date()
-        curr = today
-        if read_dates[0] == today:
-            pass
-        elif read_dates[0] == today - timezone.timedelta(days=1):
-            curr = today - timezone.timedelta(days=1)
-        else:
-            curr = None
-        
-        if curr:
-            for d in read_dates:
-                if d == curr:
-                    day_streak += 1
-                    curr -= timezone.timedelta(days=1)
-                elif d > curr:
-                    continue
-                else:
-                    break
-                    
+    day_streak = calculate_day_streak(history, timezone.now().date())
+
     # Calculate Reading Tastes (Donut Chart)
     genre_counts = ReadBy.objects.filter(user=user).values('book__genre__name').annotate(count=Count('id')).order_by('-count')
-    total_read = sum(g['count'] for g in genre_counts)
-    
-    reading_tastes = []
-    other_count = 0
-    colors = ['var(--dash-primary)', '#f59e0b', '#3b82f6', '#ef4444', '#8b5cf6']
-    
-    for i, g in enumerate(genre_counts):
-        if i < 3:
-            reading_tastes.append({
-                'label': g['book__genre__name'] or 'Unknown',
-                'count': g['count'],
-                'color': colors[i % len(colors)]
-            })
-        else:
-            other_count += g['count']
-            
-    if other_count > 0:
-        reading_tastes.append({
-            'label': 'Other',
-            'count': other_count,
-            'color': colors[3]
-        })
-        
-    current_percentage = 0
-    gradient_parts = []
-    for item in reading_tastes:
-        percentage = (item['count'] / total_read) * 100 if total_read > 0 else 0
-        item['percentage'] = round(percentage)
-        next_percentage = current_percentage + percentage
-        gradient_parts.append(f"{item['color']} {current_percentage}% {next_percentage}%")
-        current_percentage = next_percentage
-        
-    donut_gradient = ", ".join(gradient_parts) if gradient_parts else "var(--dash-track) 0% 100%"
+    reading_tastes, donut_gradient = calculate_reading_tastes(genre_counts)
 
     # Calculate Reading Activity (Last 7 Days)
     today = timezone.now().date()
@@ -227,12 +226,7 @@ def updateUserBook(request, slug):
     bookcontent, created = BookContent.objects.get_or_create(book=book)
     # Find all unread notifications for THIS user regarding THIS specific book
     book_content_type = ContentType.objects.get_for_model(Book)
-    Notification.objects.filter(
-        recipient=request.user,
-        content_type=book_content_type,
-        object_id=book.id,
-        is_read=False
-    ).update(is_read=True)
+    mark_notifications_read(request.user, content_type=book_content_type, object_id=book.id)
 
     if request.method == "POST":
         book_form = UserBookForm(request.POST, request.FILES, instance=book)
@@ -340,6 +334,7 @@ def publishedBooks(request):
     paginator = Paginator(books_list, 28)
     page_number = request.GET.get('page')
     books = paginator.get_page(page_number)
+    books.object_list = overlay_pending_views(books.object_list)
 
     return render(request, 'published_books.html', {'books': books})
 